@@ -0,0 +1,791 @@
+#!/usr/bin/python3.1
+
+"""Benchmarks for the vec package.
+
+Usage:
+  python3 benchmark.py [name ...]
+runs the named benchmarks (all of them, if none are named)
+and prints their results.
+"""
+
+import sys
+import math
+import time
+import random
+import vec
+from vec import art2polyarea
+from vec import geom
+from vec import halfedge
+from vec import import_vecfile
+from vec import offset
+from vec import polybool
+from vec import triquad
+
+
+def _RandomBeziers(n, seed=1, size=100.0):
+    """Return n random cubic beziers, many of them strongly curved."""
+
+    rnd = random.Random(seed)
+    ans = []
+    for i in range(n):
+        ans.append(tuple([(rnd.uniform(0.0, size), rnd.uniform(0.0, size)) \
+            for j in range(4)]))
+    return ans
+
+
+def _MaxChord(pts):
+    return max([geom.VecLen(geom.VecSub(pts[i + 1], pts[i])) \
+        for i in range(len(pts) - 1)])
+
+
+def _UniformTSegsFor(cps, maxlen):
+    """Smallest number of equal parameter steps giving chords <= maxlen."""
+
+    def chord_ok(n):
+        pts = [art2polyarea._BezierEval(cps, i / float(n)) \
+            for i in range(n + 1)]
+        return _MaxChord(pts) <= maxlen
+
+    hi = 1
+    while not chord_ok(hi):
+        hi *= 2
+    lo = hi // 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if chord_ok(mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def _BestTime(fn, repeat=5):
+    """Return the smallest of repeat timings of calling fn()."""
+
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        fn()
+        t = time.time() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def BenchEvenArcLength():
+    """Vertices needed by EVEN mode for a given maximum segment length.
+
+    Compares sampling equally in the bezier parameter (the old EVEN
+    mode, with the number of pieces raised until no segment is longer
+    than the target) with sampling at equal arc length.
+    """
+
+    beziers = _RandomBeziers(200)
+    opt = art2polyarea.ConvertOptions()
+    opt.subdiv_kind = "EVEN"
+    opt.smoothness = 0
+    print("max seg len   param-t verts   arc-length verts   reduction")
+    for maxlen in [20.0, 10.0, 5.0, 2.0, 1.0]:
+        opt.even_length = maxlen
+        old = 0
+        new = 0
+        for cps in beziers:
+            old += _UniformTSegsFor(cps, maxlen)
+            approx = art2polyarea.Bezier3Approx(cps, opt)
+            assert _MaxChord(approx) <= maxlen * 1.0001
+            new += len(approx) - 1
+        print("%11g   %13d   %16d   %8.1f%%" % (maxlen, old, new,
+            100.0 * (old - new) / old))
+    opt.even_length = 1.0
+    t0 = time.time()
+    for cps in beziers:
+        art2polyarea.Bezier3Approx(cps, opt)
+    t1 = time.time()
+    art2polyarea._BatchBezier3Approx(beziers, opt)
+    t2 = time.time()
+    print("flatten %d beziers at max len 1: %.3fs one at a time, "
+        "%.3fs batched" % (len(beziers), t1 - t0, t2 - t1))
+
+
+def _RandomEllipseSubpaths(n, seed=1, size=100.0):
+    """Return n full-ellipse subpaths, made of 4 arcs as svg makes them."""
+
+    rnd = random.Random(seed)
+    ans = []
+    for i in range(n):
+        (cx, cy) = (rnd.uniform(0.0, size), rnd.uniform(0.0, size))
+        (rx, ry) = (rnd.uniform(1.0, 10.0), rnd.uniform(1.0, 10.0))
+        pts = [(cx + rx, cy), (cx, cy + ry), (cx - rx, cy), (cx, cy - ry)]
+        sp = geom.Subpath()
+        sp.closed = True
+        for j in range(4):
+            sp.AddSegment(("A", pts[j], pts[(j + 1) % 4], (rx, ry), 0.0,
+                False, True))
+        ans.append(sp)
+    return ans
+
+
+def BenchArcs():
+    """Time flattening of many circles and ellipses.
+
+    Compares approximating each arc separately with ArcApprox
+    against FlattenSubpaths, which batches the arcs and uses
+    a unit circle table for full ellipses.
+    """
+
+    subpaths = _RandomEllipseSubpaths(2000)
+    opt = art2polyarea.ConvertOptions()
+    for (kind, smoothness) in [("UNIFORM", 3), ("UNIFORM", 5),
+            ("TOLERANCE", 0)]:
+        opt.subdiv_kind = kind
+        opt.smoothness = smoothness
+        opt.tolerance = 0.01
+        nverts = [0]
+
+        def per_arc():
+            nverts[0] = 0
+            for sp in subpaths:
+                for seg in sp.segments:
+                    nverts[0] += len(art2polyarea.ArcApprox(seg[1], seg[2],
+                        seg[3], seg[4], seg[5], seg[6], opt)) - 1
+        t_arc = _BestTime(per_arc)
+        faces = []
+        t_batch = _BestTime(lambda: faces.append(
+            art2polyarea.FlattenSubpaths(subpaths, opt)))
+        faces = faces[0]
+        assert sum([len(f) for f in faces]) == nverts[0]
+        print("%s smoothness %d: %d ellipses, %d verts: %.3fs per arc, "
+            "%.3fs batched" % (kind, smoothness, len(subpaths), nverts[0],
+            t_arc, t_batch))
+
+
+def _DotsAndRingsPolyAreas(n, seed=1):
+    """Return simple PolyAreas like a compound path of text and dots.
+
+    Half of them are little octagonal dots scattered on a grid;
+    the rest are in pairs of an outer square with a square hole,
+    like letter outlines.
+    """
+
+    rnd = random.Random(seed)
+    points = geom.Points()
+    ans = []
+    side = int((n ** 0.5)) + 1
+
+    def add(pts):
+        ans.append(geom.PolyArea(points, [points.AddPoint(p) for p in pts]))
+
+    for i in range(n):
+        (cx, cy) = (3.0 * (i % side), 3.0 * (i // side))
+        if i % 2 == 0:
+            r = rnd.uniform(0.3, 1.0)
+            add([(cx + r * c, cy + r * s) for (c, s) in
+                [(1, 0), (0.7, 0.7), (0, 1), (-0.7, 0.7), (-1, 0),
+                (-0.7, -0.7), (0, -1), (0.7, -0.7)]])
+        else:
+            add([(cx - 1.0, cy - 1.0), (cx + 1.0, cy - 1.0),
+                (cx + 1.0, cy + 1.0), (cx - 1.0, cy + 1.0)])
+            add([(cx - 0.5, cy - 0.5), (cx + 0.5, cy - 0.5),
+                (cx + 0.5, cy + 0.5), (cx - 0.5, cy + 0.5)])
+    return ans
+
+
+def BenchContainment():
+    """Time finding holes in compound paths with many subpaths."""
+
+    for n in [250, 500, 1000, 2000]:
+        pas = _DotsAndRingsPolyAreas(n)
+        t0 = time.time()
+        ans = art2polyarea.CombineSimplePolyAreas(pas)
+        t1 = time.time()
+        print("%5d subpaths -> %5d polyareas, %5d holes: %.3fs" % (len(pas),
+            len(ans), sum([len(pa.holes) for pa in ans]), t1 - t0))
+
+
+def BenchPolybool():
+    """Time filling (so unioning) many overlapping 16-gons.
+
+    The doubling of sizes should show close to n log n growth.
+    """
+
+    for n in [100, 400, 1600, 6400]:
+        rnd = random.Random(1)
+        points = geom.Points()
+        rings = []
+        side = 3.0 * math.sqrt(n)
+        for i in range(n):
+            (cx, cy) = (rnd.uniform(0.0, side), rnd.uniform(0.0, side))
+            r = rnd.uniform(0.5, 2.0)
+            rings.append([points.AddPoint((cx + r * math.cos(a),
+                cy + r * math.sin(a))) \
+                for a in [2.0 * math.pi * k / 16 for k in range(16)]])
+        t0 = time.time()
+        ans = polybool.FillRings(rings, points)
+        t1 = time.time()
+        print("%5d rings, %6d edges -> %4d polyareas, %4d holes: %.3fs" % (
+            n, 16 * n, len(ans), sum([len(pa.holes) for pa in ans]),
+            t1 - t0))
+
+
+def _CurveRing(points, n, fx, fy):
+    """Return a ring of n vertices at (fx(a), fy(a)), a in [0, 2pi)."""
+
+    ring = []
+    for k in range(n):
+        a = 2.0 * math.pi * k / n
+        ring.append(points.AddPoint((fx(a), fy(a))))
+    return ring
+
+
+def BenchSelfCrossing():
+    """Time splitting self-crossing flattened subpaths into simple rings.
+
+    The figure 8 is like testfiles/figure8.ai (one crossing);
+    the 'overlap' ring is a seven petal rose curve drawn twice over,
+    like the overlapping loops of testfiles/overlap.ai drawn as one
+    subpath, with all the petals crossing near the center; the circle
+    doesn't cross itself, so that only the cost of checking is paid.
+    Also shows the cost of triangulating a figure 8 without
+    splitting it first.
+    """
+
+    for n in [1000, 4000, 16000, 64000]:
+        for (name, fx, fy) in [
+                ("figure 8", lambda a: 100.0 * math.sin(a),
+                    lambda a: 100.0 * math.sin(a) * math.cos(a)),
+                ("overlap", lambda a: 100.0 * math.cos(7.0 * a) * math.cos(a),
+                    lambda a: 100.0 * math.cos(7.0 * a) * math.sin(a)),
+                ("circle", lambda a: 100.0 * math.cos(a),
+                    lambda a: 100.0 * math.sin(a))]:
+            points = geom.Points()
+            ring = _CurveRing(points, n, fx, fy)
+            t0 = time.time()
+            ans = polybool.SimpleRings(ring, points)
+            t1 = time.time()
+            print("%-8s %6d edges -> %3d simple rings, %6d edges: %.3fs" % (
+                name, n, len(ans), sum([len(r) for r in ans]), t1 - t0))
+    n = 200
+    points = geom.Points()
+    ring = _CurveRing(points, n, lambda a: 100.0 * math.sin(a),
+        lambda a: 100.0 * math.sin(a) * math.cos(a))
+    t0 = time.time()
+    triquad.TriangulateFace(ring, points)
+    t1 = time.time()
+    for r in polybool.SimpleRings(ring, points):
+        triquad.TriangulateFace(r, points)
+    t2 = time.time()
+    print("triangulate %d edge figure 8: %.3fs as is, %.3fs split" % (n,
+        t1 - t0, t2 - t1))
+
+
+def _CircleSubpath(cx, cy, r):
+    """Return a closed subpath approximating a circle by 4 beziers."""
+
+    k = 0.5523 * r
+    pts = [(cx + r, cy), (cx, cy + r), (cx - r, cy), (cx, cy - r)]
+    ctl = [((cx + r, cy + k), (cx + k, cy + r)),
+        ((cx - k, cy + r), (cx - r, cy + k)),
+        ((cx - r, cy - k), (cx - k, cy - r)),
+        ((cx + k, cy - r), (cx + r, cy - k))]
+    sp = geom.Subpath()
+    sp.closed = True
+    for j in range(4):
+        sp.AddSegment(("B", pts[j], pts[(j + 1) % 4], ctl[j][0], ctl[j][1]))
+    return sp
+
+
+def _LayeredPoster(nlayers, ndots, seed=1, size=100.0):
+    """Return Art like a poster built up in layers.
+
+    Each layer is a scattering of dots (one path each), and then
+    a few opaque panels painted over parts of what is there so far.
+    """
+
+    rnd = random.Random(seed)
+    art = geom.Art()
+    for layer in range(nlayers):
+        for i in range(ndots):
+            path = geom.Path()
+            path.AddSubpath(_CircleSubpath(rnd.uniform(0.0, size),
+                rnd.uniform(0.0, size), rnd.uniform(0.5, 2.0)))
+            path.filled = True
+            path.fillpaint = geom.Paint(rnd.random(), rnd.random(), 0.5)
+            art.paths.append(path)
+        for i in range(3):
+            (x, y) = (rnd.uniform(0.0, size * 0.6), rnd.uniform(0.0, size * 0.6))
+            (w, h) = (rnd.uniform(size * 0.2, size * 0.4),
+                rnd.uniform(size * 0.2, size * 0.4))
+            path = geom.Path()
+            sp = geom.Subpath()
+            sp.closed = True
+            corners = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+            for j in range(4):
+                sp.AddSegment(("L", corners[j], corners[(j + 1) % 4]))
+            path.AddSubpath(sp)
+            path.filled = True
+            path.fillpaint = geom.Paint(0.2, 0.2, rnd.random())
+            art.paths.append(path)
+    return art
+
+
+def BenchOcclusion():
+    """Time importing layered art, with and without dropping hidden areas.
+
+    Times the whole conversion to a (triangulated and extruded) Model.
+    """
+
+    for (nlayers, ndots) in [(4, 100), (8, 200), (8, 400)]:
+        art = _LayeredPoster(nlayers, ndots)
+        for occlusion in ["NONE", "CULL", "CLIP"]:
+            options = import_vecfile.ImportOptions()
+            options.convert_options.smoothness = 2
+            options.convert_options.occlusion = occlusion
+            options.extrude_depth = 0.5
+            stats = art2polyarea.ConvertStats()
+            t0 = time.time()
+            (m, msg) = import_vecfile.ArtToModel(art, options, stats)
+            t1 = time.time()
+            print("%2d layers of %3d dots, %s: %4d areas (%4d hidden, "
+                "%3d clipped), %5d verts, %6d faces: %.3fs" % (nlayers,
+                ndots, occlusion, stats.polyareas, stats.hidden_polyareas,
+                stats.clipped_polyareas, stats.verts, len(m.faces), t1 - t0))
+
+
+def _GlyphText(nglyphs, seed=1):
+    """Return Art like a page of text: a few glyph shapes, repeated.
+
+    Each glyph is a closed subpath of beziers, and a half-disc
+    made of an arc and a line.
+    """
+
+    rnd = random.Random(seed)
+    shapes = []
+    for g in range(26):
+        shapes.append(_RandomBeziers(6, seed=g + seed, size=1.0))
+    art = geom.Art()
+    for i in range(nglyphs):
+        (x, y) = ((i % 80) * 1.2, (i // 80) * 2.0)
+        path = geom.Path()
+        sp = geom.Subpath()
+        sp.closed = True
+        bezs = shapes[rnd.randrange(len(shapes))]
+        for j, (a, c, d, b) in enumerate(bezs):
+            start = (x + a[0], y + a[1]) if j == 0 else prev
+            end = (x + bezs[0][0][0], y + bezs[0][0][1]) \
+                if j == len(bezs) - 1 else (x + b[0], y + b[1])
+            sp.AddSegment(("B", start, end, (x + c[0], y + c[1]),
+                (x + d[0], y + d[1])))
+            prev = end
+        path.AddSubpath(sp)
+        dot = geom.Subpath()
+        dot.closed = True
+        dot.AddSegment(("A", (x + 0.5, y + 1.5), (x + 0.7, y + 1.5),
+            (0.1, 0.1), 0.0, False, True))
+        dot.AddSegment(("L", (x + 0.7, y + 1.5), (x + 0.5, y + 1.5)))
+        path.AddSubpath(dot)
+        path.filled = True
+        art.paths.append(path)
+    return art
+
+
+def BenchFlattenCache():
+    """Time flattening repeated glyphs, with and without the cache.
+
+    Without the cache is timed by batch flattening all the beziers
+    and arcs directly; with it, by FlattenSubpaths starting with an
+    empty cache, and then again with the cache filled.
+    """
+
+    art = _GlyphText(4000)
+    subpaths = [sp for p in art.paths for sp in p.subpaths]
+    cpslist = [(seg[1], seg[3], seg[4], seg[2]) \
+        for sp in subpaths for seg in sp.segments if seg[0] == "B"]
+    arcsegs = [seg for sp in subpaths for seg in sp.segments \
+        if seg[0] == "A"]
+    for kind in ["UNIFORM", "ADAPTIVE", "EVEN", "TOLERANCE"]:
+        options = art2polyarea.ConvertOptions()
+        options.subdiv_kind = kind
+        options.smoothness = 3
+        options.tolerance = 0.001
+        if kind == "EVEN":
+            art2polyarea._SetEvenLength(options, art.paths)
+        t0 = time.time()
+        art2polyarea._BatchBezier3Approx(cpslist, options)
+        art2polyarea._BatchArcApprox(list(zip(arcsegs,
+            art2polyarea._ArcCenterParamsList(arcsegs))), options)
+        t1 = time.time()
+        saved = art2polyarea._flatten_cache
+        art2polyarea._flatten_cache = art2polyarea._FlattenCache(
+            art2polyarea._FLATTEN_CACHE_SIZE)
+        stats = art2polyarea.ConvertStats()
+        art2polyarea.FlattenSubpaths(subpaths, options, stats)
+        t2 = time.time()
+        art2polyarea.FlattenSubpaths(subpaths, options)
+        t3 = time.time()
+        art2polyarea._flatten_cache = saved
+        print("%-9s %5d segments: no cache %.3fs, empty cache %.3fs "
+            "(hit rate %.3f), filled cache %.3fs" % (kind,
+            len(cpslist) + len(arcsegs), t1 - t0, t2 - t1,
+            stats.flatten_cache_hits / float(stats.flatten_cache_hits +
+            stats.flatten_cache_misses), t3 - t2))
+
+
+def BenchSimplify():
+    """Time converting dots and panels with EVEN subdivision, simplified.
+
+    Times the conversion to PolyAreas and then their triangulation,
+    and checks that the simplified rings are still simple.
+    """
+
+    art = _LayeredPoster(2, 200)
+    for tol in [0.0, 0.001, 0.01, 0.03]:
+        options = art2polyarea.ConvertOptions()
+        options.subdiv_kind = "EVEN"
+        options.smoothness = 100
+        options.simplify_tolerance = tol
+        stats = art2polyarea.ConvertStats()
+        t0 = time.time()
+        pas = art2polyarea.ArtToPolyAreas(art, options, stats)
+        t1 = time.time()
+        ntris = 0
+        for pa in pas.polyareas:
+            ntris += len(triquad.TriangulateFaceWithHoles(pa.poly, pa.holes,
+                pas.points))
+        t2 = time.time()
+        crossed = 0
+        for pa in pas.polyareas:
+            for ring in [pa.poly] + pa.holes:
+                if polybool.SimpleRings(ring, pas.points) != [ring]:
+                    crossed += 1
+        print("tolerance %.3f: %5d verts (%5d removed), %5d triangles, "
+            "%d crossed rings: convert %.3fs, triangulate %.3fs" % (tol,
+            stats.verts, stats.simplified_verts, ntris, crossed, t1 - t0,
+            t2 - t1))
+
+
+def BenchParallel():
+    """Time converting layered art in 1, 2 and 4 processes.
+
+    Uses fill rules, so each path goes through polybool,
+    and checks that the answers are the same.
+    """
+
+    art = _LayeredPoster(8, 400)
+    serial = None
+    for processes in [1, 2, 4]:
+        options = art2polyarea.ConvertOptions()
+        options.smoothness = 3
+        options.use_fill_rules = True
+        options.processes = processes
+        t0 = time.time()
+        pas = art2polyarea.ArtToPolyAreas(art, options)
+        t1 = time.time()
+        polys = [(pa.poly, pa.holes) for pa in pas.polyareas]
+        if serial is None:
+            serial = (pas.points.pos, polys)
+        same = (pas.points.pos, polys) == serial
+        print("%d processes: %d areas, %d points, same %s: %.3fs" % (
+            processes, len(pas.polyareas), len(pas.points.pos), same,
+            t1 - t0))
+
+
+def _StarRing(points, n, seed=1, r=100.0):
+    """Add n points of a random star to points; return the ring."""
+
+    rand = random.Random(seed)
+    ring = []
+    for i in range(n):
+        a = 2.0 * math.pi * i / n
+        d = r * (1.0 + 0.5 * rand.random())
+        ring.append(points.AddPoint((d * math.cos(a), d * math.sin(a))))
+    return ring
+
+
+def BenchTriangulate():
+    """Time triangulating star polygons with each triquad algorithm.
+
+    Ear chopping is quadratic, so is only timed on the smaller stars.
+    """
+
+    for n in [500, 2000, 10000, 50000]:
+        points = geom.Points()
+        ring = _StarRing(points, n)
+        for algorithm in ["SWEEP", "EARCHOP"]:
+            if algorithm == "EARCHOP" and n > 2000:
+                continue
+            t0 = time.time()
+            tris = triquad.TriangulateFace(ring, points, algorithm)
+            t1 = time.time()
+            print("%5d verts, %s: %d triangles: %.3fs" % (n, algorithm,
+                len(tris), t1 - t0))
+
+
+def _WavyRing(points, n, seed=1, r=100.0):
+    """Add n points of a wavy, slightly noisy circle (something
+    like a coastline) to points; return the ring."""
+
+    rand = random.Random(seed)
+    ring = []
+    for i in range(n):
+        a = 2.0 * math.pi * i / n
+        d = r * (1.0 + 0.1 * math.sin(37.0 * a) +
+            0.05 * math.sin(301.0 * a) + 0.002 * rand.random())
+        ring.append(points.AddPoint((d * math.cos(a), d * math.sin(a))))
+    return ring
+
+
+def BenchEarChop():
+    """Time ear chopping wavy polygons, linked and array-based.
+
+    The array-based chopper (triquad._ChopEars) is quadratic or
+    worse, so is only timed on the smaller polygons.
+    """
+
+    for n in [100, 1000, 10000, 100000]:
+        points = geom.Points()
+        ring = _WavyRing(points, n)
+        for (name, fn) in [("linked", triquad.EarChopTriFace),
+                ("array", triquad._ChopEars)]:
+            if name == "array" and n > 1000:
+                continue
+            t0 = time.time()
+            tris = fn(ring, points)
+            t1 = time.time()
+            print("%6d verts, %s: %d triangles: %.3fs" % (n, name,
+                len(tris), t1 - t0))
+
+
+def _PanelFace(points, k, seed=1):
+    """Add a square of side k with a k by k array of jittered
+    hexagonal holes to points; return (face, holes)."""
+
+    rand = random.Random(seed)
+    face = [points.AddPoint(p) for p in [(0.0, 0.0), (k, 0.0), (k, k),
+        (0.0, k)]]
+    holes = []
+    for i in range(k):
+        for j in range(k):
+            cx = i + 0.5 + 0.3 * (rand.random() - 0.5)
+            cy = j + 0.5 + 0.3 * (rand.random() - 0.5)
+            holes.append([points.AddPoint((cx + 0.25 * math.cos(-a),
+                cy + 0.25 * math.sin(-a)))
+                for a in [2.0 * math.pi * t / 6 for t in range(6)]])
+    return (face, holes)
+
+
+def BenchJoinIslands():
+    """Time joining the holes of perforated panels into their faces.
+
+    The unindexed joining (one triquad._JoinIsland at a time) is
+    only timed on the smaller panels.
+    """
+
+    for k in [5, 10, 20, 40, 80]:
+        points = geom.Points()
+        (face, holes) = _PanelFace(points, k)
+        holes = [triquad._SortFace(h, points) for h in holes]
+        t0 = time.time()
+        joined = triquad._JoinIslands(face, holes, points)
+        t1 = time.time()
+        line = "%5d holes: indexed %.3fs" % (len(holes), t1 - t0)
+        if k <= 10:
+            t0 = time.time()
+            slow = face
+            for hole in sorted(holes, key=lambda h: points.pos[h[0]]):
+                slow = triquad._JoinIsland(slow, hole, points)
+            t1 = time.time()
+            line += ", unindexed %.3fs, same %s" % (t1 - t0, slow == joined)
+        print(line)
+
+
+def BenchQuadMatch():
+    """Time matching triangles into quads, on faces with and without
+    holes, and show the total weight of the matched edges."""
+
+    cases = []
+    for n in [1000, 10000]:
+        points = geom.Points()
+        cases.append(("%5d-vert wavy face" % n, _WavyRing(points, n), [],
+            points))
+    for k in [5, 10, 20]:
+        points = geom.Points()
+        (face, holes) = _PanelFace(points, k)
+        cases.append(("%5d-hole panel" % (k * k), face, holes, points))
+    for (name, face, holes, points) in cases:
+        mesh = triquad._TriangulateRings(face, holes, points, None)
+        er = triquad._ERGraph(mesh, points)
+        t0 = time.time()
+        match = triquad._MaxMatch(er)
+        t1 = time.time()
+        print("%s: %d triangles, %d quads, weight %.0f: %.3fs" % (name,
+            len(mesh.fedge), len(match), sum([q[0] for q in match]), t1 - t0))
+
+
+def BenchTriQuadBatch():
+    """Time finding the initially reversed edges and the quad
+    weights of ear-chopped wavy faces, edge by edge and with the
+    numpy batch kernels (if numpy is available)."""
+
+    for n in [2000, 20000]:
+        points = geom.Points()
+        ring = _WavyRing(points, n)
+        tris = triquad.EarChopTriFace(ring, points)
+        mesh = halfedge.HalfEdgeMesh(tris, triquad._BorderEdges([ring]))
+        for (name, np) in [("single", None), ("numpy", triquad.numpy)]:
+            if name == "numpy" and np is None:
+                continue
+            saved = triquad.numpy
+            triquad.numpy = np
+            t0 = time.time()
+            re = triquad._ReveresedEdges(mesh, points)
+            t1 = time.time()
+            er = triquad._ERGraph(mesh, points)
+            t2 = time.time()
+            triquad.numpy = saved
+            print("%5d triangles, %s: %d reversed: %.3fs,"
+                " %d er edges: %.3fs" % (len(tris), name, len(re), t1 - t0,
+                len(er), t2 - t1))
+
+
+def BenchConvexFaces():
+    """Time quadrangulating many convex faces (rectangles and
+    ellipses), with the convex fast path and through the general
+    triangulate-and-match machinery."""
+
+    points = geom.Points()
+    faces = []
+    for i in range(2000):
+        (x, y) = (10.0 * (i % 50), 10.0 * (i // 50))
+        if i % 2 == 0:
+            faces.append([points.AddPoint((x + dx, y + dy))
+                for (dx, dy) in [(0.0, 0.0), (8.0, 0.0), (8.0, 3.0),
+                (0.0, 3.0)]])
+        else:
+            faces.append(_CurveRing(points, 32,
+                lambda a, x=x: x + 4.0 + 4.0 * math.cos(a),
+                lambda a, y=y: y + 2.0 + 2.0 * math.sin(a)))
+    stats = triquad.TriQuadStats()
+    t0 = time.time()
+    fast = sum([len(triquad.QuadrangulateFace(f, points, stats=stats))
+        for f in faces])
+    t1 = time.time()
+    slow = sum([len(triquad._Quandrangulate(
+        triquad._TriangulateRings(f, [], points, None), points))
+        for f in faces])
+    t2 = time.time()
+    print("%d faces, %d convex, %d single quads: fast path %d faces %.3fs,"
+        " general %d faces %.3fs" % (len(faces), stats.convex_faces,
+        stats.single_quads, fast, t1 - t0, slow, t2 - t1))
+
+
+def BenchTriQuadCache():
+    """Time quadrangulating a grid of translated copies of a wavy
+    face with a hole (like a page of one repeated letter), with
+    and without the triquad cache."""
+
+    glyph = geom.Points()
+    ring = _WavyRing(glyph, 200, r=10.0)
+    hole = [glyph.AddPoint((3.0 * math.cos(-a), 3.0 * math.sin(-a)))
+        for a in [2.0 * math.pi * t / 12 for t in range(12)]]
+    points = geom.Points()
+    copies = []
+    for i in range(400):
+        (dx, dy) = (25.0 * (i % 20), 25.0 * (i // 20))
+        base = len(points.pos)
+        points.pos.extend([(x + dx, y + dy) for (x, y) in glyph.pos])
+        copies.append(([base + v for v in ring], [[base + v for v in hole]]))
+    saved = triquad.CACHE_SIZE
+    for size in [0, saved]:
+        triquad.CACHE_SIZE = size
+        triquad.ClearCache()
+        stats = triquad.TriQuadStats()
+        t0 = time.time()
+        nfaces = sum([len(triquad.QuadrangulateFaceWithHoles(f, h, points,
+            stats=stats)) for (f, h) in copies])
+        t1 = time.time()
+        print("cache size %d: %d copies -> %d faces, %d hits, %d misses,"
+            " %d cached ints: %.3fs" % (size, len(copies), nfaces,
+            stats.cache_hits, stats.cache_misses, triquad.CacheInfo()[1],
+            t1 - t0))
+    triquad.CACHE_SIZE = saved
+
+
+def BenchQuadrangulateMany():
+    """Time quadrangulating many different wavy faces in 1, 2 and 4
+    processes, and check that the answers are the same."""
+
+    points = geom.Points()
+    faces = [(_WavyRing(points, 1000, seed), []) for seed in range(64)]
+    serial = None
+    for workers in [1, 2, 4]:
+        triquad.ClearCache()
+        t0 = time.time()
+        ans = triquad.QuadrangulateMany(faces, points, workers=workers)
+        t1 = time.time()
+        if serial is None:
+            serial = ans
+        print("%d workers: %d faces -> %d faces, same %s: %.3fs" % (
+            workers, len(faces), sum([len(a) for a in ans]), ans == serial,
+            t1 - t0))
+
+
+def BenchOffset():
+    """Time building offsets (bevel insets) of wavy rings, where
+    the inner Offsets nest hundreds deep (for 200 vertices)."""
+
+    for n in [100, 200, 400]:
+        rand = random.Random(1)
+        pts = []
+        for i in range(n):
+            a = 2.0 * math.pi * i / n
+            r = 1.0 + 0.1 * math.sin(37.0 * a) + \
+                0.05 * math.sin(11.0 * a) + 0.01 * rand.random()
+            pts.append((r * math.cos(a), r * math.sin(a), 0.0))
+        pa = geom.PolyArea(geom.Points(pts), list(range(n)))
+        o = offset.Offset(pa, 0.0, 0.5)
+        t0 = time.time()
+        o.Build(0.08)
+        t1 = time.time()
+        (count, depth) = (0, 0)
+        stack = [(o, 1)]
+        while stack:
+            (oo, d) = stack.pop()
+            count += 1
+            depth = max(depth, d)
+            stack.extend([(inner, d + 1) for inner in oo.inneroffsets])
+        print("%4d vertices: %d offsets, nested %d deep: %.3fs" % (
+            n, count, depth, t1 - t0))
+
+
+BENCHMARKS = [
+    ("even_arclength", BenchEvenArcLength),
+    ("arcs", BenchArcs),
+    ("containment", BenchContainment),
+    ("polybool", BenchPolybool),
+    ("selfcrossing", BenchSelfCrossing),
+    ("occlusion", BenchOcclusion),
+    ("flatten_cache", BenchFlattenCache),
+    ("simplify", BenchSimplify),
+    ("parallel", BenchParallel),
+    ("triangulate", BenchTriangulate),
+    ("earchop", BenchEarChop),
+    ("joinislands", BenchJoinIslands),
+    ("quadmatch", BenchQuadMatch),
+    ("triquad_batch", BenchTriQuadBatch),
+    ("convex_faces", BenchConvexFaces),
+    ("triquad_cache", BenchTriQuadCache),
+    ("quadrangulate_many", BenchQuadrangulateMany),
+    ("offset", BenchOffset),
+    ]
+
+
+def main(names):
+    for (name, fn) in BENCHMARKS:
+        if names and name not in names:
+            continue
+        print("== " + name)
+        fn()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,6 +3,7 @@
 """Unit tests for art2polyarea module."""
 
 import unittest
+import math
 import vec
 from vec import art2polyarea
 from vec import geom
@@ -44,6 +45,30 @@ class TestBezier3Approx(unittest.TestCase):
         self.assertAlmostEqual(ans[1][1], 0.84375)
 
 
+class TestBatchBezier3Approx(unittest.TestCase):
+
+    def runTest(self):
+        cpslist = [((0.0, 0.0), (1.0, 1.0), (2.0, 3.0), (3.0, 0.0)),
+            ((3.0, 0.0), (4.0, -2.0), (6.0, 1.0), (5.0, 5.0)),
+            ((5.0, 5.0), (5.0, 5.0), (5.0, 5.0), (5.0, 5.0))]
+        opt = art2polyarea.ConvertOptions()
+        for kind in ["UNIFORM", "EVEN", "ADAPTIVE"]:
+            opt.subdiv_kind = kind
+            for smoothness in range(4):
+                opt.smoothness = smoothness
+                opt.even_length = 6.0 / (4.0 * (smoothness + 1))
+                ans = art2polyarea._BatchBezier3Approx(cpslist, opt)
+                self.assertEqual(len(ans), 3)
+                for cps, approx in zip(cpslist, ans):
+                    single = art2polyarea.Bezier3Approx(list(cps), opt)
+                    self.assertEqual(len(approx), len(single))
+                    self.assertEqual(approx[0], cps[0])
+                    self.assertEqual(approx[-1], cps[3])
+                    for p, q in zip(approx, single):
+                        self.assertAlmostEqual(p[0], q[0])
+                        self.assertAlmostEqual(p[1], q[1])
+
+
 class TestCombineSimplePolyAreas(unittest.TestCase):
 
     def runTest(self):
@@ -75,6 +100,32 @@ class TestCombineSimplePolyAreas(unittest.TestCase):
         self.assertEqual(a2.holes, [])
 
 
+class TestContainmentForest(unittest.TestCase):
+
+    def runTest(self):
+        # nested squares: 0 contains 1 contains 2 contains 3,
+        # 4 is inside 1 next to 2, and 5 is off on its own
+        squares = [(0.0, 10.0), (1.0, 9.0), (2.0, 5.0), (3.0, 4.0),
+            (6.0, 8.0), (20.0, 21.0)]
+        points = geom.Points()
+        pas = []
+        for (lo, hi) in squares:
+            poly = [points.AddPoint(p) for p in [(lo, lo), (hi, lo),
+                (hi, hi), (lo, hi)]]
+            pas.append(geom.PolyArea(points, poly))
+        (parent, children) = art2polyarea.ContainmentForest(pas)
+        self.assertEqual(parent, [None, 0, 1, 2, 1, None])
+        self.assertEqual(children, [[1], [2, 4], [3], [], [], []])
+        ans = art2polyarea.CombineSimplePolyAreas(pas)
+        self.assertEqual(len(ans), 4)
+        self.assertEqual([pa.poly for pa in ans],
+            [pas[i].poly for i in [0, 2, 4, 5]])
+        # holes are reversed to be CW
+        self.assertEqual(ans[0].holes, [pas[1].poly[::-1]])
+        self.assertEqual(ans[1].holes, [pas[3].poly[::-1]])
+        self.assertEqual(ans[2].holes, [])
+
+
 # make a closed polygon Subpath from a list of coordinates
 def _MakePolySubpath(p):
     subpath = geom.Subpath()
@@ -168,17 +219,204 @@ class TestEvenApprox(unittest.TestCase):
         opt = art2polyarea.ConvertOptions()
         opt.subdiv_kind = "EVEN"
         opt.smoothness = 0
+        # even_length is 0.5, 0.25, 0.1667 for smoothness 0, 1, 2;
+        # each quarter circle has arc length pi/2, the line length 2
         art2polyarea._SetEvenLength(opt, [path])
         pa = art2polyarea._SubpathToPolyArea(subpath, opt, geom.Points())
-        self.assertEqual(len(pa.poly), 10)
+        self.assertEqual(len(pa.poly), 12)
         opt.smoothness = 1
         art2polyarea._SetEvenLength(opt, [path])
         pa = art2polyarea._SubpathToPolyArea(subpath, opt, geom.Points())
-        self.assertEqual(len(pa.poly), 18)
+        self.assertEqual(len(pa.poly), 22)
         opt.smoothness = 2
         art2polyarea._SetEvenLength(opt, [path])
         pa = art2polyarea._SubpathToPolyArea(subpath, opt, geom.Points())
-        self.assertEqual(len(pa.poly), 26)
+        self.assertEqual(len(pa.poly), 32)
+        # a strongly curved bezier should still get equal spacing
+        cps = [(0.0, 0.0), (10.0, 0.0), (-9.0, 1.0), (1.0, 1.0)]
+        table = art2polyarea._Bezier3ArcLengthTable(cps)
+        self.assertAlmostEqual(table[-1], 11.1377076, 5)
+        opt.even_length = 0.5
+        ans = art2polyarea.Bezier3Approx(cps, opt)
+        self.assertEqual(len(ans), 24)
+        piece = table[-1] / 23
+        for i in range(23):
+            t = art2polyarea._Bezier3ArcLengthParam(cps, table, i * piece)
+            tnext = art2polyarea._Bezier3ArcLengthParam(cps, table,
+                (i + 1) * piece)
+            # measure the arc length of the piece with a fine polyline
+            length = 0.0
+            prev = art2polyarea._BezierEval(cps, t)
+            for k in range(1, 201):
+                pt = art2polyarea._BezierEval(cps, t + (tnext - t) * k / 200)
+                length += geom.VecLen(geom.VecSub(pt, prev))
+                prev = pt
+            self.assertAlmostEqual(length, piece, 3)
+            self.assertLessEqual(geom.VecLen(geom.VecSub(ans[i + 1], ans[i])),
+                0.5)
+        batch = art2polyarea._BatchBezier3Approx([cps], opt)[0]
+        self.assertEqual(len(batch), len(ans))
+        for p, q in zip(batch, ans):
+            self.assertAlmostEqual(p[0], q[0])
+            self.assertAlmostEqual(p[1], q[1])
+
+
+class TestToleranceApprox(unittest.TestCase):
+
+    def runTest(self):
+        m = 0.551784  # magic number for circle approx by 4 beziers
+        cps = [(0.0, 0.0), (m, 0.0), (1.0, 1.0 - m), (1.0, 1.0)]
+        opt = art2polyarea.ConvertOptions()
+        opt.subdiv_kind = "TOLERANCE"
+        prevlen = 0
+        for tol in [0.1, 0.01, 0.001, 0.0001]:
+            opt.tolerance = tol
+            ans = art2polyarea.Bezier3Approx(cps, opt)
+            n = len(ans) - 1
+            self.assertEqual(n,
+                art2polyarea._ToleranceBezier3NumSegs(cps, tol))
+            self.assertGreater(len(ans), prevlen)
+            prevlen = len(ans)
+            self.assertEqual(ans[0], cps[0])
+            self.assertEqual(ans[-1], cps[3])
+            # each piece must stay within tol of the curve
+            for i in range(n):
+                for k in range(1, 4):
+                    t = (i + k / 4.0) / n
+                    pt = art2polyarea._BezierEval(cps, t)
+                    lin = art2polyarea._LinInterp(ans[i], ans[i + 1],
+                        k / 4.0)
+                    self.assertLessEqual(geom.VecLen(geom.VecSub(pt, lin)),
+                        tol)
+            batch = art2polyarea._BatchBezier3Approx([cps], opt)[0]
+            self.assertEqual(len(batch), len(ans))
+            for p, q in zip(batch, ans):
+                self.assertAlmostEqual(p[0], q[0])
+                self.assertAlmostEqual(p[1], q[1])
+        opt.tolerance = 0.001
+        ans = art2polyarea.ArcApprox((1.0, 0.0), (0.0, 1.0), (1.0, 1.0), 0.0,
+            False, True, opt)
+        n = len(ans) - 1
+        self.assertEqual(n, 18)
+        for i in range(n):
+            mid = art2polyarea._LinInterp(ans[i], ans[i + 1], 0.5)
+            self.assertLessEqual(1.0 - geom.VecLen(mid), 0.001)
+
+
+class TestBatchArcApprox(unittest.TestCase):
+
+    def runTest(self):
+        opt = art2polyarea.ConvertOptions()
+        segs = [("A", (1.0, 0.0), (0.0, 1.0), (1.0, 1.0), 0.0, False, True),
+            ("A", (1.0, 0.0), (0.0, 1.0), (1.0, 1.0), 0.0, True, False),
+            ("A", (2.0, 1.0), (5.0, 3.0), (2.0, 1.0), 30.0, False, False),
+            ("A", (0.0, 0.0), (4.0, 0.0), (1.0, 1.0), 0.0, False, True),
+            ("A", (0.0, 0.0), (4.0, 0.0), (0.0, 1.0), 0.0, False, True),
+            ("A", (3.0, 3.0), (3.0, 3.0), (1.0, 1.0), 0.0, False, True)]
+        params = art2polyarea._ArcCenterParamsList(segs)
+        for kind in ["UNIFORM", "EVEN", "TOLERANCE"]:
+            opt.subdiv_kind = kind
+            opt.even_length = 0.3
+            batch = art2polyarea._BatchArcApprox(list(zip(segs, params)),
+                opt)
+            for seg, ans in zip(segs, batch):
+                single = art2polyarea.ArcApprox(*(seg[1:] + (opt,)))
+                self.assertEqual(len(ans), len(single))
+                for p, q in zip(ans, single):
+                    self.assertAlmostEqual(p[0], q[0])
+                    self.assertAlmostEqual(p[1], q[1])
+        # clockwise arcs get divided in EVEN mode too
+        opt.subdiv_kind = "EVEN"
+        self.assertEqual(len(art2polyarea.ArcApprox(*(segs[1][1:] + (opt,)))),
+            17)
+
+
+class TestFullEllipseApprox(unittest.TestCase):
+
+    def runTest(self):
+        (cx, cy, rx, ry) = (2.0, 1.0, 3.0, 1.5)
+        quad = [(cx + rx, cy), (cx, cy + ry), (cx - rx, cy), (cx, cy - ry)]
+        for ccw in [True, False]:
+            sp = geom.Subpath()
+            sp.closed = True
+            pts = quad if ccw else [quad[0]] + quad[:0:-1]
+            for i in range(4):
+                sp.AddSegment(("A", pts[i], pts[(i + 1) % 4], (rx, ry),
+                    0.0, False, ccw))
+            for kind in ["UNIFORM", "EVEN", "TOLERANCE"]:
+                opt = art2polyarea.ConvertOptions()
+                opt.subdiv_kind = kind
+                opt.even_length = 0.5
+                face = art2polyarea.FlattenSubpaths([sp], opt)[0]
+                # same as approximating the four arcs separately
+                sep = [pts[0]]
+                for seg in sp.segments:
+                    sep.extend(art2polyarea.ArcApprox(*(seg[1:] +
+                        (opt,)))[1:])
+                self.assertEqual(len(face), len(sep) - 1)
+                for p, q in zip(face, sep):
+                    self.assertAlmostEqual(p[0], q[0])
+                    self.assertAlmostEqual(p[1], q[1])
+        # unequal arcs are approximated separately, keeping the joints
+        sp2 = geom.Subpath()
+        sp2.closed = True
+        joint = (0.5, math.sqrt(3.0) / 2.0)
+        sp2.AddSegment(("A", (1.0, 0.0), joint, (1.0, 1.0), 0.0, False, True))
+        sp2.AddSegment(("A", joint, (1.0, 0.0), (1.0, 1.0), 0.0, True, True))
+        opt = art2polyarea.ConvertOptions()
+        params = art2polyarea._ArcCenterParamsList(sp2.segments)
+        self.assertEqual(art2polyarea._FullEllipseParams(sp2, params, opt),
+            None)
+        face = art2polyarea.FlattenSubpaths([sp2], opt)[0]
+        sep = [(1.0, 0.0)]
+        for seg in sp2.segments:
+            sep.extend(art2polyarea.ArcApprox(*(seg[1:] + (opt,)))[1:])
+        self.assertEqual(len(face), len(sep))
+        for p, q in zip(face, sep):
+            self.assertAlmostEqual(p[0], q[0])
+            self.assertAlmostEqual(p[1], q[1])
+        self.assertTrue(joint in face)
+        # an open chain of arcs is not a full ellipse
+        sp.closed = False
+        sp.segments.pop()
+        opt = art2polyarea.ConvertOptions()
+        params = art2polyarea._ArcCenterParamsList(sp.segments)
+        self.assertEqual(art2polyarea._FullEllipseParams(sp, params, opt),
+            None)
+
+
+class TestScaledTolerance(unittest.TestCase):
+
+    def runTest(self):
+        m = 0.551784  # magic number for circle approx by 4 beziers
+        counts = []
+        for size in [1.0, 1000.0]:
+            art = geom.Art()
+            path = geom.Path()
+            sp = geom.Subpath()
+            sp.closed = True
+            c = [(size * x, size * y) for (x, y) in [(1.0, 0.0), (1.0, m),
+                (m, 1.0), (0.0, 1.0), (-m, 1.0), (-1.0, m), (-1.0, 0.0),
+                (-1.0, -m), (-m, -1.0), (0.0, -1.0), (m, -1.0), (1.0, -m)]]
+            for i in range(0, 12, 3):
+                sp.AddSegment(("B", c[i], c[(i + 3) % 12], c[i + 1],
+                    c[i + 2]))
+            path.AddSubpath(sp)
+            path.filled = True
+            art.paths.append(path)
+            opt = art2polyarea.ConvertOptions()
+            opt.subdiv_kind = "TOLERANCE"
+            opt.tolerance = 0.01
+            unscaled = art2polyarea.ArtToPolyAreas(art, opt)
+            opt.scaled_side_target = 4.0
+            scaled = art2polyarea.ArtToPolyAreas(art, opt)
+            self.assertEqual(opt.tolerance, 0.01)
+            counts.append((len(unscaled.polyareas[0].poly),
+                len(scaled.polyareas[0].poly)))
+        # unscaled tolerance is in art units, so the big circle needs
+        # many more points; scaled tolerance doesn't depend on size
+        self.assertGreater(counts[1][0], 10 * counts[0][0])
+        self.assertEqual(counts[0][1], counts[1][1])
 
 
 class TestArtToPolyAreas(unittest.TestCase):
@@ -226,5 +464,296 @@ class TestArtToPolyAreas(unittest.TestCase):
         self.assertEqual(pas.polyareas[1].data, (0.0, 1.0, 0.0))
 
 
+
+class TestFillRules(unittest.TestCase):
+
+    def runTest(self):
+        # two nested squares, same direction, and a figure 8
+        art = geom.Art()
+        path = geom.Path()
+        path.AddSubpath(_MakePolySubpath([(0.0, 0.0), (4.0, 0.0),
+            (4.0, 4.0), (0.0, 4.0), (0.0, 0.0)]))
+        path.AddSubpath(_MakePolySubpath([(1.0, 1.0), (3.0, 1.0),
+            (3.0, 3.0), (1.0, 3.0), (1.0, 1.0)]))
+        path.AddSubpath(_MakePolySubpath([(5.0, 0.0), (7.0, 2.0),
+            (7.0, 0.0), (5.0, 2.0), (5.0, 0.0)]))
+        path.filled = True
+        art.paths = [path]
+        opt = art2polyarea.ConvertOptions()
+        # old way: inner square is a hole, figure 8 is split in two
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual([len(pa.holes) for pa in pas.polyareas], [1, 0, 0])
+        opt.use_fill_rules = True
+        path.fillevenodd = False
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual([len(pa.poly) for pa in pas.polyareas], [4, 3, 3])
+        self.assertEqual([len(pa.holes) for pa in pas.polyareas], [0, 0, 0])
+        path.fillevenodd = True
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual([len(pa.holes) for pa in pas.polyareas], [1, 0, 0])
+        for pa in pas.polyareas:
+            self.assertGreater(geom.SignedArea(pa.poly, pas.points), 0.0)
+            self.assertEqual(pa.data, path.fillpaint.color)
+        # overlapping paths get merged when combining paths
+        path2 = geom.Path()
+        path2.AddSubpath(_MakePolySubpath([(3.0, 3.0), (6.0, 3.0),
+            (6.0, 6.0), (3.0, 6.0), (3.0, 3.0)]))
+        path2.filled = True
+        art.paths = [path, path2]
+        opt = art2polyarea.ConvertOptions()
+        opt.combine_paths = True
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual(len(pas.polyareas), 3)
+        self.assertEqual([len(pa.holes) for pa in pas.polyareas], [1, 0, 0])
+        self.assertEqual(len(pas.polyareas[0].poly), 8)
+
+
+class TestSelfCrossing(unittest.TestCase):
+
+    def runTest(self):
+        # a figure 8, and a bow tie crossing around a hole
+        path = geom.Path()
+        path.AddSubpath(_MakePolySubpath([(0.0, 0.0), (2.0, 2.0),
+            (2.0, 0.0), (0.0, 2.0), (0.0, 0.0)]))
+        path.AddSubpath(_MakePolySubpath([(10.0, 0.0), (20.0, 10.0),
+            (20.0, 0.0), (10.0, 10.0), (10.0, 0.0)]))
+        path.AddSubpath(_MakePolySubpath([(11.0, 4.0), (13.0, 4.0),
+            (13.0, 6.0), (11.0, 6.0), (11.0, 4.0)]))
+        path.filled = True
+        opt = art2polyarea.ConvertOptions()
+        points = geom.Points()
+        pas = art2polyarea.PathToPolyAreas(path, opt, points)
+        self.assertEqual(len(pas), 4)
+        self.assertEqual([len(pa.poly) for pa in pas], [3, 3, 3, 3])
+        self.assertEqual([len(pa.holes) for pa in pas], [0, 0, 1, 0])
+        for pa in pas:
+            self.assertGreater(geom.SignedArea(pa.poly, points), 0.0)
+        self.assertAlmostEqual(sum([geom.SignedArea(pa.poly, points) \
+            for pa in pas]), 2.0 + 50.0 - 4.0 + 4.0)
+
+
+def _Rect(x0, y0, x1, y1):
+    return _MakePolySubpath([(x0, y0), (x1, y0), (x1, y1), (x0, y1),
+        (x0, y0)])
+
+
+class TestOcclusion(unittest.TestCase):
+
+    def runTest(self):
+        art = geom.Art()
+        # path1 - completely covered by path3
+        path1 = geom.Path()
+        path1.AddSubpath(_Rect(0.0, 0.0, 2.0, 2.0))
+        # path2 - right half covered by path3
+        path2 = geom.Path()
+        path2.AddSubpath(_Rect(5.0, 0.0, 7.0, 2.0))
+        # path3 - two rectangles, painted last
+        path3 = geom.Path()
+        path3.AddSubpath(_Rect(-1.0, -1.0, 3.0, 3.0))
+        path3.AddSubpath(_Rect(6.0, -1.0, 8.0, 3.0))
+        for p in [path1, path2, path3]:
+            p.filled = True
+        art.paths = [path1, path2, path3]
+        opt = art2polyarea.ConvertOptions()
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(len(pas.polyareas), 4)
+        self.assertEqual((stats.polyareas, stats.verts), (4, 16))
+        self.assertEqual(stats.hidden_polyareas, 0)
+        opt.occlusion = "CULL"
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(len(pas.polyareas), 3)
+        self.assertEqual((stats.polyareas, stats.verts), (3, 12))
+        self.assertEqual(stats.hidden_polyareas, 1)
+        self.assertEqual(stats.clipped_polyareas, 0)
+        self.assertEqual(stats.hidden_verts, 4)
+        self.assertEqual(pas.points.pos[pas.polyareas[0].poly[0]], (5.0, 0.0))
+        opt.occlusion = "CLIP"
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(len(pas.polyareas), 3)
+        self.assertEqual(stats.hidden_polyareas, 1)
+        self.assertEqual(stats.clipped_polyareas, 1)
+        pa = pas.polyareas[0]
+        self.assertEqual(sorted([pas.points.pos[v] for v in pa.poly]),
+            [(5.0, 0.0), (5.0, 2.0), (6.0, 0.0), (6.0, 2.0)])
+        self.assertEqual(pa.data, path2.fillpaint.color)
+        # paths that are only stroked don't hide anything
+        path3.filled = False
+        opt.filled_only = False
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual(len(pas.polyareas), 4)
+
+
+class TestRemoveDuplicates(unittest.TestCase):
+
+    def runTest(self):
+        art = geom.Art()
+        # path1 - filled square
+        path1 = geom.Path()
+        path1.AddSubpath(_Rect(0.0, 0.0, 2.0, 2.0))
+        path1.filled = True
+        path1.fillpaint = geom.Paint(1.0, 0.0, 0.0)
+        # path2 - stroked copy of path1
+        path2 = geom.Path()
+        path2.AddSubpath(_Rect(0.0, 0.0, 2.0, 2.0))
+        path2.stroked = True
+        # path3 - another square
+        path3 = geom.Path()
+        path3.AddSubpath(_Rect(5.0, 0.0, 7.0, 2.0))
+        path3.filled = True
+        # path4 - filled copy of path1, off by less than DISTTOL
+        path4 = geom.Path()
+        path4.AddSubpath(_Rect(0.0, 0.0001, 2.0, 2.0))
+        path4.filled = True
+        path4.fillpaint = geom.Paint(0.0, 1.0, 0.0)
+        art.paths = [path1, path2, path3, path4]
+        opt = art2polyarea.ConvertOptions()
+        opt.filled_only = False
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(len(pas.polyareas), 2)
+        self.assertEqual(stats.duplicate_paths, 2)
+        self.assertEqual(stats.stroke_duplicate_paths, 1)
+        # the last filled copy is kept, in its place in paint order
+        self.assertEqual(pas.polyareas[1].data, (0.0, 1.0, 0.0))
+        # an even-odd copy is different
+        path4.fillevenodd = True
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(len(pas.polyareas), 3)
+        self.assertEqual(stats.duplicate_paths, 1)
+        self.assertEqual(pas.polyareas[0].data, (1.0, 0.0, 0.0))
+        opt.remove_duplicates = False
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual(len(pas.polyareas), 4)
+
+
+class TestFlattenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = art2polyarea._flatten_cache
+        art2polyarea._flatten_cache = art2polyarea._FlattenCache(3)
+
+    def tearDown(self):
+        art2polyarea._flatten_cache = self.saved
+
+    def runTest(self):
+        def Glyph(x, y):
+            sp = geom.Subpath()
+            sp.AddSegment(("B", (x, y), (x + 3.0, y), (x + 1.0, y + 2.0),
+                (x + 2.0, y + 2.0)))
+            sp.AddSegment(("A", (x + 3.0, y), (x, y), (1.5, 1.0), 0.0,
+                False, True))
+            return sp
+        subpaths = [Glyph(0.0, 0.0), Glyph(10.0, 0.0), Glyph(0.25, 7.5)]
+        opt = art2polyarea.ConvertOptions()
+        opt.smoothness = 2
+        stats = art2polyarea.ConvertStats()
+        faces = art2polyarea.FlattenSubpaths(subpaths, opt, stats)
+        self.assertEqual((stats.flatten_cache_hits,
+            stats.flatten_cache_misses), (4, 2))
+        self.assertEqual(len(art2polyarea._flatten_cache.entries), 2)
+        for (sp, face) in zip(subpaths, faces):
+            seg = sp.segments[0]
+            bez = art2polyarea.Bezier3Approx((seg[1], seg[3], seg[4],
+                seg[2]), opt)
+            seg = sp.segments[1]
+            arc = art2polyarea.ArcApprox(seg[1], seg[2], seg[3], seg[4],
+                seg[5], seg[6], opt)
+            self.assertEqual(len(face), len(bez) + len(arc) - 1)
+            for (p, q) in zip(face, bez + arc[1:]):
+                self.assertAlmostEqual(p[0], q[0])
+                self.assertAlmostEqual(p[1], q[1])
+        # other options don't use the same entries
+        opt.smoothness = 3
+        art2polyarea.FlattenSubpaths(subpaths, opt, stats)
+        self.assertEqual((stats.flatten_cache_hits,
+            stats.flatten_cache_misses), (8, 4))
+        self.assertEqual(stats.flatten_cache_evictions, 1)
+        self.assertEqual(len(art2polyarea._flatten_cache.entries), 3)
+
+
+class TestSimplify(unittest.TestCase):
+
+    def runTest(self):
+        art = geom.Art()
+        # path1 - a square divided up by EVEN subdivision, with a
+        # hole near its bottom edge, which has a slight bump
+        path1 = geom.Path()
+        path1.AddSubpath(_MakePolySubpath([(0.0, 0.0), (1.0, 0.0),
+            (2.0, 0.0), (3.0, -0.04), (4.0, 0.0), (4.0, 4.0), (0.0, 4.0),
+            (0.0, 0.0)]))
+        path1.AddSubpath(_MakePolySubpath([(2.8, -0.01), (3.5, 0.02),
+            (3.0, 1.0), (2.8, -0.01)]))
+        path1.filled = True
+        art.paths = [path1]
+        opt = art2polyarea.ConvertOptions()
+        opt.subdiv_kind = "EVEN"
+        opt.smoothness = 3
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(stats.simplified_verts, 0)
+        nverts = stats.verts
+        opt.simplify_tolerance = 0.1
+        stats = art2polyarea.ConvertStats()
+        pas = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        self.assertEqual(stats.verts + stats.simplified_verts, nverts)
+        self.assertEqual(len(pas.polyareas), 1)
+        pa = pas.polyareas[0]
+        self.assertEqual(len(pa.holes), 1)
+        # the hole vertex at (2.8, -0.01) is inside the bump, so
+        # the bump can't be straightened
+        self.assertEqual(sorted([pas.points.pos[v] for v in pa.poly]),
+            [(0.0, 0.0), (0.0, 4.0), (3.0, -0.04), (4.0, 0.0), (4.0, 4.0)])
+        self.assertEqual(len(pa.holes[0]), 3)
+        # the hole left out, the bump goes too
+        path1.subpaths = path1.subpaths[0:1]
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual(sorted([pas.points.pos[v] for v in
+            pas.polyareas[0].poly]),
+            [(0.0, 0.0), (0.0, 4.0), (4.0, 0.0), (4.0, 4.0)])
+        # tolerance in scaled units: scaled up 100 times, the bump
+        # and (2.0, 0.0) are more than 0.1 from being straight
+        opt.scaled_side_target = 404.0
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual(len(pas.polyareas[0].poly), 6)
+        opt.simplify_tolerance = 10.0
+        pas = art2polyarea.ArtToPolyAreas(art, opt)
+        self.assertEqual(len(pas.polyareas[0].poly), 4)
+
+
+class TestParallel(unittest.TestCase):
+
+    def runTest(self):
+        art = geom.Art()
+        for i in range(12):
+            x = float(i)
+            path = geom.Path()
+            # squares sharing corners with their neighbors,
+            # each with a bowtie hole
+            path.AddSubpath(_Rect(x, 0.0, x + 1.0, 1.0))
+            path.AddSubpath(_MakePolySubpath([(x + 0.2, 0.2),
+                (x + 0.8, 0.8), (x + 0.8, 0.2), (x + 0.2, 0.8),
+                (x + 0.2, 0.2)]))
+            path.filled = True
+            path.fillpaint = geom.Paint(x / 12.0, 0.0, 0.0)
+            art.paths.append(path)
+        opt = art2polyarea.ConvertOptions()
+        opt.simplify_tolerance = 0.01
+        stats = art2polyarea.ConvertStats()
+        serial = art2polyarea.ArtToPolyAreas(art, opt, stats)
+        opt.processes = 2
+        pstats = art2polyarea.ConvertStats()
+        parallel = art2polyarea.ArtToPolyAreas(art, opt, pstats)
+        self.assertEqual(parallel.points.pos, serial.points.pos)
+        self.assertEqual([(pa.poly, pa.holes, pa.data) for pa in
+            parallel.polyareas], [(pa.poly, pa.holes, pa.data) for pa in
+            serial.polyareas])
+        self.assertEqual((pstats.polyareas, pstats.verts),
+            (stats.polyareas, stats.verts))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3.1
+
+import unittest
+import vec
+from vec import halfedge
+
+
+# Two triangles sharing edge 0-2 of the square
+# 3     2
+#
+# 0     1
+Tris = [[0, 1, 2], [0, 2, 3]]
+
+
+class TestHalfEdgeMesh(unittest.TestCase):
+
+    def testBuild(self):
+        m = halfedge.HalfEdgeMesh(Tris)
+        self.assertEqual(len(m.orig), 6)
+        self.assertEqual(m.Faces(), [(0, 1, 2), (0, 2, 3)])
+        h = m.FindHalfEdge(2, 0)
+        t = m.FindHalfEdge(0, 2)
+        self.assertEqual(m.twin[h], t)
+        self.assertEqual(m.twin[t], h)
+        self.assertEqual(m.Edge(h), (2, 0))
+        self.assertEqual(m.Dest(t), 2)
+        self.assertEqual(m.face[h], 0)
+        self.assertEqual(m.face[t], 1)
+        self.assertEqual(m.twin[m.FindHalfEdge(0, 1)], -1)
+        self.assertEqual(m.FindHalfEdge(1, 3), -1)
+        self.assertEqual(m.Degrees(), {0: 2, 1: 1, 2: 2, 3: 1})
+
+    def testFixed(self):
+        m = halfedge.HalfEdgeMesh(Tris, set([(0, 1), (2, 0)]))
+        self.assertTrue(m.fixed[m.FindHalfEdge(0, 1)])
+        self.assertTrue(m.fixed[m.FindHalfEdge(2, 0)])
+        self.assertFalse(m.fixed[m.FindHalfEdge(0, 2)])
+
+    def testVertexStar(self):
+        # closed fan of four triangles around vertex 4, then an open one
+        m = halfedge.HalfEdgeMesh([[0, 1, 4], [1, 2, 4], [2, 3, 4],
+            [3, 0, 4]])
+        star = m.VertexStar(4)
+        self.assertEqual(sorted([m.Dest(h) for h in star]), [0, 1, 2, 3])
+        self.assertEqual([m.Dest(h) for h in m.VertexStar(0)], [4, 1])
+        m = halfedge.HalfEdgeMesh([[0, 1, 4], [1, 2, 4], [2, 3, 4]])
+        self.assertEqual([m.Dest(h) for h in m.VertexStar(4)], [2, 1, 0])
+        self.assertEqual(m.VertexStar(5), [])
+
+    def testFlip(self):
+        m = halfedge.HalfEdgeMesh(Tris)
+        h = m.FindHalfEdge(0, 2)
+        m.Flip(h)
+        # (a, b, c) = (0, 2, 3) and (b, a, d) = (2, 0, 1) become
+        # (c, a, d) and (c, d, b), in the same face numbers
+        self.assertEqual(m.Faces(), [(3, 0, 1), (3, 1, 2)])
+        self.assertEqual(m.Edge(h), (3, 1))
+        self.assertEqual(m.FindHalfEdge(0, 2), -1)
+        self.assertEqual(m.twin[m.FindHalfEdge(1, 3)], h)
+        self.assertEqual(m.Degrees(), {0: 1, 1: 2, 2: 1, 3: 2})
+        for v in range(4):
+            for h in m.VertexStar(v):
+                self.assertEqual(m.orig[h], v)
+
+    def testJoin(self):
+        m = halfedge.HalfEdgeMesh(Tris)
+        f = m.Join(m.FindHalfEdge(0, 2))
+        self.assertEqual(f, 1)
+        self.assertEqual(m.Faces(), [(0, 1, 2, 3)])
+        self.assertEqual(m.fedge[0], -1)
+        self.assertEqual(m.FindHalfEdge(0, 2), -1)
+        self.assertEqual([m.Dest(h) for h in m.VertexStar(0)], [1])
+
+    def testNextBoundary(self):
+        # boundary of two squares sharing an edge goes around both
+        m = halfedge.HalfEdgeMesh([[0, 1, 4, 3], [1, 2, 5, 4]])
+        h = start = m.FindHalfEdge(0, 1)
+        verts = []
+        while True:
+            verts.append(m.orig[h])
+            h = m.NextBoundary(h)
+            if h == start:
+                break
+        self.assertEqual(verts, [0, 1, 2, 5, 4, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
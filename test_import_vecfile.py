@@ -89,5 +89,26 @@ class TestImportWithBevel(unittest.TestCase):
             showfaces.ShowFaces(m.faces, m.points, "Bevel 3dout")
 
 
+class TestArtToModel(unittest.TestCase):
+
+    def testOptionsUnchanged(self):
+        art = geom.Art()
+        path = geom.Path()
+        sp = geom.Subpath()
+        sp.closed = True
+        sq = [(0.0, 0.0), (100.0, 0.0), (100.0, 100.0), (0.0, 100.0)]
+        for i in range(4):
+            sp.AddSegment(("L", sq[i], sq[(i + 1) % 4]))
+        path.AddSubpath(sp)
+        path.filled = True
+        art.paths.append(path)
+        opt = import_vecfile.ImportOptions()
+        (m, msg) = import_vecfile.ArtToModel(art, opt)
+        self.assertEqual(msg, "")
+        self.assertEqual(len(m.faces), 1)
+        # the final scale is only used for this conversion
+        self.assertEqual(opt.convert_options.scaled_side_target, 0.0)
+
+
 if __name__ == "__main__":
     unittest.main()
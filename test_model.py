@@ -94,6 +94,18 @@ class TestRegionToPolyAreas(unittest.TestCase):
         self.assertEqual(len(pas[0].holes), 1)
         self.assertEqual(pas[0].holes[0], [6, 5, 9, 10])
 
+    def testPinch(self):
+        # a ring of squares around a hole whose corner touches
+        # the outside at vertex 12
+        points = GridPoints(5, 5)
+        faces = [[6, 7, 12, 11], [1, 2, 7, 6], [2, 3, 8, 7], [3, 4, 9, 8],
+          [8, 9, 14, 13], [13, 14, 19, 18], [12, 13, 18, 17]]
+        pas = model.RegionToPolyAreas(faces, points, list(range(7)))
+        self.assertEqual(len(pas), 1)
+        self.assertEqual(pas[0].poly,
+          [7, 12, 11, 6, 1, 2, 3, 4, 9, 14, 19, 18, 17, 12, 13, 8])
+        self.assertEqual(pas[0].holes, [])
+
 
 class TestRotatedPolyAreaToXY(unittest.TestCase):
 
@@ -154,7 +166,7 @@ class TestBevelPolyAreaInModel(unittest.TestCase):
         self.assertEqual(m.points.pos[8:],
           [(-0.9, -0.9, 1.1), (0.9, -0.9, 1.1), (0.9, 0.9, 1.1), (-0.9, 0.9, 1.1)])
         self.assertEqual(m.faces[6:], [[4, 5, 9, 8], [5, 6, 10, 9],
-          [6, 7, 11, 10], [7, 4, 8, 11], (9, 10, 11, 8)])
+          [6, 7, 11, 10], [7, 4, 8, 11], (8, 9, 10, 11)])
 
     def testCubeBottom(self):
         m = Cube()
@@ -164,5 +176,50 @@ class TestBevelPolyAreaInModel(unittest.TestCase):
         self.assertEqual(len(m.faces), 11)
 
 
+
+def _Shapes():
+    # an L, a square with a square hole, and a triangle
+    pas = geom.PolyAreas()
+    pts = pas.points
+    def Ring(coords, dx):
+        return [pts.AddPoint((x + dx, y)) for (x, y) in coords]
+    lshape = [(0., 0.), (2., 0.), (2., 1.), (1., 1.), (1., 2.), (0., 2.)]
+    square = [(0., 0.), (3., 0.), (3., 3.), (0., 3.)]
+    hole = [(1., 1.), (1., 2.), (2., 2.), (2., 1.)]
+    pas.polyareas.append(geom.PolyArea(pts, Ring(lshape, 0.), None, "L"))
+    pas.polyareas.append(geom.PolyArea(pts, Ring(square, 5.),
+        [Ring(hole, 5.)], "O"))
+    pas.polyareas.append(geom.PolyArea(pts, Ring(square[:3], 10.), None,
+        "T"))
+    return pas
+
+
+class TestPolyAreasToModel(unittest.TestCase):
+
+    def _Model(self, processes):
+        pas = _Shapes()
+        m = model.PolyAreasToModel(pas, 0.0, 0.0, True, None, None,
+            processes)
+        model.ExtrudePolyAreasInModel(m, pas, 1.0, True, None, None,
+            processes)
+        return m
+
+    def testExtrude(self):
+        m = self._Model(1)
+        # tops, then for each area its sides and then its back
+        self.assertEqual(m.face_data, ["L"] * 2 + ["O"] * 4 + ["T"] +
+            ["L"] * 8 + ["O"] * 12 + ["T"] * 4)
+        self.assertEqual(m.faces[11:15], [[4, 21, 22, 5], [5, 22, 17, 0],
+            (17, 22, 21, 20), (17, 20, 19, 18)])
+        self.assertEqual(m.faces[-2:], [[16, 33, 31, 14], (33, 32, 31)])
+
+    def testProcesses(self):
+        serial = self._Model(1)
+        parallel = self._Model(2)
+        self.assertEqual(parallel.points.pos, serial.points.pos)
+        self.assertEqual(parallel.faces, serial.faces)
+        self.assertEqual(parallel.face_data, serial.face_data)
+
+
 if __name__ == "__main__":
     unittest.main()
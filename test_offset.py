@@ -444,6 +444,55 @@ class TestBuild(unittest.TestCase):
             ShowOffset(o)
 
 
+class TestBuildEvents(unittest.TestCase):
+
+    def _Star(self, n):
+        pts = []
+        for i in range(n):
+            a = 2.0 * math.pi * i / n
+            r = 1.0 if i % 2 == 0 else 0.4 + 0.3 * ((i * 7) % 11) / 11.0
+            pts.append((r * math.cos(a), r * math.sin(a), 0.0))
+        return geom.PolyArea(geom.Points(pts), list(range(n)))
+
+    def testSameAsAllSpokes(self):
+        # each offset's events, found from the candidates kept from
+        # offset to offset, are the ones NextSpokeEvents finds
+        o = offset.Offset(self._Star(40), 0.0, 0.5)
+        o.Build()
+        stack = [o]
+        count = 0
+        while stack:
+            oo = stack.pop()
+            if oo.inneroffsets:
+                bestt = min([oo.NextSpokeEvents(s)[0]
+                    for f in oo.facespokes for s in f])
+                self.assertAlmostEqual(oo.endtime, bestt)
+                count += 1
+            stack.extend(oo.inneroffsets)
+        self.assertTrue(count > 10)
+
+    def testDeep(self):
+        # a wavy ring makes offsets nested more than a hundred deep
+        n = 200
+        pts = []
+        for i in range(n):
+            a = 2.0 * math.pi * i / n
+            r = 1.0 + 0.1 * math.sin(41.0 * a) + 0.05 * math.sin(13.0 * a)
+            pts.append((r * math.cos(a), r * math.sin(a), 0.0))
+        o = offset.Offset(geom.PolyArea(geom.Points(pts), list(range(n))),
+            0.0, 0.5)
+        o.Build(0.08)
+        depth = 0
+        stack = [(o, 0)]
+        while stack:
+            (oo, d) = stack.pop()
+            depth = max(depth, d)
+            stack.extend([(inner, d + 1) for inner in oo.inneroffsets])
+            if not oo.inneroffsets:
+                self.assertAlmostEqual(oo.timesofar + oo.endtime, 0.08)
+        self.assertTrue(depth > 100)
+
+
 class TestInnerPolyAreas(unittest.TestCase):
 
     def runTest(self):
@@ -0,0 +1,168 @@
+#!/usr/bin/python3.1
+
+"""Unit tests for polybool module."""
+
+import math
+import unittest
+import vec
+from vec import geom
+from vec import polybool
+
+
+def _Ring(points, coords):
+    return [points.AddPoint(p) for p in coords]
+
+
+def _Square(points, x0, y0, x1, y1):
+    return _Ring(points, [(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+
+
+def _Area(pas):
+    return sum([geom.SignedArea(pa.poly, pa.points) + \
+        sum([geom.SignedArea(h, pa.points) for h in pa.holes]) \
+        for pa in pas])
+
+
+class TestBooleans(unittest.TestCase):
+
+    def runTest(self):
+        pts = geom.Points()
+        a = [_Square(pts, 0.0, 0.0, 2.0, 2.0)]
+        b = [_Square(pts, 1.0, 1.0, 3.0, 3.0)]
+        ans = polybool.Union(a, b, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertEqual(len(ans[0].poly), 8)
+        self.assertAlmostEqual(_Area(ans), 7.0)
+        ans = polybool.Intersection(a, b, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertAlmostEqual(_Area(ans), 1.0)
+        ans = polybool.Difference(a, b, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertAlmostEqual(_Area(ans), 3.0)
+        # orientation of operands doesn't matter
+        ans = polybool.Difference(a, [b[0][::-1]], pts)
+        self.assertAlmostEqual(_Area(ans), 3.0)
+        # sharing an edge
+        c = [_Square(pts, 2.0, 0.0, 3.0, 1.0)]
+        ans = polybool.Union(a, c, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertAlmostEqual(_Area(ans), 5.0)
+        self.assertEqual(polybool.Intersection(a, c, pts), [])
+        # difference making a hole
+        d = [_Square(pts, 0.5, 0.5, 1.5, 1.5)]
+        ans = polybool.Difference(a, d, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertEqual(ans[0].poly, a[0])
+        self.assertEqual(len(ans[0].holes), 1)
+        self.assertEqual(sorted(ans[0].holes[0]), sorted(d[0]))
+        self.assertAlmostEqual(geom.SignedArea(ans[0].holes[0], pts), -1.0)
+
+
+class TestFillRings(unittest.TestCase):
+
+    def runTest(self):
+        pts = geom.Points()
+        outer = _Square(pts, 0.0, 0.0, 10.0, 10.0)
+        inner = _Square(pts, 2.0, 2.0, 8.0, 8.0)
+        ans = polybool.FillRings([outer, inner], pts)
+        self.assertEqual(len(ans), 1)
+        self.assertEqual(ans[0].holes, [])
+        ans = polybool.FillRings([outer, inner], pts, evenodd=True)
+        self.assertEqual(len(ans), 1)
+        self.assertEqual(len(ans[0].holes), 1)
+        self.assertAlmostEqual(_Area(ans), 64.0)
+        ans = polybool.FillRings([outer, inner[::-1]], pts)
+        self.assertAlmostEqual(_Area(ans), 64.0)
+        # figure 8 becomes two triangles
+        fig8 = _Ring(pts, [(0.0, 0.0), (2.0, 2.0), (2.0, 0.0), (0.0, 2.0)])
+        ans = polybool.FillRings([fig8], pts)
+        self.assertEqual(len(ans), 2)
+        self.assertEqual([len(pa.poly) for pa in ans], [3, 3])
+        self.assertAlmostEqual(_Area(ans), 2.0)
+        # hole touching its outer boundary at a vertex
+        tri = _Ring(pts, [(0.0, 5.0), (4.0, 3.0), (4.0, 7.0)])
+        ans = polybool.FillRings([outer, tri], pts, evenodd=True)
+        self.assertEqual(len(ans), 1)
+        self.assertEqual(len(ans[0].poly), 5)
+        self.assertEqual(len(ans[0].holes), 1)
+        self.assertAlmostEqual(_Area(ans), 92.0)
+
+
+class TestNestedComponents(unittest.TestCase):
+
+    def runTest(self):
+        # The rings nested in the hole must find that they are in the
+        # hole even though the ray going left from their leftmost vertices
+        # goes exactly through a vertex of the hole.
+        pts = geom.Points()
+        outer = _Square(pts, 0.0, 0.0, 20.0, 20.0)
+        hole = _Ring(pts, [(6.0, 10.0), (2.0, 14.0), (2.0, 4.0), (18.0, 4.0),
+            (18.0, 16.0), (2.0, 16.0)])
+        island = _Square(pts, 10.0, 10.0, 12.0, 12.0)
+        ans = polybool.FillRings([outer, hole, island], pts, evenodd=True)
+        self.assertEqual(len(ans), 2)
+        self.assertAlmostEqual(_Area(ans), 400.0 - 188.0 + 4.0)
+        self.assertEqual(ans[1].poly, island)
+        self.assertEqual(ans[1].holes, [])
+
+
+class TestSimpleRings(unittest.TestCase):
+
+    def runTest(self):
+        pts = geom.Points()
+        square = _Square(pts, 0.0, 0.0, 1.0, 1.0)
+        ans = polybool.SimpleRings(square, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertIs(ans[0], square)
+        fig8 = _Ring(pts, [(0.0, 0.0), (2.0, 2.0), (2.0, 0.0), (0.0, 2.0)])
+        ans = polybool.SimpleRings(fig8, pts)
+        self.assertEqual(len(ans), 2)
+        mid = pts.AddPoint((1.0, 1.0))
+        for ring in ans:
+            self.assertEqual(len(ring), 3)
+            self.assertIn(mid, ring)
+            self.assertAlmostEqual(geom.SignedArea(ring, pts), 1.0)
+        # pentagram: nonzero fills the middle, even-odd leaves just
+        # the five points, touching at their corners
+        star = _Ring(pts, [(math.cos(a), math.sin(a)) for a in \
+            [math.pi / 2.0 + 4.0 * math.pi * k / 5.0 for k in range(5)]])
+        ans = polybool.SimpleRings(star, pts)
+        self.assertEqual([len(r) for r in ans], [10])
+        ans = polybool.SimpleRings(star, pts, evenodd=True)
+        self.assertEqual([len(r) for r in ans], [3, 3, 3, 3, 3])
+        for ring in ans:
+            self.assertGreater(geom.SignedArea(ring, pts), 0.0)
+        # a spike going back along itself is removed
+        spike = _Ring(pts, [(0.0, 0.0), (4.0, 0.0), (4.0, 4.0),
+            (4.0, 6.0), (4.0, 4.0), (0.0, 4.0)])
+        ans = polybool.SimpleRings(spike, pts)
+        self.assertEqual([len(r) for r in ans], [4])
+
+
+class TestClipToBox(unittest.TestCase):
+
+    def runTest(self):
+        pts = geom.Points()
+        big = _Square(pts, 0.0, 0.0, 4.0, 4.0)
+        small = _Square(pts, 1.5, 1.5, 1.8, 1.8)
+        far = _Square(pts, 10.0, 10.0, 11.0, 11.0)
+        ans = polybool.ClipToBox([big, small, far], (1.0, 1.0, 2.0, 2.0),
+            pts)
+        self.assertEqual(len(ans), 2)
+        self.assertAlmostEqual(geom.SignedArea(ans[0], pts), 1.0)
+        self.assertIs(ans[1], small)
+        # a U shape whose arms cross the box; clipping it leaves
+        # edges doubling back along the box, which don't matter
+        u = _Ring(pts, [(0.0, 0.0), (3.0, 0.0), (3.0, 3.0), (2.0, 3.0),
+            (2.0, 1.0), (1.0, 1.0), (1.0, 3.0), (0.0, 3.0)])
+        box = (0.5, 0.5, 2.5, 2.0)
+        ans = polybool.ClipToBox([u], box, pts)
+        self.assertEqual(len(ans), 1)
+        self.assertAlmostEqual(_Area(polybool.FillRings(ans, pts)), 2.0)
+        boxring = _Square(pts, 0.5, 0.5, 2.5, 2.0)
+        self.assertAlmostEqual(_Area(polybool.Intersection([u], [boxring],
+            pts)), 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,8 +4,10 @@
 
 import unittest
 import math
+import random
 import vec
 from vec import geom
+from vec import halfedge
 from vec import triquad
 from vec import showfaces
 
@@ -148,7 +150,9 @@ class TestQuadrangulateFace(unittest.TestCase):
         ans = triquad.QuadrangulateFace(F3circle, Vs3)
         if Show:
             showfaces.ShowFaces(ans, Vs3, "F3circle - quad")
-        self.assertEqual(len(ans), 9)
+        # convex, so a strip of quads
+        self.assertEqual(len(ans), 7)
+        self.assertEqual(set([len(f) for f in ans]), set([4]))
 
     def testM(self):
         ans = triquad.QuadrangulateFace(Fsm, Vsm)
@@ -221,10 +225,8 @@ class TestIncircle(unittest.TestCase):
             (math.cos(6.1),math.sin(6.1))])
         self.assertTrue(triquad.InCircle(0, 1, 2, 4, pts))
         self.assertFalse(triquad.InCircle(0, 1, 2, 3, pts))
-        self.assertFalse(triquad.InCircle(0, 1, 2, 5, pts))
         self.assertFalse(triquad.InCircle(0, 2, 1, 4, pts))
         self.assertTrue(triquad.InCircle(0, 2, 1, 3, pts))
-        self.assertFalse(triquad.InCircle(0, 2, 1, 5, pts))
 
     def testIncircle2(self):
         pts = geom.Points([(0.92387900000000001, -0.38268400000000002),
@@ -233,6 +235,83 @@ class TestIncircle(unittest.TestCase):
                 (0.70710700000000004, 0.70710700000000004)])
         self.assertTrue(triquad.InCircle(0, 1, 2, 3, pts))
 
+    def testIncircleCocircular(self):
+        # set pos directly: geom.Points would merge the last two
+        pts = geom.Points()
+        pts.pos = [(5.0, 0.0), (0.0, 5.0), (-5.0, 0.0), (0.0, -5.0),
+            (3.0, 4.0), (3.0, 4.0 - 2.0 ** -50)]
+        self.assertFalse(triquad.InCircle(0, 1, 2, 3, pts))
+        self.assertFalse(triquad.InCircle(0, 2, 1, 3, pts))
+        self.assertFalse(triquad.InCircle(0, 1, 2, 4, pts))
+        self.assertTrue(triquad.InCircle(0, 1, 2, 5, pts))
+        self.assertFalse(triquad.InCircle(0, 2, 1, 5, pts))
+
+
+class TestPredicates(unittest.TestCase):
+
+    def testOrient2d(self):
+        self.assertTrue(triquad.Orient2d((0.0, 0.0), (1.0, 0.0),
+            (0.0, 1.0)) > 0.0)
+        self.assertTrue(triquad.Orient2d((0.0, 0.0), (0.0, 1.0),
+            (1.0, 0.0)) < 0.0)
+        self.assertEqual(triquad.Orient2d((0.0, 0.0), (1.0, 1.0),
+            (3.0, 3.0)), 0.0)
+
+    def testNearlyCollinear(self):
+        # points near the line y = x, where the floating point
+        # determinant has the wrong sign for many of them
+        random.seed(3)
+        for _ in range(1000):
+            x = 0.5 + random.randint(0, 256) * 2.0 ** -53
+            y = 0.5 + random.randint(0, 256) * 2.0 ** -53
+            a = (x, y)
+            b = (12.0, 12.0)
+            c = (24.0, 24.0)
+            exact = triquad._Orient2dExact(a, b, c)
+            o = triquad.Orient2d(a, b, c)
+            self.assertEqual(exact > 0, o > 0.0)
+            self.assertEqual(exact == 0, o == 0.0)
+            self.assertEqual(triquad.Orient2d(b, c, a) > 0.0, o > 0.0)
+
+    def testScale(self):
+        # the answers don't depend on the scale of the coordinates
+        # (set pos directly: geom.Points would merge the tiny ones)
+        coords = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0),
+            (0.5, 0.5), (0.5, 1e-9), (0.25, -1e-9)]
+        for scale in [1e-12, 1e-6, 1.0, 1e6, 1e12]:
+            pts = geom.Points()
+            pts.pos = [(scale * x, scale * y) for (x, y) in coords]
+            self.assertTrue(triquad.Ccw(0, 1, 5, pts))
+            self.assertFalse(triquad.Ccw(1, 0, 5, pts))
+            self.assertFalse(triquad.Ccw(0, 4, 2, pts))
+            self.assertTrue(triquad.InCircle(0, 1, 2, 4, pts))
+            self.assertFalse(triquad.InCircle(0, 1, 2, 3, pts))
+            self.assertTrue(triquad.SegsIntersect(0, 2, 1, 3, pts))
+            self.assertTrue(triquad.SegsIntersect(5, 6, 0, 1, pts))
+            self.assertFalse(triquad.SegsIntersect(5, 2, 0, 1, pts))
+
+
+    def testIllScaledFace(self):
+        # tiny and huge faces need no desperate ear chopping
+        # and triangulate the same way with both algorithms
+        random.seed(5)
+        coords = []
+        for i in range(60):
+            a = 2.0 * math.pi * i / 60
+            d = 1.0 + 0.5 * random.random()
+            coords.append((d * math.cos(a), d * math.sin(a)))
+        for scale in [1e-6, 1.0, 1e6]:
+            pts = geom.Points()
+            pts.pos = [(scale * x, scale * y) for (x, y) in coords]
+            face = list(range(len(coords)))
+            for algorithm in ["EARCHOP", "SWEEP"]:
+                stats = triquad.TriQuadStats()
+                tris = triquad.TriangulateFace(face, pts, algorithm, stats)
+                self.assertEqual(len(tris), 58)
+                self.assertEqual(stats.ears[1:], [0, 0, 0, 0])
+                self.assertEqual(stats.sweep_fallbacks, 0)
+
+
 class TestAnglekind(unittest.TestCase):
 
     def testAnglekind(self):
@@ -265,11 +344,11 @@ class TestIsreversed(unittest.TestCase):
         pts = geom.Points([(0.0,0.0),(1.0,0.0),(0.2,1.0),(1.2,1.0)])
         tris1 = [[0,1,3],[0,3,2]]
         tris2 = [[0,1,2],[1,3,2]]
-        td1 = triquad._TriDict(tris1)
-        td2 = triquad._TriDict(tris2)
-        self.assertTrue(triquad._IsReversed((0,3), td1, pts))
-        self.assertFalse(triquad._IsReversed((1,2), td2, pts))
-        self.assertFalse(triquad._IsReversed((0,1), td1, pts))
+        m1 = halfedge.HalfEdgeMesh(tris1)
+        m2 = halfedge.HalfEdgeMesh(tris2)
+        self.assertTrue(triquad._IsReversed(m1, m1.FindHalfEdge(0,3), pts))
+        self.assertFalse(triquad._IsReversed(m2, m2.FindHalfEdge(1,2), pts))
+        self.assertFalse(triquad._IsReversed(m1, m1.FindHalfEdge(0,1), pts))
 
 class TestReversededges(unittest.TestCase):
 
@@ -277,9 +356,86 @@ class TestReversededges(unittest.TestCase):
         pts = geom.Points([(0.0,0.0),(1.0,0.0),(0.2,1.0),(1.2,1.0),(1.5,0.0)])
         tris = [[0,1,3], [0,3,2], [1,4,3]]
         bord = triquad._BorderEdges([[0,1,4,3,2]])
-        td = triquad._TriDict(tris)
-        ans = triquad._ReveresedEdges(tris, td, bord, pts)
-        self.assertEqual(ans, [(0,3)])
+        mesh = halfedge.HalfEdgeMesh(tris, bord)
+        ans = triquad._ReveresedEdges(mesh, pts)
+        self.assertEqual([mesh.Edge(h) for h in ans], [(0,3)])
+
+class TestBatchKernels(unittest.TestCase):
+
+    def _Quads(self):
+        random.seed(7)
+        pts = geom.Points()
+        pts.pos = [(random.random(), random.random(), 0.0)
+            for _ in range(100)]
+        pts.pos += [(5.0, 0.0), (0.0, 5.0), (-5.0, 0.0), (0.0, -5.0)]
+        quads = [tuple(random.sample(range(100), 4)) for _ in range(500)]
+        # cocircular, so needing the exact test
+        quads += [(100, 101, 102, 103), (101, 100, 102, 103)] * 50
+        return (quads, pts)
+
+    def _Single(self, fn, *args):
+        # call fn as it works without numpy (and without the cache)
+        saved = (triquad.numpy, triquad.CACHE_SIZE)
+        (triquad.numpy, triquad.CACHE_SIZE) = (None, 0)
+        try:
+            return fn(*args)
+        finally:
+            (triquad.numpy, triquad.CACHE_SIZE) = saved
+
+    def testInCircleBatch(self):
+        (quads, pts) = self._Quads()
+        ans = triquad._InCircleBatch(quads, pts)
+        self.assertEqual(ans,
+            [triquad.InCircle(a, b, c, d, pts) for (a, b, c, d) in quads])
+        self.assertEqual(ans,
+            self._Single(triquad._InCircleBatch, quads, pts))
+
+    def testQuadAngleBatch(self):
+        (quads, pts) = self._Quads()
+        ans = triquad._QuadAngleBatch(quads, pts)
+        single = self._Single(triquad._QuadAngleBatch, quads, pts)
+        self.assertEqual(len(ans), len(single))
+        for (x, y) in zip(ans, single):
+            self.assertAlmostEqual(x, y)
+
+    def testQuadrangulate(self):
+        points = geom.Points()
+        face = [points.AddPoint((100.0 * (1.0 + 0.2 * math.sin(7.0 * a)) *
+            math.cos(a), 100.0 * (1.0 + 0.2 * math.sin(7.0 * a)) *
+            math.sin(a))) for a in [2.0 * math.pi * i / 500
+            for i in range(500)]]
+        quads = triquad.QuadrangulateFace(face, points, 'EARCHOP')
+        single = self._Single(triquad.QuadrangulateFace, face, points,
+            'EARCHOP')
+        self.assertEqual(sorted(quads), sorted(single))
+
+    def testQuadrangulateStraight(self):
+        # a rectangle with 25 evenly spaced vertices per side (so 95
+        # interior edges, more than NTHRESH): some quads would have
+        # 180 degree angles, which both ways must reject
+        (w, h, k) = (7.4, 3.7, 25)
+        points = geom.Points()
+        face = [points.AddPoint(p) for p in
+            [(w * i / k, 0.0) for i in range(k)] +
+            [(w, h * i / k) for i in range(k)] +
+            [(w - w * i / k, h) for i in range(k)] +
+            [(0.0, h - h * i / k) for i in range(k)]]
+        for algorithm in ['SWEEP', 'EARCHOP']:
+            triquad.ClearCache()
+            quads = self._Single(lambda: triquad.QuadrangulateFace(face,
+                points, algorithm))
+            saved = triquad.CACHE_SIZE
+            triquad.CACHE_SIZE = 0
+            try:
+                batched = triquad.QuadrangulateFace(face, points, algorithm)
+            finally:
+                triquad.CACHE_SIZE = saved
+            self.assertEqual(sorted(batched), sorted(quads))
+            for q in quads:
+                if len(q) == 4:
+                    for i in range(4):
+                        self.assertTrue(triquad.Ccw(q[i - 1], q[i],
+                            q[(i + 1) % 4], points))
 
 class TestIsear(unittest.TestCase):
 
@@ -297,8 +453,315 @@ class TestCDT(unittest.TestCase):
         pts = geom.Points([(0.0,0.0),(1.0,0.0),(0.2,1.0),(1.2,1.0),(1.5,0.0)])
         tris = [(0,1,3), (0,3,2), (1,4,3)]
         bord = triquad._BorderEdges([[0,1,4,3,2]])
-        ans = triquad._CDT(tris, bord, pts)
-        self.assertEqual(ans, [(1, 4, 3), (2, 0, 1), (2, 1, 3)])
+        mesh = halfedge.HalfEdgeMesh(tris, bord)
+        triquad._CDT(mesh, pts)
+        self.assertEqual(sorted(mesh.Faces()),
+            [(1, 4, 3), (2, 0, 1), (2, 1, 3)])
+
+def _NormTris(tris):
+    # rotate each triangle to start at its smallest index
+    return set([min(t[i:] + t[:i] for i in range(3)) for t in tris])
+
+
+class TestSweepCDT(unittest.TestCase):
+
+    def testMatchesEarChop(self):
+        for (f, vs) in ((F1concave, Vs1), (F3circle, Vs3), (Fsm, Vsm)):
+            ans = triquad.TriangulateFace(f, vs, 'SWEEP')
+            self.assertEqual(_NormTris(ans),
+                _NormTris(triquad.TriangulateFace(f, vs, 'EARCHOP')))
+
+    def testHoles(self):
+        ans = triquad._SweepCDT([F2outer, F2hole1, F2hole2], Vs2)
+        self.assertEqual(len(ans), 18)
+        area = sum([geom.SignedArea(t, Vs2) for t in ans])
+        self.assertAlmostEqual(area, sum([geom.SignedArea(f, Vs2)
+            for f in (F2outer, F2hole1, F2hole2)]))
+
+    def testFarFromOrigin(self):
+        pts = geom.Points([(92.8174, 0.5102), (92.8151, 0.5120),
+            (92.8164, 0.5091)])
+        ans = triquad._SweepCDT([[0, 1, 2]], pts)
+        self.assertEqual(_NormTris(ans), set([(0, 1, 2)]))
+
+    def testCrossesFallsBack(self):
+        self.assertEqual(triquad._SweepCDT([F1crosses], Vs1), None)
+        ans = triquad.TriangulateFace(F1crosses, Vs1)
+        self.assertEqual(len(ans), 2)
+
+    def testLarge(self):
+        n = 2000
+        pts = geom.Points()
+        face = [pts.AddPoint(((10.0 + (i % 3)) * math.cos(2 * math.pi * i / n),
+            (10.0 + (i % 3)) * math.sin(2 * math.pi * i / n)))
+            for i in range(n)]
+        ans = triquad.TriangulateFace(face, pts, 'SWEEP')
+        self.assertEqual(len(ans), n - 2)
+
+
+class TestLinkedEarChop(unittest.TestCase):
+
+    def testM(self):
+        (tris, rest) = triquad._LinkedEarChop(Fsm, Vsm)
+        self.assertEqual(len(tris), 25)
+        self.assertEqual(len(rest), 3)
+        area = sum([geom.SignedArea(t, Vsm) for t in tris + [rest]])
+        self.assertAlmostEqual(area, geom.SignedArea(Fsm, Vsm))
+
+    def testHoles(self):
+        face = triquad._JoinIslands(F2outer, [triquad._SortFace(h, Vs2)
+            for h in [F2hole1, F2hole2]], Vs2)
+        ans = triquad.EarChopTriFace(face, Vs2)
+        self.assertEqual(len(ans), len(triquad._ChopEars(face, Vs2)))
+        area = sum([geom.SignedArea(t, Vs2) for t in ans])
+        self.assertAlmostEqual(area, geom.SignedArea(face, Vs2))
+
+    def testCrosses(self):
+        ans = triquad.EarChopTriFace(F1crosses, Vs1)
+        self.assertEqual(len(ans), 2)
+
+    def testZOrder(self):
+        self.assertEqual(triquad._ZOrder(0, 0), 0)
+        self.assertEqual(triquad._ZOrder(1, 0), 1)
+        self.assertEqual(triquad._ZOrder(0, 1), 2)
+        self.assertEqual(triquad._ZOrder(3, 5), 0b100111)
+        self.assertEqual(triquad._ZOrder(65535, 65535), 0xFFFFFFFF)
+
+    def testZBigMin(self):
+        (x0, y0, x1, y1) = (3, 2, 6, 5)
+        inbox = sorted([triquad._ZOrder(x, y)
+            for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)])
+        zmin = triquad._ZOrder(x0, y0)
+        zmax = triquad._ZOrder(x1, y1)
+        for z in range(zmin + 1, zmax):
+            if z not in inbox:
+                want = min([w for w in inbox if w > z])
+                self.assertEqual(triquad._ZBigMin(z, zmin, zmax), want)
+
+
+class TestTriQuadStats(unittest.TestCase):
+
+    def setUp(self):
+        # count the work of every face, even if done before
+        self.saved = triquad.CACHE_SIZE
+        triquad.CACHE_SIZE = 0
+
+    def tearDown(self):
+        triquad.CACHE_SIZE = self.saved
+
+    def testCounts(self):
+        stats = triquad.TriQuadStats()
+        ans = triquad.QuadrangulateFaceWithHoles(F2outer,
+            [F2hole1, F2hole2], Vs2, 'EARCHOP', stats)
+        self.assertEqual(stats.faces, 1)
+        self.assertEqual(stats.diag_searches, 2)
+        self.assertEqual(sum(stats.ears), 17)
+        self.assertEqual(stats.over_budget, 0)
+        self.assertEqual(stats.warnings, [])
+        self.assertEqual(stats.tree_matches + stats.blossom_matches +
+            stats.forest_matches > 0, True)
+        more = triquad.TriQuadStats()
+        triquad.TriangulateFace(Fsm, Vsm, 'SWEEP', more)
+        stats.Add(more)
+        self.assertEqual(stats.faces, 2)
+        self.assertEqual(stats.flips >= more.flips, True)
+
+    def testOverBudget(self):
+        # a budget this small runs out at once
+        stats = triquad.TriQuadStats()
+        ans = triquad.TriangulateFaceWithHoles(F2outer,
+            [F2hole1, F2hole2], Vs2, 'EARCHOP', stats, 1e-9)
+        self.assertEqual(len(ans), 18)
+        self.assertEqual(stats.over_budget, 1)
+        self.assertEqual(stats.flips, 0)
+        self.assertEqual(len(stats.warnings), 1)
+        stats = triquad.TriQuadStats()
+        ans = triquad._ChopEars(Fsm, Vsm, triquad._Work(Fsm, stats, 1e-9))
+        self.assertEqual(len(ans), 26)
+        self.assertEqual(stats.ears, [0, 0, 0, 0, 25])
+
+    def testOverBudgetMatch(self):
+        # hexagon with a rotated hexagonal hole: the quad matching
+        # graph is a cycle
+        pts = geom.Points([(3.0 * math.cos(a), 3.0 * math.sin(a))
+            for a in [math.pi * i / 3.0 for i in range(6)]] +
+            [(1.5 * math.cos(a), 1.5 * math.sin(a))
+            for a in [math.pi * (i + 0.5) / 3.0 for i in range(6)]])
+        (face, hole) = ([0, 1, 2, 3, 4, 5], [11, 10, 9, 8, 7, 6])
+        stats = triquad.TriQuadStats()
+        ans = triquad.QuadrangulateFaceWithHoles(face, [hole], pts,
+            'SWEEP', stats)
+        self.assertEqual(stats.blossom_matches, 1)
+        stats = triquad.TriQuadStats()
+        slow = triquad.QuadrangulateFaceWithHoles(face, [hole], pts,
+            'SWEEP', stats, 1e-9)
+        self.assertEqual(stats.blossom_matches, 0)
+        self.assertEqual(stats.forest_matches, 1)
+        self.assertEqual(stats.over_budget, 1)
+        area = sum([geom.SignedArea(f, pts) for f in slow])
+        self.assertAlmostEqual(area, sum([geom.SignedArea(f, pts)
+            for f in ans]))
+
+
+class TestConvexStrip(unittest.TestCase):
+
+    def testIsConvex(self):
+        self.assertTrue(triquad._IsConvex(F3circle, Vs3))
+        self.assertFalse(triquad._IsConvex(list(reversed(F3circle)), Vs3))
+        self.assertFalse(triquad._IsConvex(Fsm, Vsm))
+        # a pentagram turns left at every vertex, but goes around twice
+        pts = geom.Points()
+        pts.pos = [(math.cos(a), math.sin(a))
+            for a in [2.0 * math.pi * i / 5 for i in range(5)]]
+        self.assertTrue(triquad._IsConvex([0, 1, 2, 3, 4], pts))
+        self.assertFalse(triquad._IsConvex([0, 2, 4, 1, 3], pts))
+        # a straight angle isn't strictly convex
+        pts.pos = [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0), (2.0, 1.0)]
+        self.assertFalse(triquad._IsConvex([0, 1, 2, 3], pts))
+
+    def testStrip(self):
+        # wide ellipse with 9 vertices: strip starts at the left end
+        pts = geom.Points()
+        pts.pos = [(4.0 * math.cos(a), math.sin(a))
+            for a in [2.0 * math.pi * (i + 0.5) / 9 for i in range(9)]]
+        face = [2, 3, 4, 5, 6, 7, 8, 0, 1]
+        stats = triquad.TriQuadStats()
+        ans = triquad.QuadrangulateFace(face, pts, stats=stats)
+        self.assertEqual(ans, [(4, 5, 2, 3),
+            (5, 6, 1, 2), (6, 7, 0, 1), (7, 8, 0)])
+        self.assertEqual((stats.faces, stats.convex_faces,
+            stats.single_quads, stats.flips), (1, 1, 0, 0))
+        tris = triquad.TriangulateFace(face, pts, stats=stats)
+        self.assertEqual(len(tris), 7)
+        area = sum([geom.SignedArea(f, pts) for f in tris])
+        self.assertAlmostEqual(area, geom.SignedArea(face, pts))
+        self.assertEqual(stats.convex_faces, 2)
+
+    def testSingleQuad(self):
+        stats = triquad.TriQuadStats()
+        ans = triquad.QuadrangulateFace(F1square, Vs1, stats=stats)
+        self.assertEqual(ans, [tuple(F1square)])
+        self.assertEqual(stats.single_quads, 1)
+        ans = triquad.QuadrangulateFace(Fsm, Vsm, stats=stats)
+        self.assertEqual((stats.faces, stats.convex_faces), (2, 1))
+
+
+class TestTriQuadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (triquad._triquad_cache, triquad.CACHE_SIZE)
+        triquad.ClearCache()
+
+    def tearDown(self):
+        (triquad._triquad_cache, triquad.CACHE_SIZE) = self.saved
+
+    def _Copy(self, pts, faces, dx, dy):
+        # add a translated copy of the points of faces to pts;
+        # return the faces with the new vertices, and the map
+        # from old vertices to new
+        newv = dict()
+        for f in faces:
+            for v in f:
+                if v not in newv:
+                    (x, y) = pts.pos[v][:2]
+                    newv[v] = len(pts.pos)
+                    pts.pos.append((x + dx, y + dy))
+        return ([[newv[v] for v in f] for f in faces], newv)
+
+    def testTranslatedHit(self):
+        pts = geom.Points()
+        pts.pos = list(Vs2.pos)
+        (face, h1, h2) = (F2outer, F2hole1, F2hole2)
+        stats = triquad.TriQuadStats()
+        ans = triquad.QuadrangulateFaceWithHoles(face, [h1, h2], pts,
+            stats=stats)
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (0, 1))
+        ((face2, h12, h22), shift) = self._Copy(pts, [face, h1, h2],
+            12.5, -3.0)
+        # same face, starting elsewhere and with the holes swapped
+        face2 = face2[3:] + face2[:3]
+        ans2 = triquad.QuadrangulateFaceWithHoles(face2, [h22, h12], pts,
+            stats=stats)
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (1, 1))
+        self.assertEqual(stats.faces, 2)
+        self.assertEqual(len(ans2), len(ans))
+        self.assertEqual(sorted([tuple(_Rotated(f)) for f in ans2]),
+            sorted([tuple(_Rotated([shift[v] for v in f])) for f in ans]))
+        # a triangulation isn't a quadrangulation
+        triquad.TriangulateFaceWithHoles(face2, [h22, h12], pts,
+            stats=stats)
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (1, 2))
+        self.assertEqual(triquad.CacheInfo()[0], 2)
+
+    def testEvictions(self):
+        triquad.CACHE_SIZE = 2
+        pts = geom.Points()
+        pts.pos = list(Vsm.pos)
+        stats = triquad.TriQuadStats()
+        faces = [Fsm] + [self._Copy(pts, [Fsm], 0.0, 100.0 * i)[0][0]
+            for i in range(1, 4)]
+        # stretch the copies so they differ
+        for (i, f) in enumerate(faces):
+            for v in f[1:]:
+                (x, y) = pts.pos[v]
+                pts.pos[v] = (x, y + 0.01 * i)
+        for f in faces:
+            triquad.TriangulateFace(f, pts, stats=stats)
+        self.assertEqual((stats.cache_misses, stats.cache_evictions),
+            (4, 2))
+        (n, values) = triquad.CacheInfo()
+        self.assertEqual(n, 2)
+        self.assertEqual(values, 2 * (1 + 2 * 28 + 3 * 26))
+        triquad.TriangulateFace(faces[3], pts, stats=stats)
+        self.assertEqual(stats.cache_hits, 1)
+        triquad.CACHE_SIZE = 0
+        triquad.TriangulateFace(faces[3], pts, stats=stats)
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (1, 4))
+
+
+def _Rotated(f):
+    # rotate face f to start at its smallest index
+    i = f.index(min(f))
+    return list(f[i:]) + list(f[:i])
+
+
+class TestQuadrangulateMany(unittest.TestCase):
+
+    def testMany(self):
+        # copies of the M and of F2 with its holes, side by side,
+        # and some convex faces
+        pts = geom.Points()
+        faces = []
+        for i in range(6):
+            (vs, face, holes) = ((Vsm, Fsm, []) if i % 2 == 0 else
+                (Vs2, F2outer, [F2hole1, F2hole2]))
+            base = len(pts.pos)
+            pts.pos.extend([(x + 20.0 * i, y) for (x, y) in
+                [p[:2] for p in vs.pos]])
+            faces.append(([base + v for v in face],
+                [[base + v for v in h] for h in holes]))
+        faces.append((list(range(3)), []))
+        faces.append(([base + v for v in F1square], []))
+        pts.pos.extend([p[:2] for p in Vs3.pos])
+        faces.append(([len(pts.pos) - 16 + v for v in F3circle], []))
+        stats = triquad.TriQuadStats()
+        serial = triquad.QuadrangulateMany(faces, pts, stats=stats)
+        self.assertEqual(serial, [triquad.QuadrangulateFaceWithHoles(f, h,
+            pts) for (f, h) in faces])
+        pstats = triquad.TriQuadStats()
+        parallel = triquad.QuadrangulateMany(faces, pts, stats=pstats,
+            workers=2)
+        self.assertEqual(parallel, serial)
+        self.assertEqual((pstats.faces, pstats.convex_faces),
+            (stats.faces, stats.convex_faces))
+
+    def testChunkArgs(self):
+        (verts, coords) = triquad._ChunkArgs([([4, 1, 3], []),
+            ([1, 4, 0, 2], [[3, 0, 1]])], Vs1)
+        self.assertEqual(list(verts), [4, 1, 3, 0, 2])
+        self.assertEqual(list(coords), [0.0, 1.0, 1.0, 0.0, 1.0, 1.0,
+            0.0, 0.0, 0.5, 0.25])
+
 
 class TestSortface(unittest.TestCase):
 
@@ -334,6 +797,21 @@ class TestJoinislands(unittest.TestCase):
         self.assertEqual(ans, [0, 12, 8, 2, 3, 9, 8, 12, 13, 6,
                                7, 10, 4, 5, 11, 10, 7, 14, 15, 1])
 
+    def testManyHoles(self):
+        # a 4 by 4 grid of square holes, many equally near each other
+        pts = geom.Points([(0.0, 0.0), (4.0, 0.0), (4.0, 4.0), (0.0, 4.0)])
+        holes = []
+        for i in range(4):
+            for j in range(4):
+                (x, y) = (i + 0.25, j + 0.25)
+                holes.append([pts.AddPoint(p) for p in [(x, y),
+                    (x, y + 0.5), (x + 0.5, y + 0.5), (x + 0.5, y)]])
+        face = [0, 1, 2, 3]
+        ans = triquad._JoinIslands(face, holes, pts)
+        for hole in sorted(holes, key=lambda h: pts.pos[h[0]]):
+            face = triquad._JoinIsland(face, hole, pts)
+        self.assertEqual(ans, face)
+
 class TestMaxMatch(unittest.TestCase):
 
     def testMaxMatch(self):
@@ -363,5 +841,43 @@ class TestMaxMatch(unittest.TestCase):
                           (2.0, (2, 11), (2, 11, 8), (2, 6, 11)),
                           (2.0, (5, 11), (5, 11, 6), (5, 10, 11))]))
 
+    def testTreeMatch(self):
+        # a path of 5 triangles: best is the two outer pairs
+        t = [(i, i + 10, i + 20) for i in range(5)]
+        er = [(1.0, (0, 1), t[0], t[1]), (0.8, (1, 2), t[1], t[2]),
+              (0.8, (2, 3), t[2], t[3]), (1.0, (3, 4), t[3], t[4])]
+        ans = triquad._MaxMatch(er)
+        self.assertEqual(set(ans), set([er[0], er[3]]))
+
+    def testBlossomMatch(self):
+        # a 5-cycle with a pendant edge needs a blossom
+        edges = [(0, 1, 6), (1, 2, 6), (2, 3, 6), (3, 4, 6), (4, 0, 6),
+                 (2, 5, 10)]
+        mate = triquad._BlossomMatch(edges)
+        self.assertEqual(mate[2], 5)
+        self.assertEqual(mate[5], 2)
+        w = sum([wt for (i, j, wt) in edges if mate[i] == j])
+        self.assertEqual(w, 22)
+
+    def testRandomMatch(self):
+        # compare with exhaustive search over small random graphs
+        rand = random.Random(1)
+        t = [(i, i + 100, i + 200) for i in range(8)]
+        for trial in range(100):
+            pairs = rand.sample([(i, j) for i in range(8)
+                for j in range(i + 1, 8)], 10)
+            er = [(float(rand.randint(0, 20)), p, t[p[0]], t[p[1]])
+                for p in pairs]
+            best = 0.0
+            for k in range(1 << len(er)):
+                chosen = [er[i] for i in range(len(er)) if k & (1 << i)]
+                used = [x for q in chosen for x in q[2:4]]
+                if len(used) == len(set(used)):
+                    best = max(best, sum([q[0] for q in chosen]))
+            ans = triquad._MaxMatch(er)
+            used = [x for q in ans for x in q[2:4]]
+            self.assertEqual(len(used), len(set(used)))
+            self.assertEqual(sum([q[0] for q in ans]), best)
+
 if __name__=='__main__':
     unittest.main()
@@ -24,9 +24,41 @@
 __author__ = "howard.trickey@gmail.com"
 
 import math
+import copy
 from . import geom
 from . import vecfile
+from . import polybool
 import itertools
+import bisect
+import collections
+import heapq
+
+try:
+    import numpy
+except ImportError:
+    # Blender's bundled Python may not have numpy;
+    # then curves are flattened one at a time.
+    numpy = None
+
+try:
+    import concurrent.futures
+except ImportError:
+    # then paths are always converted in this process
+    concurrent = None
+
+# The grid used to find areas painted over others has at most about
+# this many cells along each side.
+_MAX_GRID_SIDE = 64
+
+# Flattened curve segments are remembered (see _FlattenCache) keyed
+# on their control points relative to their start points, rounded
+# to multiples of this (in art units).
+_FLATTEN_QUANTUM = 1e-7
+_FLATTEN_CACHE_SIZE = 20000
+
+# When converting in several processes, the paths are split into
+# about this many chunks per process, to even out the work.
+_CHUNKS_PER_PROCESS = 4
 
 
 class ConvertOptions(object):
@@ -37,6 +69,8 @@ class ConvertOptions(object):
           'UNIFORM' - all curves subdivided the same amount
           'ADAPTIVE' - curves subdivided until flat enough
           'EVEN' - curves subdivided to make segments of uniform length
+          'TOLERANCE' - curves subdivided to stay within a distance
+            tolerance of the true curve
       smoothness: int - controls smoothness of curve conversion:
         usage depends on subdiv_kind:
           'UNIFORM': number of times to subdivide
@@ -44,23 +78,105 @@ class ConvertOptions(object):
             then that is the definition of 'flat enough'
           'EVEN': proportional to 1/uniform-length-of-segments
             (so higher numbers mean shorter segments)
+          'TOLERANCE': not used
+      tolerance: float - for 'TOLERANCE' subdiv_kind, the maximum
+        distance between a curve and its approximating line segments,
+        in units of the output coordinates
+      simplify_tolerance: float - if > 0, after flattening, remove
+        polygon vertices as long as the boundary moves no more
+        than this distance (in units of the output coordinates)
+        and no boundaries come to cross (see _SimplifyPolyAreas)
+      scaled_side_target: float - if > 0, the caller will scale the
+        converted art so that its longest side is this length
+        (see geom.PolyAreas.scale_and_center), so tolerance and
+        simplify_tolerance are taken to be in those scaled units
 
       filled_only: bool - look only at filled faces
       combine_paths: bool - use union of all subpaths to find
         boundaries and holes instead of just looking for compound
-        paths in the input file
+        paths in the input file: subpaths nested inside an odd number
+        of others are holes, and overlapping subpaths are merged
+      use_fill_rules: bool - find the filled area of each path from
+        its subpaths using the path's fill rule (nonzero or even-odd),
+        instead of guessing holes from how subpaths nest; this
+        handles overlapping and self-crossing subpaths properly
       ignore_white: bool - ignore white-filled paths (background, probably)
+      occlusion: string - one of a few 'enum' strings about the parts
+        of areas hidden under later (in paint order) filled paths:
+          'NONE' - keep them
+          'CULL' - drop areas that are completely hidden
+          'CLIP' - drop completely hidden areas, and cut the hidden
+            parts out of partly hidden ones
+        (not done if combine_paths, as that loses the paint order)
+      remove_duplicates: bool - convert only one of each set of
+        paths with the same geometry (see _RemoveDuplicates)
+      processes: int - if > 1, convert the paths in this many worker
+        processes (see _ParallelPathsToPolyAreas); not done if
+        combine_paths
     """
 
     def __init__(self):
         self.subdiv_kind = "UNIFORM"
         self.smoothness = 1
+        self.tolerance = 0.01
+        self.simplify_tolerance = 0.0
+        self.scaled_side_target = 0.0
         self.filled_only = True
         self.combine_paths = False
+        self.use_fill_rules = False
         self.ignore_white = True
+        self.occlusion = "NONE"
+        self.remove_duplicates = True
+        self.processes = 1
 
 
-def ArtToPolyAreas(art, options):
+class ConvertStats(object):
+    """Counts of what an art to poly conversion did, for reporting.
+
+    Attributes:
+      polyareas: int - number of PolyAreas made
+      verts: int - number of vertices on their boundaries
+      hidden_polyareas: int - number of PolyAreas dropped because
+        they were completely hidden by later paths
+      clipped_polyareas: int - number of PolyAreas that had hidden
+        parts cut out of them
+      hidden_verts: int - number of boundary vertices removed by
+        dropping and clipping hidden areas
+      duplicate_paths: int - number of Paths not converted because
+        another Path has the same geometry
+      stroke_duplicate_paths: int - how many of those were stroked
+        (not filled) copies of a filled Path
+      flatten_cache_hits: int - number of curve segments whose
+        flattening was found in the flattening cache
+      flatten_cache_misses: int - number that had to be flattened
+        (the hit rate is hits / (hits + misses))
+      flatten_cache_evictions: int - number of cached flattenings
+        dropped to make room for new ones
+      simplified_verts: int - number of vertices removed by
+        simplification
+    """
+
+    def __init__(self):
+        self.polyareas = 0
+        self.verts = 0
+        self.hidden_polyareas = 0
+        self.clipped_polyareas = 0
+        self.hidden_verts = 0
+        self.duplicate_paths = 0
+        self.stroke_duplicate_paths = 0
+        self.flatten_cache_hits = 0
+        self.flatten_cache_misses = 0
+        self.flatten_cache_evictions = 0
+        self.simplified_verts = 0
+
+    def Add(self, other):
+        """Add the counts in ConvertStats other to these."""
+
+        for (name, value) in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+def ArtToPolyAreas(art, options, stats=None):
     """Convert Art object to PolyAreas.
 
     Each filled Path in the Art object will produce zero
@@ -73,11 +189,23 @@ def ArtToPolyAreas(art, options):
 
     If options.combine_paths is True, use the union of all subpaths of all
     Paths to look for outer boundaries and holes, else just look insdie each
-    Path separately.
+    Path separately.  If options.use_fill_rules is True, each Path's
+    filled area is found with its fill rule (see polybool).
+
+    If options.remove_duplicates is True, Paths repeating the geometry
+    of another one (such as a copy of a filled path made for stroking
+    it) are dropped before flattening (see _RemoveDuplicates).
+
+    If options.processes > 1, the Paths are converted in worker
+    processes, with the same result.
+
+    If options.occlusion is not 'NONE', areas hidden by paths painted
+    later are dropped or clipped (see _RemoveHidden).
 
     Args:
       art: geom.Art - contains Paths to convert
       options: ConvertOptions
+      stats: ConvertStats - if given, counts are added to this
     Returns:
       geom.PolyAreas
     """
@@ -89,23 +217,42 @@ def ArtToPolyAreas(art, options):
     if options.ignore_white:
         paths_to_convert = [p for p in paths_to_convert \
             if p.fillpaint != geom.white_paint]
-    # TODO: look for dup paths (both filled and stroked) and dedup
+    if options.remove_duplicates:
+        paths_to_convert = _RemoveDuplicates(paths_to_convert, stats)
     # TODO (perhaps): look for a 'background rectangle' and remove
     if options.subdiv_kind == "EVEN":
         _SetEvenLength(options, paths_to_convert)
+    if options.scaled_side_target > 0.0 and \
+            (options.subdiv_kind == "TOLERANCE" or \
+            options.simplify_tolerance > 0.0):
+        options = _ArtUnitsOptions(options, paths_to_convert)
     if options.combine_paths:
+        allsubpaths = _flatten([p.subpaths for p in paths_to_convert])
+        allfaces = FlattenSubpaths(allsubpaths, options, stats)
         combinedpath = geom.Path()
-        combinedpath.subpaths = _flatten([p.subpaths \
-            for p in paths_to_convert])
-        areas = PathToPolyAreas(combinedpath, options, ans.points)
+        combinedpath.subpaths = allsubpaths
+        areas = _CombinedPathToPolyAreas(combinedpath, options, ans.points,
+            allfaces, stats)
     else:
-        areas = _flatten([PathToPolyAreas(p, options, ans.points) \
-            for p in paths_to_convert])
+        if options.processes > 1 and concurrent is not None and \
+                len(paths_to_convert) > 1:
+            pathareas = _ParallelPathsToPolyAreas(paths_to_convert, options,
+                ans.points, stats)
+        else:
+            pathareas = _PathsToPolyAreas(paths_to_convert, options,
+                ans.points, stats)
+        if options.occlusion != "NONE":
+            pathareas = _RemoveHidden(paths_to_convert, pathareas,
+                options.occlusion == "CLIP", stats)
+        areas = _flatten(pathareas)
     ans.polyareas.extend(areas)
+    if stats is not None:
+        stats.polyareas += len(areas)
+        stats.verts += sum([_NumVerts(pa) for pa in areas])
     return ans
 
 
-def PathToPolyAreas(path, options, points):
+def PathToPolyAreas(path, options, points, faces=None, stats=None):
     """Convert Path object to list of PolyArea, sharing points.
 
     Like ArtToPolyAreas, but for a single Path in Art.
@@ -113,24 +260,752 @@ def PathToPolyAreas(path, options, points):
     Usually only one PolyArea will be in the returned list,
     but there may be zero if the path has zero area,
     and there may be more than one if it contains
-    non-overlapping polygons.
-    (TODO: or if it self-crosses)
+    non-overlapping polygons (or if it crosses itself).
 
     Args:
       path: geom.Path - the path to convert
       options: ConvertOptions
       points: geom.Points - use this shared points for all areas
+      faces: list of list of coord tuples - if given, the already
+        flattened subpaths (see FlattenSubpaths)
+      stats: ConvertStats - if given, counts are added to this
     Returns:
       list of geom.PolyArea
     """
 
+    if faces is None:
+        faces = FlattenSubpaths(path.subpaths, options)
     subpolyareas = [
-        _SubpathToPolyArea(sp, options, points, path.fillpaint.color) \
-        for sp in path.subpaths]
+        _SubpathToPolyArea(sp, options, points, path.fillpaint.color,
+        faces[i], not options.use_fill_rules) \
+        for i, sp in enumerate(path.subpaths)]
     subpolyareas = [pa for pa in subpolyareas if len(pa.poly) > 0]
+    if options.use_fill_rules:
+        if options.simplify_tolerance > 0.0:
+            _SimplifyPolyAreas(subpolyareas, options.simplify_tolerance,
+                stats)
+        ans = polybool.FillRings([pa.poly for pa in subpolyareas], points,
+            path.fillevenodd)
+        for pa in ans:
+            pa.data = path.fillpaint.color
+        return ans
+    subpolyareas = _SplitSelfCrossings(subpolyareas, path.fillevenodd)
+    if options.simplify_tolerance > 0.0:
+        _SimplifyPolyAreas(subpolyareas, options.simplify_tolerance, stats)
     return CombineSimplePolyAreas(subpolyareas)
 
 
+def _PathsToPolyAreas(paths, options, points, stats=None):
+    """Convert each of paths to a list of PolyArea, sharing points.
+
+    All the subpaths are flattened together first (see FlattenSubpaths).
+
+    Args:
+      paths: list of geom.Path
+      options: ConvertOptions
+      points: geom.Points - use this shared points for all areas
+      stats: ConvertStats - if given, counts are added to this
+    Returns:
+      list of list of geom.PolyArea - parallel to paths
+    """
+
+    faces = FlattenSubpaths(_flatten([p.subpaths for p in paths]), options,
+        stats)
+    ans = []
+    i = 0
+    for p in paths:
+        n = len(p.subpaths)
+        ans.append(PathToPolyAreas(p, options, points, faces[i:i + n],
+            stats))
+        i += n
+    return ans
+
+
+def _ParallelPathsToPolyAreas(paths, options, points, stats=None):
+    """Like _PathsToPolyAreas, but using options.processes processes.
+
+    The paths are split into contiguous chunks with about the same
+    number of segments, and each chunk is converted by a worker
+    process with its own Points (see _ConvertChunk).  Then the
+    workers' Points are joined into points in chunk order, which
+    adds the points in the same order as converting in this process
+    would, so the answer (even the vertex numbering) is the same.
+    (Except if points of different paths are nearly but not exactly
+    equal: then a worker uses its own copy of the point, not the
+    first one added, in deciding things like how rings cross.)
+
+    Args:
+      paths: list of geom.Path
+      options: ConvertOptions
+      points: geom.Points - use this shared points for all areas
+      stats: ConvertStats - if given, counts are added to this
+    Returns:
+      list of list of geom.PolyArea - parallel to paths
+    """
+
+    sizes = [sum([len(sp.segments) for sp in p.subpaths]) + 1 \
+        for p in paths]
+    target = sum(sizes) / float(options.processes * _CHUNKS_PER_PROCESS)
+    chunks = []
+    chunk = []
+    size = 0
+    for (p, n) in zip(paths, sizes):
+        chunk.append(p)
+        size += n
+        if size >= target:
+            chunks.append(chunk)
+            (chunk, size) = ([], 0)
+    if chunk:
+        chunks.append(chunk)
+    with concurrent.futures.ProcessPoolExecutor(options.processes) as pool:
+        results = list(pool.map(_ConvertChunk, chunks,
+            [options] * len(chunks)))
+    ans = []
+    for (pos, chunkareas, chunkstats) in results:
+        vmap = _JoinPoints(points, pos)
+        for areas in chunkareas:
+            ans.append([geom.PolyArea(points, [vmap[v] for v in poly],
+                [[vmap[v] for v in hole] for hole in holes], data) \
+                for (poly, holes, data) in areas])
+        if stats is not None:
+            stats.Add(chunkstats)
+    return ans
+
+
+def _ConvertChunk(paths, options):
+    """Convert paths with their own Points, in a worker process.
+
+    Returns:
+      (list of coord tuples, list of list of (poly, holes, data),
+        ConvertStats) - the Points' coordinates, and for each
+        path, its PolyAreas as plain lists and data
+    """
+
+    points = geom.Points()
+    stats = ConvertStats()
+    pathareas = _PathsToPolyAreas(paths, options, points, stats)
+    return (points.pos, [[(pa.poly, pa.holes, pa.data) for pa in areas] \
+        for areas in pathareas], stats)
+
+
+def _JoinPoints(points, pos):
+    """Add the coordinates in pos to points, in order.
+
+    Like points.AddPoints, but if numpy is available the
+    coordinates are quantized all at once.
+
+    Args:
+      points: geom.Points
+      pos: list of coord tuples
+    Returns:
+      list of int - maps indices in pos to vertex numbers in points
+    """
+
+    if numpy is None or not pos:
+        return [points.AddPoint(p) for p in pos]
+    keys = numpy.rint(numpy.array(pos, dtype=float) * geom.INVDISTTOL)
+    invmap = points.invmap
+    vmap = []
+    for (p, qp) in zip(pos, map(tuple, keys.astype(numpy.int64).tolist())):
+        v = invmap.get(qp)
+        if v is None:
+            v = len(points.pos)
+            invmap[qp] = v
+            points.pos.append(p)
+        vmap.append(v)
+    return vmap
+
+
+def _CombinedPathToPolyAreas(path, options, points, faces, stats=None):
+    """Convert a Path made of all the subpaths in an Art.
+
+    Like PathToPolyAreas, but subpaths that overlap without one
+    containing the other are merged, rather than guessing which
+    is a hole of which.  The subpaths are oriented CCW or CW
+    according to their depth in the ContainmentForest, and then
+    the nonzero winding area of the result is found by polybool.
+
+    Args:
+      path: geom.Path - the path to convert
+      options: ConvertOptions
+      points: geom.Points - use this shared points for all areas
+      faces: list of list of coord tuples - the flattened subpaths
+      stats: ConvertStats - if given, counts are added to this
+    Returns:
+      list of geom.PolyArea
+    """
+
+    subpolyareas = [
+        _SubpathToPolyArea(sp, options, points, path.fillpaint.color,
+        faces[i]) for i, sp in enumerate(path.subpaths)]
+    subpolyareas = [pa for pa in subpolyareas if len(pa.poly) > 0]
+    subpolyareas = _SplitSelfCrossings(subpolyareas, path.fillevenodd)
+    if options.simplify_tolerance > 0.0:
+        _SimplifyPolyAreas(subpolyareas, options.simplify_tolerance, stats)
+    (parent, _) = ContainmentForest(subpolyareas)
+    depth = [None] * len(subpolyareas)
+    for i in range(len(subpolyareas)):
+        chain = []
+        j = i
+        while j is not None and depth[j] is None:
+            chain.append(j)
+            j = parent[j]
+        d = -1 if j is None else depth[j]
+        for j in reversed(chain):
+            d += 1
+            depth[j] = d
+    rings = [pa.poly if depth[i] % 2 == 0 else pa.poly[::-1] \
+        for i, pa in enumerate(subpolyareas)]
+    ans = polybool.FillRings(rings, points)
+    for pa in ans:
+        pa.data = path.fillpaint.color
+    return ans
+
+
+def _SplitSelfCrossings(subpolyareas, evenodd):
+    """Replace PolyAreas whose polys cross themselves by simple ones.
+
+    A self-crossing poly (like a figure 8) can't be triangulated
+    properly, and confuses the finding of holes, so it is replaced
+    by the simple CCW rings bounding the area it fills by itself
+    (see polybool.SimpleRings).
+
+    Args:
+      subpolyareas: list of geom.PolyArea - without holes
+      evenodd: bool - fill rule to use for a self-overlapping poly
+    Returns:
+      list of geom.PolyArea - without holes, with simple polys
+    """
+
+    ans = []
+    for pa in subpolyareas:
+        rings = polybool.SimpleRings(pa.poly, pa.points, evenodd)
+        if len(rings) == 1 and rings[0] is pa.poly:
+            ans.append(pa)
+            continue
+        for ring in rings:
+            ans.append(geom.PolyArea(pa.points, ring, data=pa.data))
+    return ans
+
+
+def _SimplifyPolyAreas(subpolyareas, tolerance, stats):
+    """Remove vertices from the polys of PolyAreas, within tolerance.
+
+    The polys are all simplified together (see _SimplifyRings),
+    so that none comes to cross another.  The polys are changed
+    in place.
+
+    Args:
+      subpolyareas: list of geom.PolyArea - without holes,
+        sharing one Points
+      tolerance: float - how far the boundaries may move
+      stats: ConvertStats - if not None, counts are added to this
+    """
+
+    if not subpolyareas:
+        return
+    rings = _SimplifyRings([pa.poly for pa in subpolyareas],
+        subpolyareas[0].points, tolerance)
+    for (pa, ring) in zip(subpolyareas, rings):
+        if stats is not None:
+            stats.simplified_verts += len(pa.poly) - len(ring)
+        pa.poly = ring
+
+
+def _SimplifyRings(rings, points, tolerance):
+    """Simplify rings, keeping them within tolerance and uncrossed.
+
+    This is Visvalingam-Whyatt style vertex removal, least important
+    vertex first, but with a Douglas-Peucker style measure of
+    importance: the distance from the new edge that replaces a vertex
+    to the farthest of the original vertices it replaces.  So no
+    original vertex ends up farther than tolerance from the result.
+
+    A vertex is only removed if no other vertex (of any ring) is in
+    or on the triangle it cuts off, which keeps simple, uncrossed
+    rings simple and uncrossed; if a ring would shrink below three
+    vertices or have its area change sign, the vertex stays too.
+    Vertices used more than once (where rings touch) are kept.
+    A grid of the vertices finds those near each triangle.
+
+    Args:
+      rings: list of list of int - vertex indices into points
+      points: geom.Points
+      tolerance: float - maximum distance an original vertex may
+        be from the simplified boundary
+    Returns:
+      list of list of int - the simplified rings, parallel to rings
+    """
+
+    pos = points.pos
+    uses = collections.Counter([v for ring in rings for v in ring])
+    coords = [pos[v] for ring in rings for v in ring]
+    if not coords:
+        return rings
+    # cells about twice the average edge length
+    perimeter = 0.0
+    for ring in rings:
+        n = len(ring)
+        for i in range(n):
+            perimeter += geom.VecLen(geom.VecSub(pos[ring[i]],
+                pos[ring[i - 1]]))
+    cell = max(2.0 * perimeter / len(coords), tolerance, geom.DISTTOL)
+    grid = dict()
+    for (r, ring) in enumerate(rings):
+        for (i, v) in enumerate(ring):
+            (x, y) = pos[v]
+            grid.setdefault((int(x // cell), int(y // cell)),
+                []).append((r, i))
+    alive = [[True] * len(ring) for ring in rings]
+    prv = [[i - 1 if i > 0 else len(ring) - 1 for i in range(len(ring))] \
+        for ring in rings]
+    nxt = [[(i + 1) % len(ring) for i in range(len(ring))] \
+        for ring in rings]
+    count = [len(ring) for ring in rings]
+    area = [geom.SignedArea(ring, points) if len(ring) >= 3 else 0.0 \
+        for ring in rings]
+    stamp = [[0] * len(ring) for ring in rings]
+
+    def Error(r, i):
+        # farthest distance from the vertices between prv and nxt
+        # (including i) to the segment from prv to nxt
+        ring = rings[r]
+        (a, b) = (prv[r][i], nxt[r][i])
+        (pa, pb) = (pos[ring[a]], pos[ring[b]])
+        ans = 0.0
+        j = i
+        while j != b:
+            ans = max(ans, _SegDist(pos[ring[j]], pa, pb))
+            j = (j + 1) % len(ring)
+        j = (a + 1) % len(ring)
+        while j != i:
+            ans = max(ans, _SegDist(pos[ring[j]], pa, pb))
+            j = (j + 1) % len(ring)
+        return ans
+
+    heap = []
+    for (r, ring) in enumerate(rings):
+        if count[r] <= 3:
+            continue
+        for i in range(len(ring)):
+            if uses[ring[i]] == 1:
+                heap.append((Error(r, i), r, i, 0))
+    heapq.heapify(heap)
+    while heap:
+        (err, r, i, st) = heapq.heappop(heap)
+        if err > tolerance:
+            break
+        if not alive[r][i] or st != stamp[r][i] or count[r] <= 3:
+            continue
+        ring = rings[r]
+        (a, b) = (prv[r][i], nxt[r][i])
+        (pa, pv, pb) = (pos[ring[a]], pos[ring[i]], pos[ring[b]])
+        cut = 0.5 * _Cross(pa, pv, pb)
+        newarea = area[r] - cut
+        if newarea == 0.0 or (newarea > 0.0) != (area[r] > 0.0):
+            continue
+        if not _TriangleEmpty(pa, pv, pb, (ring[a], ring[i], ring[b]),
+                grid, cell, rings, alive, pos):
+            continue
+        alive[r][i] = False
+        count[r] -= 1
+        area[r] = newarea
+        nxt[r][a] = b
+        prv[r][b] = a
+        for j in (a, b):
+            if uses[ring[j]] == 1:
+                stamp[r][j] += 1
+                heapq.heappush(heap, (Error(r, j), r, j, stamp[r][j]))
+    return [[v for (i, v) in enumerate(ring) if alive[r][i]] \
+        for (r, ring) in enumerate(rings)]
+
+
+def _TriangleEmpty(a, b, c, corners, grid, cell, rings, alive, pos):
+    """Return True if no live vertex is in or on triangle abc.
+
+    Vertices at the triangle's corners (those whose indices
+    are in corners) don't count.
+    """
+
+    (minx, maxx) = (min(a[0], b[0], c[0]), max(a[0], b[0], c[0]))
+    (miny, maxy) = (min(a[1], b[1], c[1]), max(a[1], b[1], c[1]))
+    for col in range(int(minx // cell), int(maxx // cell) + 1):
+        for row in range(int(miny // cell), int(maxy // cell) + 1):
+            for (s, j) in grid.get((col, row), []):
+                v = rings[s][j]
+                if not alive[s][j] or v in corners:
+                    continue
+                p = pos[v]
+                if p[0] < minx or p[0] > maxx or p[1] < miny or \
+                        p[1] > maxy:
+                    continue
+                d1 = _Cross(a, b, p)
+                d2 = _Cross(b, c, p)
+                d3 = _Cross(c, a, p)
+                if not ((d1 < 0.0 or d2 < 0.0 or d3 < 0.0) and \
+                        (d1 > 0.0 or d2 > 0.0 or d3 > 0.0)):
+                    return False
+    return True
+
+
+def _Cross(a, b, c):
+    """Return twice the signed area of triangle abc."""
+
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _SegDist(p, a, b):
+    """Return the distance from point p to segment ab."""
+
+    (dx, dy) = (b[0] - a[0], b[1] - a[1])
+    d2 = dx * dx + dy * dy
+    if d2 == 0.0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / d2))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+def _RemoveDuplicates(paths, stats):
+    """Return paths, less those whose geometry is repeated.
+
+    Paths are grouped by _PathKey, and only one of each group is kept:
+    the last filled one in paint order (it is painted over the others,
+    so its color is the one seen), or the last one if none are filled.
+
+    Args:
+      paths: list of geom.Path - in paint order
+      stats: ConvertStats - if not None, counts are added to this
+    Returns:
+      list of geom.Path - the kept paths, still in paint order
+    """
+
+    groups = dict()
+    for (i, p) in enumerate(paths):
+        groups.setdefault(_PathKey(p), []).append(i)
+    if len(groups) == len(paths):
+        return paths
+    keep = set()
+    for group in groups.values():
+        filled = [i for i in group if paths[i].filled]
+        k = filled[-1] if filled else group[-1]
+        keep.add(k)
+        if stats is not None:
+            stats.duplicate_paths += len(group) - 1
+            stats.stroke_duplicate_paths += len([i for i in group \
+                if i != k and not paths[i].filled])
+    return [p for (i, p) in enumerate(paths) if i in keep]
+
+
+def _PathKey(path):
+    """Return a hashable key for the geometry of a Path.
+
+    The key packs the path's fill rule and, for each subpath, whether
+    it is closed and its segments, with coordinates rounded to
+    multiples of geom.DISTTOL; so paths differing only by less than
+    that (barring rounding across a boundary) get the same key.
+    Whether the path is filled or stroked, and its paints, are not
+    part of the key.
+    """
+
+    q = geom.INVDISTTOL
+    key = [path.fillevenodd]
+    for sp in path.subpaths:
+        key.append(sp.closed)
+        for seg in sp.segments:
+            key.append(seg[0])
+            if seg[0] == "A":
+                (a, b, rad, xrot, large, ccw) = seg[1:]
+                coords = (a, b, rad)
+                key.extend([int(round(xrot * q)), large, ccw])
+            else:
+                coords = seg[1:]
+            for c in coords:
+                key.append(int(round(c[0] * q)))
+                key.append(int(round(c[1] * q)))
+    return tuple(key)
+
+
+def _RemoveHidden(paths, pathareas, clip, stats):
+    """Drop (or clip) PolyAreas hidden under later filled paths.
+
+    Goes through the paths in reverse paint order, keeping a grid
+    index of the areas of filled paths seen so far, which are
+    the ones painted over the current path.  For each area,
+    the index gives the areas whose bounding boxes overlap it,
+    and then polybool finds what is left of it when those
+    (clipped to near its bounding box) are taken away, unless one
+    of them plainly contains it (see _CoveredBy).
+    An area is hidden if what is left is no more than a sliver
+    along its boundary.  When not clipping, a quick check of whether
+    some vertex of the area is clear of all the overlapping
+    areas saves the boolean operation for most visible areas.
+
+    Args:
+      paths: list of geom.Path - in paint order
+      pathareas: list of list of geom.PolyArea - the areas for each path
+      clip: bool - if True, cut hidden parts out of partly hidden areas
+      stats: ConvertStats - if not None, counts are added to this
+    Returns:
+      list of list of geom.PolyArea - the areas left for each path
+    """
+
+    boxes = [[_PolyBounds(pa) for pa in pas] for pas in pathareas]
+    grid = _BoxGrid(_flatten(boxes))
+    regions = dict()
+    ans = [None] * len(paths)
+    for i in reversed(range(len(paths))):
+        kept = []
+        for (pa, box) in zip(pathareas[i], boxes[i]):
+            covers = grid.Overlapping(box)
+            if covers:
+                left = _Unhidden(pa, covers, clip, regions)
+            else:
+                left = [pa]
+            if stats is not None and left != [pa]:
+                if left:
+                    stats.clipped_polyareas += 1
+                else:
+                    stats.hidden_polyareas += 1
+                stats.hidden_verts += _NumVerts(pa) - \
+                    sum([_NumVerts(q) for q in left])
+            kept.extend(left)
+        if paths[i].filled:
+            for pa in kept:
+                grid.Add(_PolyBounds(pa), pa)
+        ans[i] = kept
+    return ans
+
+
+def _Unhidden(pa, covers, clip, regions):
+    """Return what is left of PolyArea pa when covers are painted over it.
+
+    Args:
+      pa: geom.PolyArea
+      covers: list of geom.PolyArea - areas that may overlap pa
+      clip: bool - if False, pa is returned unless it is all hidden
+      regions: dict - cache for _RegionRings
+    Returns:
+      list of geom.PolyArea - [pa] if it isn't hidden (or, if clip,
+        if nothing of it is hidden), [] if it is all hidden,
+        else the parts that aren't hidden
+    """
+
+    pos = pa.points.pos
+    box = _PolyBounds(pa)
+    for c in covers:
+        if _CoveredBy(pa, box, c):
+            return []
+    if not clip:
+        # extreme vertices first, as they are the likeliest to be clear
+        order = []
+        for k in range(2):
+            order.append(min(pa.poly, key=lambda v: pos[v][k]))
+            order.append(max(pa.poly, key=lambda v: pos[v][k]))
+        order.extend(pa.poly)
+        cboxes = [_PolyBounds(c) for c in covers]
+        seen = set()
+        for v in order:
+            if v in seen:
+                continue
+            seen.add(v)
+            p = pos[v]
+            if all([not (b[0] <= p[0] <= b[2] and b[1] <= p[1] <= b[3]) \
+                    or not _InsidePolyArea(p, c) \
+                    for (b, c) in zip(cboxes, covers)]):
+                return [pa]
+    rings = [pa.poly] + pa.holes
+    occluders = []
+    for c in covers:
+        occluders.extend(_RegionRings(c, regions))
+    # only the parts of the occluders near pa matter
+    (minx, miny, maxx, maxy) = box
+    margin = max(maxx - minx, maxy - miny) * 0.01 + 10.0 * geom.DISTTOL
+    occluders = polybool.ClipToBox(occluders, (minx - margin,
+        miny - margin, maxx + margin, maxy + margin), pa.points)
+    left = polybool.Difference(rings, occluders, pa.points)
+    perimeter = 0.0
+    for ring in rings:
+        n = len(ring)
+        for j in range(n):
+            perimeter += geom.VecLen(geom.VecSub(pos[ring[(j + 1) % n]],
+                pos[ring[j]]))
+    leftarea = sum([_PolyAreaArea(q) for q in left])
+    slop = geom.DISTTOL * perimeter
+    if leftarea <= slop:
+        return []
+    if not clip or leftarea >= _PolyAreaArea(pa) - slop:
+        return [pa]
+    for q in left:
+        q.data = pa.data
+    return left
+
+
+def _RegionRings(pa, regions):
+    """Return rings whose nonzero winding area is that of PolyArea pa.
+
+    Holes found by CombineSimplePolyAreas may stick out of the poly,
+    so just using the poly and holes would make negative windings,
+    cancelling out other areas when several are used as one
+    operand in polybool.  So, for a PolyArea with holes, the
+    holes are taken away from the poly properly (once,
+    remembering the answer in regions).
+
+    Args:
+      pa: geom.PolyArea
+      regions: dict - maps id(pa) to answer, for pas done already
+    Returns:
+      list of list of int - rings
+    """
+
+    if not pa.holes:
+        return [pa.poly]
+    ans = regions.get(id(pa))
+    if ans is None:
+        ans = []
+        for q in polybool.Difference([pa.poly], pa.holes, pa.points):
+            ans.append(q.poly)
+            ans.extend(q.holes)
+        regions[id(pa)] = ans
+    return ans
+
+
+def _CoveredBy(pa, box, c):
+    """Return True if PolyArea pa is plainly inside PolyArea c.
+
+    This is a quick, conservative test: all of pa's vertices must be
+    strictly inside c's poly, and no edge of c (nor any hole of c)
+    may come near pa's bounding box, box.  Then no boundary of c
+    crosses pa, so pa is all inside c.
+    """
+
+    tol = geom.DISTTOL
+    (minx, miny, maxx, maxy) = (box[0] - tol, box[1] - tol,
+        box[2] + tol, box[3] + tol)
+    for hole in c.holes:
+        hbox = _RingBounds(hole, c.points)
+        if hbox[0] <= maxx and hbox[2] >= minx and \
+                hbox[1] <= maxy and hbox[3] >= miny:
+            return False
+    cpos = c.points.pos
+    ring = c.poly
+    n = len(ring)
+    for j in range(n):
+        if not _SegMissesBox(cpos[ring[j - 1]], cpos[ring[j]],
+                minx, miny, maxx, maxy):
+            return False
+    pos = pa.points.pos
+    for v in pa.poly:
+        if geom.PointInside(pos[v], ring, c.points) <= 0:
+            return False
+    return True
+
+
+def _SegMissesBox(a, b, minx, miny, maxx, maxy):
+    """Return True if segment ab doesn't meet the given box."""
+
+    if (a[0] < minx and b[0] < minx) or (a[0] > maxx and b[0] > maxx) or \
+            (a[1] < miny and b[1] < miny) or (a[1] > maxy and b[1] > maxy):
+        return True
+    # else the segment's box meets the box; it misses if all the
+    # box corners are strictly on one side of the segment's line
+    (dx, dy) = (b[0] - a[0], b[1] - a[1])
+    sides = [dx * (y - a[1]) - dy * (x - a[0]) for (x, y) in \
+        ((minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy))]
+    return all([s > 0.0 for s in sides]) or all([s < 0.0 for s in sides])
+
+
+def _RingBounds(ring, points):
+    """Return (minx, miny, maxx, maxy) of the vertices of ring."""
+
+    xs = [points.pos[v][0] for v in ring]
+    ys = [points.pos[v][1] for v in ring]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _InsidePolyArea(p, pa):
+    """Return True if point p is inside or on PolyArea pa."""
+
+    if geom.PointInside(p, pa.poly, pa.points) < 0:
+        return False
+    for hole in pa.holes:
+        if geom.PointInside(p, hole, pa.points) > 0:
+            return False
+    return True
+
+
+def _PolyAreaArea(pa):
+    """Return the area of PolyArea pa (with CCW poly and CW holes)."""
+
+    return geom.SignedArea(pa.poly, pa.points) + \
+        sum([geom.SignedArea(h, pa.points) for h in pa.holes])
+
+
+def _NumVerts(pa):
+    return len(pa.poly) + sum([len(h) for h in pa.holes])
+
+
+class _BoxGrid(object):
+    """A uniform grid of cells, each listing the boxes overlapping it.
+
+    Attributes:
+      minx, miny: float - lower left of the grid
+      cell: float - side of each (square) cell
+      cells: dict - maps (column, row) to list of (box, item)
+    """
+
+    def __init__(self, boxes):
+        """Make an empty grid suitable for holding boxes like these.
+
+        The cell size is chosen so that a typical box
+        overlaps only a few cells, but no box overlaps more than
+        about _MAX_GRID_SIDE squared of them.
+        """
+
+        self.cells = dict()
+        if not boxes:
+            (self.minx, self.miny, self.cell) = (0.0, 0.0, 1.0)
+            return
+        self.minx = min([b[0] for b in boxes])
+        self.miny = min([b[1] for b in boxes])
+        extent = max(max([b[2] for b in boxes]) - self.minx,
+            max([b[3] for b in boxes]) - self.miny)
+        sides = sorted([max(b[2] - b[0], b[3] - b[1]) for b in boxes])
+        self.cell = max(sides[len(sides) // 2], extent / _MAX_GRID_SIDE,
+            geom.DISTTOL)
+
+    def _Range(self, box):
+        c = self.cell
+        return (int((box[0] - self.minx) // c), int((box[1] - self.miny) // c),
+            int((box[2] - self.minx) // c), int((box[3] - self.miny) // c))
+
+    def Add(self, box, item):
+        """Add item, with bounding box box, to the grid."""
+
+        (c0, r0, c1, r1) = self._Range(box)
+        for col in range(c0, c1 + 1):
+            for row in range(r0, r1 + 1):
+                self.cells.setdefault((col, row), []).append((box, item))
+
+    def Overlapping(self, box):
+        """Return the items whose boxes overlap box (within DISTTOL)."""
+
+        tol = geom.DISTTOL
+        (c0, r0, c1, r1) = self._Range((box[0] - tol, box[1] - tol,
+            box[2] + tol, box[3] + tol))
+        ans = []
+        seen = set()
+        for col in range(c0, c1 + 1):
+            for row in range(r0, r1 + 1):
+                for (b, item) in self.cells.get((col, row), []):
+                    if id(item) in seen:
+                        continue
+                    if b[0] <= box[2] + tol and b[2] >= box[0] - tol and \
+                            b[1] <= box[3] + tol and b[3] >= box[1] - tol:
+                        seen.add(id(item))
+                        ans.append(item)
+        return ans
+
+
 def CombineSimplePolyAreas(subpolyareas):
     """Combine PolyAreas without holes into ones that may have holes.
 
@@ -140,6 +1015,10 @@ def CombineSimplePolyAreas(subpolyareas):
     The argument PolyAreas may be reused an modified in forming
     the result.
 
+    The nesting is found by ContainmentForest.  The roots of the
+    forest, and everything at an even depth below them, are boundaries;
+    the children of a boundary are its holes.
+
     Args:
       subpolyareas: list of geom.PolyArea
     Returns:
@@ -147,50 +1026,125 @@ def CombineSimplePolyAreas(subpolyareas):
     """
 
     n = len(subpolyareas)
-    areas = [geom.SignedArea(pa.poly, pa.points) for pa in subpolyareas]
-    lens = list(map(lambda x: len(x.poly), subpolyareas))
-    cls = dict()
-    for i in range(n):
-        for j in range(n):
-            cls[(i, j)] = _ClassifyPathPairs(subpolyareas[i], subpolyareas[j])
-    # calculate set cont where (i,j) is in cont if
-    # subpolyareas[i] contains subpolyareas[j]
-    cont = set()
-    for i in range(n):
-        for j in range(n):
-            if i != j and _Contains(i, j, areas, lens, cls):
-                cont.add((i, j))
-    # now make real PolyAreas, with holes assigned
+    (parent, children) = ContainmentForest(subpolyareas)
+    # Walk down from the roots, finding the boundaries.
+    # Order them as they have always come out: in rounds, where a
+    # boundary nested inside a hole of boundary g is found in the
+    # same round as g if it comes after g in subpolyareas,
+    # else in the next round.
+    order = []
+    stack = [(i, 0) for i in range(n) if parent[i] is None]
+    while stack:
+        (i, rnd) = stack.pop()
+        order.append((rnd, i))
+        for h in children[i]:
+            for j in children[h]:
+                stack.append((j, rnd + 1 if j < i else rnd))
+    order.sort()
     polyareas = []
-    assigned = set()
-    count = 0
-    while len(assigned) < n and count < n:
-        for i in range(n):
-            if i in assigned:
-                continue
-            if _IsBoundary(i, n, cont, assigned):
-                # have a new boundary area, i
-                assigned.add(i)
-                holes = _GetHoles(i, n, cont, assigned)
-                pa = subpolyareas[i]
-                for j in holes:
-                    pa.AddHole(subpolyareas[j])
-                polyareas.append(pa)
-        count += 1
-    if len(assigned) < n:
+    assigned = 0
+    for (_, i) in order:
+        pa = subpolyareas[i]
+        for j in children[i]:
+            pa.AddHole(subpolyareas[j])
+        polyareas.append(pa)
+        assigned += 1 + len(children[i])
+    if assigned < n:
         # shouldn't happen
         print("Whoops, PathToPolyAreas didn't assign all")
     return polyareas
 
 
-def _SubpathToPolyArea(subpath, options, points, color=(0.0, 0.0, 0.0)):
+def ContainmentForest(subpolyareas):
+    """Find how the polys of some PolyAreas nest inside each other.
+
+    Poly i contains poly j if most of j's vertices are inside i
+    (see _Contains).  The parent of j is the smallest-area poly
+    that contains it, or None if no poly contains it.
+
+    Only pairs whose bounding boxes overlap can contain one another,
+    so the candidate pairs are found with a sweep over the bounding
+    boxes in order of increasing minimum x, and the vertex
+    classification (_ClassifyPathPairs) is only done for those pairs.
+    That makes many small, separate polys (text, halftone dots)
+    cheap to sort out.
+
+    Args:
+      subpolyareas: list of geom.PolyArea - only the poly's are used
+    Returns:
+      (list of int or None, list of list of int) -
+          parent index for each poly, and list of child indices
+          for each poly (in increasing order)
+    """
+
+    n = len(subpolyareas)
+    areas = [geom.SignedArea(pa.poly, pa.points) for pa in subpolyareas]
+    lens = [len(pa.poly) for pa in subpolyareas]
+    boxes = [_PolyBounds(pa) for pa in subpolyareas]
+    cls = _PairClassifier(subpolyareas)
+    # containers[j] is list of i such that poly i contains poly j
+    containers = [[] for j in range(n)]
+    active = []
+    for i in sorted(range(n), key=lambda k: boxes[k][0]):
+        (minx, miny, maxx, maxy) = boxes[i]
+        active = [a for a in active if boxes[a][2] >= minx]
+        for a in active:
+            if boxes[a][1] > maxy or boxes[a][3] < miny:
+                continue
+            if _Contains(a, i, areas, lens, cls):
+                containers[i].append(a)
+            elif _Contains(i, a, areas, lens, cls):
+                containers[a].append(i)
+        active.append(i)
+    parent = [None] * n
+    children = [[] for i in range(n)]
+    for j in range(n):
+        if containers[j]:
+            p = min(containers[j], key=lambda i: (abs(areas[i]), i))
+            parent[j] = p
+            children[p].append(j)
+    return (parent, children)
+
+
+def _PolyBounds(pa):
+    """Return the bounding box of the poly of PolyArea pa.
+
+    Returns:
+      (minx, miny, maxx, maxy) - all floats
+    """
+
+    pos = pa.points.pos
+    xs = [pos[v][0] for v in pa.poly]
+    ys = [pos[v][1] for v in pa.poly]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+class _PairClassifier(dict):
+    """Maps pairs (i, j) to _ClassifyPathPairs of polyareas i and j.
+
+    Entries are calculated when first looked up.
+    """
+
+    def __init__(self, polyareas):
+        dict.__init__(self)
+        self.polyareas = polyareas
+
+    def __missing__(self, key):
+        (i, j) = key
+        ans = _ClassifyPathPairs(self.polyareas[i], self.polyareas[j])
+        self[key] = ans
+        return ans
+
+
+def _SubpathToPolyArea(subpath, options, points, color=(0.0, 0.0, 0.0),
+        face=None, force_ccw=True):
     """Return a PolyArea representing a single subpath.
 
     Converts curved segments into approximating line
     segments.
     For 'EVEN' subdiv_kind, divides lines too.
     Ignores zero-length or near zero-length segments.
-    Ensures that face is CCW-oriented.
+    Ensures that face is CCW-oriented, unless force_ccw is False.
     Use the data field of the PolyArea to hold the filling color.
 
     Args:
@@ -198,40 +1152,19 @@ def _SubpathToPolyArea(subpath, options, points, color=(0.0, 0.0, 0.0)):
       options: ConvertOptions
       points: geom.Points - used this shared Points for area
       color: (float, float, float) - rgb of filling color
+      face: list of coord tuples - if given, subpath already
+        flattened by FlattenSubpaths
+      force_ccw: bool - if False, keep the subpath's orientation
+        (which matters for the nonzero fill rule)
     Returns:
       geom.PolyArea
     """
 
-    face = []
-    prev = None
+    if face is None:
+        face = FlattenSubpaths([subpath], options)[0]
     ans = geom.PolyArea()
     ans.points = points
     ans.data = color
-    for seg in subpath.segments:
-        (ty, start, end) = seg[0:3]
-        if not prev or prev != start:
-            face.append(start)
-        if ty == "L":
-            if options.subdiv_kind == "EVEN":
-                lines = _EvenLineDivide(start, end, options)
-                face.extend(lines[1:])
-            else:
-                face.append(end)
-            prev = end
-        elif ty == "B":
-            approx = Bezier3Approx([start, seg[3], seg[4], end], options)
-            # first point of approx should be current end of face
-            face.extend(approx[1:])
-            prev = end
-        elif ty == "Q":
-            print("unimplemented segment type Q")
-        elif ty == "A":
-            approx = ArcApprox(start, end, seg[3], seg[4], seg[5], seg[6],
-                options)
-            face.extend(approx[1:])
-            prev = end
-        else:
-            print("unexpected segment type", ty)
     # now make a cleaned face in a new PolyArea
     # with no two successive points approximately equal
     if len(face) <= 2:
@@ -247,11 +1180,226 @@ def _SubpathToPolyArea(subpath, options, points, color=(0.0, 0.0, 0.0)):
         ans.poly.append(newindex)
         previndex = newindex
     # make sure that face is CCW oriented
-    if geom.SignedArea(ans.poly, ans.points) < 0.0:
+    if force_ccw and geom.SignedArea(ans.poly, ans.points) < 0.0:
         ans.poly.reverse()
     return ans
 
 
+def FlattenSubpaths(subpaths, options, stats=None):
+    """Approximate subpaths by polygons, according to options.
+
+    Curved segments are replaced by approximating line segments,
+    and for 'EVEN' subdiv_kind, lines are divided too.
+    All the cubic beziers of all the subpaths are approximated
+    together, as are all the elliptical arcs, so that when numpy
+    is available they can be evaluated as batches
+    (see _BatchBezier3Approx and _BatchArcApprox).
+    Subpaths that are just a full ellipse made of equal arcs (as
+    made for SVG circle and ellipse elements) are done from a table
+    of points on the unit circle (see _FullEllipsesApprox).
+    Beziers and arcs that are the same, up to translation, as ones
+    flattened before are taken from the flattening cache
+    (see _FlattenCache) instead of being done again.
+
+    Args:
+      subpaths: list of geom.Subpath
+      options: ConvertOptions
+      stats: ConvertStats - if given, cache counts are added to this
+    Returns:
+      list of list of coord tuples - parallel to subpaths, each
+        the (implicitly closed) polygon approximating that subpath
+    """
+
+    cpslist = [(seg[1], seg[3], seg[4], seg[2]) \
+        for sp in subpaths for seg in sp.segments if seg[0] == "B"]
+    optkey = _FlattenOptionsKey(options)
+    bezapprox = iter(_CachedApprox(
+        [("B", optkey, _RelativeKey(cps[0], cps[1:])) for cps in cpslist],
+        [(cps[0], cps[3]) for cps in cpslist],
+        lambda indices: _BatchBezier3Approx([cpslist[i] for i in indices],
+            options), stats))
+    arcparams = iter(_ArcCenterParamsList([seg \
+        for sp in subpaths for seg in sp.segments if seg[0] == "A"]))
+    ellipses = []
+    ellipseindex = dict()
+    arcs = []
+    for i, subpath in enumerate(subpaths):
+        params = [next(arcparams) \
+            for seg in subpath.segments if seg[0] == "A"]
+        ell = _FullEllipseParams(subpath, params, options)
+        if ell:
+            ellipseindex[i] = len(ellipses)
+            ellipses.append(ell)
+        else:
+            arcs.extend(zip([seg for seg in subpath.segments \
+                if seg[0] == "A"], params))
+    ellipseapprox = _FullEllipsesApprox(ellipses)
+    arcapprox = iter(_CachedApprox(
+        [("A", optkey, _RelativeKey(seg[1], (seg[2],)),
+            _RelativeKey((0.0, 0.0), (seg[3],)), seg[4:]) \
+            for (seg, _) in arcs],
+        [(seg[1], seg[2]) for (seg, _) in arcs],
+        lambda indices: _BatchArcApprox([arcs[i] for i in indices],
+            options), stats))
+    faces = []
+    for i, subpath in enumerate(subpaths):
+        if i in ellipseindex:
+            faces.append(ellipseapprox[ellipseindex[i]])
+            continue
+        face = []
+        prev = None
+        for seg in subpath.segments:
+            (ty, start, end) = seg[0:3]
+            if not prev or prev != start:
+                face.append(start)
+            if ty == "L":
+                if options.subdiv_kind == "EVEN":
+                    lines = _EvenLineDivide(start, end, options)
+                    face.extend(lines[1:])
+                else:
+                    face.append(end)
+                prev = end
+            elif ty == "B":
+                approx = next(bezapprox)
+                # first point of approx should be current end of face
+                face.extend(approx[1:])
+                prev = end
+            elif ty == "Q":
+                print("unimplemented segment type Q")
+            elif ty == "A":
+                approx = next(arcapprox)
+                face.extend(approx[1:])
+                prev = end
+            else:
+                print("unexpected segment type", ty)
+        faces.append(face)
+    return faces
+
+
+class _FlattenCache(object):
+    """A least-recently-used cache of flattened curve segments.
+
+    The flattening of a segment is remembered as the offsets of its
+    points after the first from its start point, so that it can
+    be used for any translated copy of the segment.
+
+    Attributes:
+      size: int - maximum number of entries
+      entries: collections.OrderedDict - maps keys to lists of
+        offset tuples, least recently used first
+      evictions: int - number of entries dropped so far
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.evictions = 0
+
+    def Get(self, key):
+        """Return the offsets for key (marking it recently used), or None."""
+
+        ans = self.entries.get(key)
+        if ans is not None:
+            self.entries.move_to_end(key)
+        return ans
+
+    def Put(self, key, offsets):
+        """Remember offsets for key, dropping the oldest entry if full.
+
+        Returns:
+          int - number of entries dropped (0 or 1)
+        """
+
+        self.entries[key] = offsets
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+            return 1
+        return 0
+
+
+_flatten_cache = _FlattenCache(_FLATTEN_CACHE_SIZE)
+
+
+def _CachedApprox(keys, ends, compute, stats):
+    """Approximate curve segments, using the flattening cache.
+
+    Segments whose keys are in the cache, or repeat the key of an
+    earlier segment in this batch, are not computed again; the
+    others are computed in one batch and added to the cache.
+    Each answer starts and ends at its segment's exact end points.
+
+    Args:
+      keys: list of hashable - for each segment, a key that is the
+        same for segments that are the same up to translation
+        (see _RelativeKey) and flattened with the same options
+      ends: list of (coord tuple, coord tuple) - parallel to keys,
+        the start and end points of the segments
+      compute: function - given a list of indices into keys,
+        returns the approximations of those segments, as lists
+        of coord tuples
+      stats: ConvertStats - if not None, counts are added to this
+    Returns:
+      list of list of coord tuples - parallel to keys
+    """
+
+    found = [_flatten_cache.Get(key) for key in keys]
+    todo = dict()
+    for (i, key) in enumerate(keys):
+        if found[i] is None and key not in todo:
+            todo[key] = i
+    evicted = 0
+    if todo:
+        indices = sorted(todo.values())
+        for (i, approx) in zip(indices, compute(indices)):
+            (x0, y0) = ends[i][0]
+            offsets = [(x - x0, y - y0) for (x, y) in approx[1:]]
+            evicted += _flatten_cache.Put(keys[i], offsets)
+            found[i] = offsets
+    if stats is not None:
+        stats.flatten_cache_misses += len(todo)
+        stats.flatten_cache_hits += len(keys) - len(todo)
+        stats.flatten_cache_evictions += evicted
+    ans = []
+    for (i, key) in enumerate(keys):
+        offsets = found[i]
+        if offsets is None:
+            offsets = found[todo[key]]
+        ((x0, y0), end) = ends[i]
+        approx = [(x0, y0)] + [(x0 + dx, y0 + dy) for (dx, dy) in offsets]
+        if len(approx) > 1:
+            # use the exact end point, so it matches the next segment
+            approx[-1] = end
+        ans.append(approx)
+    return ans
+
+
+def _FlattenOptionsKey(options):
+    """Return a tuple of the options that affect how a curve is flattened."""
+
+    return (options.subdiv_kind, options.smoothness, options.tolerance,
+        getattr(options, "even_length", None))
+
+
+def _RelativeKey(origin, coords):
+    """Return coords relative to origin, rounded to _FLATTEN_QUANTUM.
+
+    Args:
+      origin: (float, float)
+      coords: sequence of (float, float)
+    Returns:
+      tuple of int - the rounded x and y offsets, in order
+    """
+
+    q = 1.0 / _FLATTEN_QUANTUM
+    (x0, y0) = origin
+    ans = []
+    for (x, y) in coords:
+        ans.append(int(round((x - x0) * q)))
+        ans.append(int(round((y - y0) * q)))
+    return tuple(ans)
+
+
 def Bezier3Approx(cps, options):
     """Compute a polygonal approximation to a cubic bezier segment.
 
@@ -266,10 +1414,180 @@ def Bezier3Approx(cps, options):
 
     if options.subdiv_kind == "EVEN":
         return _EvenBezier3Approx(cps, options)
+    elif options.subdiv_kind == "TOLERANCE":
+        return _ToleranceBezier3Approx(cps, options)
     else:
         return _SubdivideBezier3Approx(cps, options, 0)
 
 
+def _BatchBezier3Approx(cpslist, options):
+    """Compute polygonal approximations to many cubic bezier segments.
+
+    The answer is the same as calling Bezier3Approx on each
+    element of cpslist, but for 'UNIFORM', 'TOLERANCE' and 'EVEN'
+    subdivision the parameter values can be found before any points
+    are evaluated, so if numpy is available we evaluate all the segments
+    that need the same number of pieces with one product of their control
+    points with a (cached) matrix of Bernstein basis values.
+    ('EVEN' parameters differ per segment; see _BatchEvenBezier3Approx.)
+
+    Args:
+      cpslist: list of 4-tuples of coord tuples - each is
+          (start, control point 1, control point 2, end)
+      options: ConvertOptions
+    Returns:
+      list of list of tuples (coordinates) - parallel to cpslist,
+          the straight line approximations of the beziers
+    """
+
+    if numpy is None or len(cpslist) == 0 or \
+            options.subdiv_kind not in ("UNIFORM", "EVEN", "TOLERANCE"):
+        return [Bezier3Approx(cps, options) for cps in cpslist]
+    if options.subdiv_kind == "EVEN":
+        return _BatchEvenBezier3Approx(cpslist, options)
+    elif options.subdiv_kind == "TOLERANCE":
+        counts = [_ToleranceBezier3NumSegs(cps, options.tolerance) \
+            for cps in cpslist]
+    else:
+        counts = [2 ** max(options.smoothness, 0)] * len(cpslist)
+    bycount = dict()
+    for i, n in enumerate(counts):
+        if n in bycount:
+            bycount[n].append(i)
+        else:
+            bycount[n] = [i]
+    ans = [None] * len(cpslist)
+    for n, indices in bycount.items():
+        cparray = numpy.array([cpslist[i] for i in indices], dtype=float)
+        # work relative to the start points, so that degenerate
+        # segments (all points the same) come out exactly
+        origins = cparray[:, 0:1, :]
+        ptarray = origins + numpy.einsum('tk,skd->std',
+            _BernsteinBasis(n), cparray - origins)
+        for i, pts in zip(indices, ptarray.tolist()):
+            cps = cpslist[i]
+            # use the exact end points, so they match adjacent segments
+            ans[i] = [cps[0]] + [tuple(p) for p in pts[1:-1]] + [cps[3]]
+    return ans
+
+
+def _BatchEvenBezier3Approx(cpslist, options):
+    """Like _BatchBezier3Approx, for 'EVEN' subdivision.
+
+    The arc length tables of all the segments, the inverse lookups
+    of the equally spaced arc lengths, and the evaluation of the
+    segments at the resulting parameters are each done with
+    array operations over all the segments at once.
+    See _EvenBezier3Approx for the method.
+
+    Args:
+      cpslist: list of 4-tuples of coord tuples - each is
+          (start, control point 1, control point 2, end)
+      options: ConvertOptions
+    Returns:
+      list of list of tuples (coordinates) - parallel to cpslist,
+          the straight line approximations of the beziers
+    """
+
+    nc = len(cpslist)
+    m = ARCLEN_INTERVALS
+    cparray = numpy.array(cpslist, dtype=float)
+    origins = cparray[:, 0:1, :]
+    rel = cparray - origins
+    dcps = 3.0 * (rel[:, 1:, :] - rel[:, :-1, :])
+    # arc length tables: cumulative length at t = j/m, j = 0..m
+    nodes = (numpy.arange(m)[:, None] + 0.5 * (_GLX + 1.0)) / m
+    speeds = _QuadBezierNorms(dcps, nodes.reshape(1, -1))
+    pieces = (speeds.reshape(nc, m, len(_GLX)) * _GLW).sum(axis=2) / (2 * m)
+    table = numpy.zeros((nc, m + 1))
+    numpy.cumsum(pieces, axis=1, out=table[:, 1:])
+    lengths = table[:, -1]
+    counts = numpy.array([_EvenNumSegs(length, options) \
+        for length in lengths.tolist()])
+    # curve index and arc length target for each interior point
+    ninterior = counts - 1
+    ci = numpy.repeat(numpy.arange(nc), ninterior)
+    firsts = numpy.cumsum(ninterior) - ninterior
+    k = numpy.arange(len(ci)) - firsts[ci] + 1
+    targets = k * lengths[ci] / counts[ci]
+    # inverse lookup: find the table interval, interpolate, then
+    # do a newton step using the exact arc length up to the guess
+    offsets = numpy.arange(nc) * (lengths.max() + 1.0)
+    flat = (table + offsets[:, None]).ravel()
+    j = numpy.searchsorted(flat, targets + offsets[ci], side='right') - 1
+    j = numpy.clip(j - ci * (m + 1), 0, m - 1)
+    s0 = table[ci, j]
+    ds = table[ci, j + 1] - s0
+    frac = numpy.where(ds > 0.0, (targets - s0) / numpy.where(ds > 0.0,
+        ds, 1.0), 0.0)
+    t0 = j / float(m)
+    t = t0 + frac / m
+    half = 0.5 * (t - t0)
+    sub = t0[:, None] + half[:, None] * (_GLX + 1.0)
+    partial = (_QuadBezierNorms(dcps[ci], sub) * _GLW).sum(axis=1) * half
+    speed = _QuadBezierNorms(dcps[ci], t[:, None])[:, 0]
+    step = numpy.where(speed > 0.0, (s0 + partial - targets) / \
+        numpy.where(speed > 0.0, speed, 1.0), 0.0)
+    t = numpy.clip(t - step, t0, t0 + 1.0 / m)
+    s = 1.0 - t
+    basis = numpy.column_stack((s * s * s, 3.0 * t * s * s,
+        3.0 * t * t * s, t * t * t))
+    pts = (origins[ci, 0, :] + \
+        numpy.einsum('sk,skd->sd', basis, rel[ci])).tolist()
+    ans = []
+    for i, cps in enumerate(cpslist):
+        first = firsts[i]
+        ans.append([cps[0]] + \
+            [tuple(p) for p in pts[first:first + ninterior[i]]] + [cps[3]])
+    return ans
+
+
+def _QuadBezierNorms(dcps, t):
+    """Return lengths of points on many quadratic beziers.
+
+    Args:
+      dcps: numpy.ndarray - n x 3 x 2, control points of n beziers
+          (the derivatives of cubics, in our use)
+      t: numpy.ndarray - parameters, broadcastable to n x k
+    Returns:
+      numpy.ndarray - n x k, the length of the vector from the origin
+          to each bezier at each parameter
+    """
+
+    s = 1.0 - t
+    b0 = s * s
+    b1 = 2.0 * t * s
+    b2 = t * t
+    x = b0 * dcps[:, 0, 0, None] + b1 * dcps[:, 1, 0, None] + \
+        b2 * dcps[:, 2, 0, None]
+    y = b0 * dcps[:, 0, 1, None] + b1 * dcps[:, 1, 1, None] + \
+        b2 * dcps[:, 2, 1, None]
+    return numpy.hypot(x, y)
+
+
+_bernstein_cache = dict()
+
+
+def _BernsteinBasis(n):
+    """Return the cubic Bernstein basis at n+1 equally spaced parameters.
+
+    Args:
+      n: int - number of pieces to divide the parameter range into
+    Returns:
+      numpy.ndarray - (n+1) x 4 matrix, row i holding the four cubic
+          Bernstein polynomials evaluated at t = i/n
+    """
+
+    basis = _bernstein_cache.get(n)
+    if basis is None:
+        t = numpy.linspace(0.0, 1.0, n + 1)
+        s = 1.0 - t
+        basis = numpy.column_stack((s * s * s, 3.0 * t * s * s,
+            3.0 * t * t * s, t * t * t))
+        _bernstein_cache[n] = basis
+    return basis
+
+
 def _SetEvenLength(options, paths):
     """Use the bounding box of paths to set even_length in options.
 
@@ -293,6 +1611,53 @@ def _SetEvenLength(options, paths):
       Sets options.even_length according to above formula
     """
 
+    longest_side_length = _LongestSideLength(paths)
+    if longest_side_length <= 0:
+        longest_side_length = 1.0
+    options.even_length = longest_side_length / \
+        (4.0 * (options.smoothness + 1))
+
+
+def _ArtUnitsOptions(options, paths):
+    """Return options with tolerances converted to art units.
+
+    The converted art will be scaled so that its longest side is
+    options.scaled_side_target, so a tolerance in those units
+    corresponds to tolerance * longest_side_length / scaled_side_target
+    in the art's own coordinates.  Doing this before flattening means
+    that large artwork isn't subdivided much more finely than
+    will be visible at the final size (nor small artwork too coarsely).
+
+    Args:
+      options: ConvertOptions
+      paths: list of geom.Path
+    Returns:
+      ConvertOptions - a copy of options with tolerance and
+        simplify_tolerance changed
+    """
+
+    longest_side_length = _LongestSideLength(paths)
+    ans = copy.copy(options)
+    if longest_side_length > 0.0:
+        factor = longest_side_length / options.scaled_side_target
+        ans.tolerance = options.tolerance * factor
+        ans.simplify_tolerance = options.simplify_tolerance * factor
+    return ans
+
+
+def _LongestSideLength(paths):
+    """Return the length of the longest side of the bounding box of paths.
+
+    The bounding box is that of the segment end and control points,
+    which contains the curves themselves (except that arcs may bulge
+    out a bit).
+
+    Args:
+      paths: list of geom.Path
+    Returns:
+      float - 0.0 if there are no points
+    """
+
     minx = 1e10
     maxx = -1e10
     miny = 1e10
@@ -300,21 +1665,27 @@ def _SetEvenLength(options, paths):
     for p in paths:
         for sp in p.subpaths:
             for seg in sp.segments:
-                for (x, y) in seg[1:]:
+                # 'A' segments have radii and flags after the end points
+                if seg[0] == "A":
+                    pts = seg[1:3]
+                else:
+                    pts = seg[1:]
+                for (x, y) in pts:
                     minx = min(minx, x)
                     maxx = max(maxx, x)
                     miny = min(miny, y)
                     maxy = max(maxy, y)
-    longest_side_length = max(maxx - minx, maxy - miny)
-    if longest_side_length <= 0:
-        longest_side_length = 1.0
-    options.even_length = longest_side_length / \
-        (4.0 * (options.smoothness + 1))
+    return max(maxx - minx, maxy - miny, 0.0)
 
 
 def _EvenBezier3Approx(cps, options):
     """Use even segment lengths to approximate a cubic bezier segment.
 
+    The arc length of the bezier is tabulated (see
+    _Bezier3ArcLengthTable), and that is used both to pick the
+    number of pieces and to find the parameters at which the
+    arc length has equally spaced values.
+
     Args:
       cps: list of 4 coord tuples -
           (start, control point 1, control point 2, end)
@@ -324,27 +1695,221 @@ def _EvenBezier3Approx(cps, options):
       bezier
     """
 
-    # This could be made better by recursing a couple of times
-    # but the average of the control polygon and chord length is a good
-    # first order approximation.
-    arc_length = 0.5 * (geom.VecLen(geom.VecSub(cps[3], cps[0])) + \
-                 0.5 * (geom.VecLen(geom.VecSub(cps[1], cps[0])) + \
-                        geom.VecLen(geom.VecSub(cps[2], cps[1])) + \
-                        geom.VecLen(geom.VecSub(cps[3], cps[2]))))
-    # make sure segment lengths are at least as short as even_length
-    numsegs = math.ceil(arc_length / options.even_length)
-    # unless smoothness is zero, make sure Beziers split at least once
-    if options.smoothness > 0 and numsegs == 1:
-        numsegs = 2
+    table = _Bezier3ArcLengthTable(cps)
+    arc_length = table[-1]
+    numsegs = _EvenNumSegs(arc_length, options)
     ans = [cps[0]]
     for i in range(1, numsegs):
-        t = i * (1.0 / numsegs)
+        t = _Bezier3ArcLengthParam(cps, table, i * arc_length / numsegs)
         pt = _BezierEval(cps, t)
         ans.append(pt)
     ans.append(cps[3])
     return ans
 
 
+def _EvenNumSegs(arc_length, options):
+    """Return the number of pieces to divide a bezier into for 'EVEN'.
+
+    Args:
+      arc_length: float - length of the bezier
+      options: ConvertOptions
+    Returns:
+      int - number of segments (at least 1)
+    """
+
+    # make sure segment lengths are at least as short as even_length
+    numsegs = int(math.ceil(arc_length / options.even_length))
+    # unless smoothness is zero, make sure Beziers split at least once
+    if options.smoothness > 0 and numsegs <= 1:
+        numsegs = 2
+    return max(numsegs, 1)
+
+
+# Nodes and weights for 5-point Gauss-Legendre quadrature on [-1, 1]
+_GL_NODES = (-0.906179845938664, -0.5384693101056831, 0.0,
+    0.5384693101056831, 0.906179845938664)
+_GL_WEIGHTS = (0.2369268850561891, 0.4786286704993665, 0.5688888888888889,
+    0.4786286704993665, 0.2369268850561891)
+if numpy is not None:
+    _GLX = numpy.array(_GL_NODES)
+    _GLW = numpy.array(_GL_WEIGHTS)
+
+# Number of parameter intervals in a bezier arc length table
+ARCLEN_INTERVALS = 32
+
+
+def _Bezier3ArcLengthTable(cps):
+    """Tabulate the arc length of a cubic bezier.
+
+    Each of ARCLEN_INTERVALS equal parameter intervals is integrated
+    with 5-point Gauss-Legendre quadrature.
+
+    Args:
+      cps: list of 4 coord tuples -
+          (start, control point 1, control point 2, end)
+    Returns:
+      list of float - element j is the arc length from parameter 0
+          to parameter j / ARCLEN_INTERVALS
+    """
+
+    m = ARCLEN_INTERVALS
+    table = [0.0]
+    for j in range(m):
+        table.append(table[-1] + \
+            _Bezier3ArcLength(cps, j / float(m), (j + 1) / float(m)))
+    return table
+
+
+def _Bezier3ArcLength(cps, t0, t1):
+    """Return the arc length of a cubic bezier between two parameters.
+
+    Uses 5-point Gauss-Legendre quadrature, so t0 and t1 should
+    be close enough together that the speed is smooth in between.
+
+    Args:
+      cps: list of 4 coord tuples -
+          (start, control point 1, control point 2, end)
+      t0: float - start parameter
+      t1: float - end parameter
+    Returns:
+      float - the arc length
+    """
+
+    half = 0.5 * (t1 - t0)
+    mid = 0.5 * (t1 + t0)
+    total = 0.0
+    for (x, w) in zip(_GL_NODES, _GL_WEIGHTS):
+        total += w * _Bezier3Speed(cps, mid + half * x)
+    return half * total
+
+
+def _Bezier3Speed(cps, t):
+    """Return the length of the derivative of a cubic bezier at t.
+
+    Args:
+      cps: list of 4 coord tuples -
+          (start, control point 1, control point 2, end)
+      t: float - parameter
+    Returns:
+      float
+    """
+
+    ((x0, y0), (x1, y1), (x2, y2), (x3, y3)) = [(p[0], p[1]) for p in cps]
+    s = 1.0 - t
+    b0 = 3.0 * s * s
+    b1 = 6.0 * t * s
+    b2 = 3.0 * t * t
+    return math.hypot(b0 * (x1 - x0) + b1 * (x2 - x1) + b2 * (x3 - x2),
+        b0 * (y1 - y0) + b1 * (y2 - y1) + b2 * (y3 - y2))
+
+
+def _Bezier3ArcLengthParam(cps, table, arc_length):
+    """Return the parameter at which a bezier has the given arc length.
+
+    Interpolates in the arc length table, and then refines
+    that with one Newton step.
+
+    Args:
+      cps: list of 4 coord tuples -
+          (start, control point 1, control point 2, end)
+      table: list of float - from _Bezier3ArcLengthTable(cps)
+      arc_length: float - target arc length from start of bezier
+    Returns:
+      float - parameter
+    """
+
+    m = ARCLEN_INTERVALS
+    j = bisect.bisect_right(table, arc_length) - 1
+    j = min(max(j, 0), m - 1)
+    (s0, s1) = (table[j], table[j + 1])
+    t0 = j / float(m)
+    t1 = (j + 1) / float(m)
+    if s1 > s0:
+        t = t0 + (arc_length - s0) / (s1 - s0) / m
+    else:
+        return t0
+    speed = _Bezier3Speed(cps, t)
+    if speed > 0.0:
+        t -= (s0 + _Bezier3ArcLength(cps, t0, t) - arc_length) / speed
+    return min(max(t, t0), t1)
+
+
+def _ToleranceBezier3Approx(cps, options):
+    """Approximate a cubic bezier to within options.tolerance.
+
+    The number of pieces comes straight from the control points
+    (see _ToleranceBezier3NumSegs), and then the points at equally
+    spaced parameters are found by forward differencing, so there
+    is no recursion.
+
+    Args:
+      cps: list of 4 coord tuples -
+          (start, control point 1, control point 2, end)
+      options: ConvertOptions
+    Returns:
+      list of tuples (coordinates) for straight line approximation of the
+      bezier
+    """
+
+    numsegs = _ToleranceBezier3NumSegs(cps, options.tolerance)
+    ans = [cps[0]]
+    if numsegs > 1:
+        ((x0, y0), (x1, y1), (x2, y2), (x3, y3)) = \
+            [(p[0], p[1]) for p in cps]
+        h = 1.0 / numsegs
+        h2 = h * h
+        h3 = h2 * h
+        # power basis coefficients: p(t) = a t^3 + b t^2 + c t + p0
+        (ax, ay) = (x3 - x0 + 3.0 * (x1 - x2), y3 - y0 + 3.0 * (y1 - y2))
+        (bx, by) = (3.0 * (x0 - 2.0 * x1 + x2), 3.0 * (y0 - 2.0 * y1 + y2))
+        (cx, cy) = (3.0 * (x1 - x0), 3.0 * (y1 - y0))
+        (fx, fy) = (x0, y0)
+        (dfx, dfy) = (ax * h3 + bx * h2 + cx * h, ay * h3 + by * h2 + cy * h)
+        (ddfx, ddfy) = (6.0 * ax * h3 + 2.0 * bx * h2,
+            6.0 * ay * h3 + 2.0 * by * h2)
+        (dddfx, dddfy) = (6.0 * ax * h3, 6.0 * ay * h3)
+        for i in range(1, numsegs):
+            fx += dfx
+            fy += dfy
+            dfx += ddfx
+            dfy += ddfy
+            ddfx += dddfx
+            ddfy += dddfy
+            ans.append((fx, fy))
+    ans.append(cps[3])
+    return ans
+
+
+def _ToleranceBezier3NumSegs(cps, tolerance):
+    """Return number of equal parameter steps needed for given tolerance.
+
+    Uses Wang's formula: if the largest second difference of the
+    control points of a degree d bezier has length m, then
+    dividing the parameter range into n equal pieces, with
+
+      n = ceil(sqrt(d * (d-1) * m / (8 * tolerance)))
+
+    guarantees that no point of the curve is further than tolerance
+    from the corresponding point of the approximating polyline.
+
+    Args:
+      cps: list of 4 coord tuples -
+          (start, control point 1, control point 2, end)
+      tolerance: float - maximum allowed deviation
+    Returns:
+      int - number of segments (at least 1)
+    """
+
+    (p0, p1, p2, p3) = cps
+    m = max(math.hypot(p0[0] - 2.0 * p1[0] + p2[0],
+                       p0[1] - 2.0 * p1[1] + p2[1]),
+            math.hypot(p1[0] - 2.0 * p2[0] + p3[0],
+                       p1[1] - 2.0 * p2[1] + p3[1]))
+    if tolerance <= 0.0:
+        tolerance = geom.DISTTOL
+    return max(1, int(math.ceil(math.sqrt(0.75 * m / tolerance))))
+
+
 def _BezierEval(cps, t):
     """Evaluate a cubic Bezier at parameter t.
 
@@ -516,6 +2081,52 @@ def ArcApprox(start, end, rad, xrot, large_arc, ccw, options):
             return _EvenLineDivide(start, end, options)
         else:
             return [start, end]
+    (cx, cy, rx, ry, phi, theta1, delta_theta) = \
+        _ArcCenterParams(start, end, rad, xrot, large_arc, ccw)
+    if abs(delta_theta) < 1e-5:
+        # shouldn't happen
+        return [start, end]
+    cos_phi = math.cos(phi)
+    sin_phi = math.sin(phi)
+    numsegs = _ArcNumSegs(delta_theta, rx, ry, options)
+    theta_incr = delta_theta / numsegs
+    theta = theta1
+    endtheta = theta1 + delta_theta
+    ans = [start]
+    # end condition should be theta ~== endtheta but also
+    # should be no more than numsegs iters
+    for i in range(numsegs):
+        theta = theta + theta_incr
+        if abs(theta - endtheta) < 1e-5:
+            break
+        cos_theta = math.cos(theta)
+        sin_theta = math.sin(theta)
+        x = cos_phi * rx * cos_theta - sin_phi * ry * sin_theta + cx
+        y = sin_phi * rx * cos_theta + cos_phi * ry * sin_theta + cy
+        ans.append((x, y))
+    ans.append(end)
+    return ans
+
+
+def _ArcCenterParams(start, end, rad, xrot, large_arc, ccw):
+    """Convert an elliptical arc to center parameterization.
+
+    Implementation follows notes in F.6 of SVG spec.
+    The arc is then:
+      (x, y) = M * col(rx * cos theta, ry * sin theta) + col(cx, cy)
+    where theta goes from theta1 to theta1 + delta_theta
+    and M is rotation matrix for phi.
+
+    Args:
+      start, end, rad, xrot, large_arc, ccw: as for ArcApprox;
+          start != end and both radii must be nonzero
+    Returns:
+      (cx, cy, rx, ry, phi, theta1, delta_theta) - all float;
+          the radii may have been scaled up to make the arc possible,
+          and the angles are in radians
+    """
+
+    (rx, ry) = rad
     rx = abs(rx)
     ry = abs(ry)
     (x1, y1) = start
@@ -556,46 +2167,302 @@ def ArcApprox(start, end, rad, xrot, large_arc, ccw, options):
         delta_theta -= 2 * math.pi
     elif ccw and delta_theta < 0.0:
         delta_theta += 2 * math.pi
-    if abs(delta_theta) < 1e-5:
-        # shouldn't happen
-        return [start, end]
+    return (cx, cy, rx, ry, phi, theta1, delta_theta)
+
+
+def _ArcNumSegs(delta_theta, rx, ry, options):
+    """Return the number of pieces to divide an elliptical arc into.
+
+    Let's ignore the fact that the axes may have different lengths
+    and just divide delta_theta into the right number of segments
+    to satisfy the smoothness options.
+
+    Args:
+      delta_theta: float - angle spanned by the arc, in radians
+      rx: float - x radius
+      ry: float - y radius
+      options: ConvertOptions
+    Returns:
+      int - number of segments (at least 1)
+    """
 
-    # Now arc is:
-    #  (x, y) = M * col(rx * cos theta, ry * sin theta) + col(cx, cy)
-    # where theta goes from theta1 to theta1 + delta_theta
-    # and M is rotation matrix for phi
-    # Let's ignore the fact that the axes may have different lengths
-    # and just divide delta_theta into the right number of segments
-    # to satisfy the smoothness options.
     if options.subdiv_kind == "EVEN":
         # arc_length = pi*d * fraction of circle represented by delta_theta
-        arc_length = delta_theta * (rx + ry) / 2.0
+        arc_length = abs(delta_theta) * (rx + ry) / 2.0
         numsegs = math.ceil(arc_length / options.even_length)
+    elif options.subdiv_kind == "TOLERANCE":
+        numsegs = _ToleranceArcNumSegs(delta_theta, max(rx, ry),
+            options.tolerance)
     else:
         # for smoothness 0, have 1 segment per quarter circle
         # and double for each smoothness increment after that
         numsegs = (2 ** options.smoothness) * \
             math.ceil(abs(delta_theta) / (math.pi * 2.0))
-    theta_incr = delta_theta / numsegs
-    ans = start
-    theta = theta1
-    endtheta = theta1 + delta_theta
-    ans = [start]
-    # end condition should be theta ~== endtheta but also
-    # should be no more than numsegs iters
-    for i in range(numsegs):
-        theta = theta + theta_incr
-        if abs(theta - endtheta) < 1e-5:
-            break
-        cos_theta = math.cos(theta)
-        sin_theta = math.sin(theta)
-        x = cos_phi * rx * cos_theta - sin_phi * ry * sin_theta + cx
-        y = sin_phi * rx * cos_theta + cos_phi * ry * sin_theta + cy
-        ans.append((x, y))
-    ans.append(end)
+    return max(1, int(numsegs))
+
+
+def _ArcCenterParamsList(arcsegs):
+    """Find the center parameterizations of many 'A' segments.
+
+    Like calling _ArcCenterParams on each segment, but done with
+    array operations if numpy is available.
+
+    Args:
+      arcsegs: list of 'A' segment tuples (see geom.Subpath)
+    Returns:
+      list, parallel to arcsegs, of None (if the arc is really a point
+      or a line) or (cx, cy, rx, ry, phi, theta1, delta_theta)
+    """
+
+    regular = [i for (i, seg) in enumerate(arcsegs) \
+        if seg[1] != seg[2] and seg[3][0] != 0.0 and seg[3][1] != 0.0]
+    ans = [None] * len(arcsegs)
+    if numpy is None or len(regular) < 2:
+        for i in regular:
+            ans[i] = _ArcCenterParams(*arcsegs[i][1:])
+        return ans
+    a = numpy.array([arcsegs[i][1] + arcsegs[i][2] + arcsegs[i][3] + \
+        (arcsegs[i][4],) for i in regular], dtype=float)
+    large_arc = numpy.array([bool(arcsegs[i][5]) for i in regular])
+    ccw = numpy.array([bool(arcsegs[i][6]) for i in regular])
+    (x1, y1, x2, y2) = (a[:, 0], a[:, 1], a[:, 2], a[:, 3])
+    rx = numpy.abs(a[:, 4])
+    ry = numpy.abs(a[:, 5])
+    phi = a[:, 6] * (math.pi / 180.0)
+    cos_phi = numpy.cos(phi)
+    sin_phi = numpy.sin(phi)
+    hx = (x1 - x2) / 2.0
+    hy = (y1 - y2) / 2.0
+    x1p = cos_phi * hx + sin_phi * hy
+    y1p = -sin_phi * hx + cos_phi * hy
+    lam = (x1p ** 2) / rx ** 2 + (y1p ** 2) / ry ** 2
+    slam = numpy.sqrt(numpy.maximum(lam, 1.0))
+    rx = rx * slam
+    ry = ry * slam
+    cf2 = (rx ** 2 * ry ** 2 - rx ** 2 * y1p ** 2 - ry ** 2 * x1p ** 2) / \
+        (rx ** 2 * y1p ** 2 + ry ** 2 * x1p ** 2)
+    cfactor = numpy.sqrt(numpy.maximum(cf2, 0.0))
+    cfactor = numpy.where(large_arc == ccw, -cfactor, cfactor)
+    cxp = cfactor * rx * y1p / ry
+    cyp = -cfactor * ry * x1p / rx
+    cx = cos_phi * cxp - sin_phi * cyp + (x1 + x2) / 2.0
+    cy = sin_phi * cxp + cos_phi * cyp + (y1 + y2) / 2.0
+    (ux, uy) = ((x1p - cxp) / rx, (y1p - cyp) / ry)
+    (vx, vy) = ((-x1p - cxp) / rx, (-y1p - cyp) / ry)
+    theta1 = numpy.arctan2(uy, ux)
+    delta_theta = numpy.arctan2(ux * vy - uy * vx, ux * vx + uy * vy)
+    delta_theta = numpy.where(~ccw & (delta_theta > 0.0),
+        delta_theta - 2 * math.pi, delta_theta)
+    delta_theta = numpy.where(ccw & (delta_theta < 0.0),
+        delta_theta + 2 * math.pi, delta_theta)
+    rows = numpy.column_stack((cx, cy, rx, ry, phi, theta1,
+        delta_theta)).tolist()
+    for i, row in zip(regular, rows):
+        ans[i] = tuple(row)
     return ans
 
 
+def _BatchArcApprox(arcs, options):
+    """Approximate many elliptical arcs with line segments.
+
+    The answer is the same as calling ArcApprox on each arc,
+    but if numpy is available all the arc points are evaluated
+    with array operations.
+
+    Args:
+      arcs: list of ('A' segment tuple, center parameters) - where
+        center parameters are from _ArcCenterParamsList
+      options: ConvertOptions
+    Returns:
+      list of list of tuples (coordinates) - parallel to arcs
+    """
+
+    ans = [None] * len(arcs)
+    jobs = []
+    for i, (seg, params) in enumerate(arcs):
+        if numpy is None or params is None or abs(params[6]) < 1e-5:
+            ans[i] = ArcApprox(seg[1], seg[2], seg[3], seg[4], seg[5],
+                seg[6], options)
+        else:
+            jobs.append(i)
+    if not jobs:
+        return ans
+    p = numpy.array([arcs[i][1] for i in jobs])
+    (cx, cy, rx, ry, phi, theta1, delta_theta) = p.T
+    counts = numpy.array([_ArcNumSegs(params[6], params[2], params[3],
+        options) for (_, params) in [arcs[i] for i in jobs]])
+    ninterior = counts - 1
+    ci = numpy.repeat(numpy.arange(len(jobs)), ninterior)
+    firsts = numpy.cumsum(ninterior) - ninterior
+    k = numpy.arange(len(ci)) - firsts[ci] + 1
+    theta = theta1[ci] + k * (delta_theta[ci] / counts[ci])
+    (cos_theta, sin_theta) = (numpy.cos(theta), numpy.sin(theta))
+    (cos_phi, sin_phi) = (numpy.cos(phi[ci]), numpy.sin(phi[ci]))
+    x = cos_phi * rx[ci] * cos_theta - sin_phi * ry[ci] * sin_theta + cx[ci]
+    y = sin_phi * rx[ci] * cos_theta + cos_phi * ry[ci] * sin_theta + cy[ci]
+    pts = list(zip(x.tolist(), y.tolist()))
+    for j, i in enumerate(jobs):
+        seg = arcs[i][0]
+        first = firsts[j]
+        ans[i] = [seg[1]] + pts[first:first + ninterior[j]] + [seg[2]]
+    return ans
+
+
+def _FullEllipseParams(subpath, params, options):
+    """See if subpath is a single full ellipse made of arcs.
+
+    Args:
+      subpath: geom.Subpath
+      params: list of center parameters (see _ArcCenterParamsList)
+          for the 'A' segments of subpath
+      options: ConvertOptions
+    Returns:
+      None, if subpath isn't a chain of 'A' segments that go once
+      around a single ellipse, all spanning the same angle (so all
+      getting the same number of segments), else
+      (start, cx, cy, rx, ry, phi, theta1, delta_theta, numsegs) -
+      start is the start point of the subpath,
+      delta_theta is +-2pi, and numsegs is how many segments
+      approximating the separate arcs would have made; these are
+      evenly spaced around the ellipse, as only equal arcs make them
+    """
+
+    segs = subpath.segments
+    if len(segs) < 2 or len(params) != len(segs) or None in params:
+        return None
+    if segs[-1][2] != segs[0][1]:
+        return None
+    (cx, cy, rx, ry, phi, theta1, dtheta0) = params[0]
+    arcsegs = _ArcNumSegs(dtheta0, rx, ry, options)
+    total = 0.0
+    numsegs = 0
+    for i, (pcx, pcy, prx, pry, pphi, _, dtheta) in enumerate(params):
+        if i > 0 and segs[i][1] != segs[i - 1][2]:
+            return None
+        if abs(pcx - cx) > geom.DISTTOL or abs(pcy - cy) > geom.DISTTOL or \
+            abs(prx - rx) > geom.DISTTOL or abs(pry - ry) > geom.DISTTOL or \
+            pphi != phi or abs(dtheta - dtheta0) > 1e-5:
+            return None
+        if _ArcNumSegs(dtheta, prx, pry, options) != arcsegs:
+            return None
+        total += dtheta
+        numsegs += arcsegs
+    if abs(abs(total) - 2 * math.pi) > 1e-5:
+        return None
+    return (segs[0][1], cx, cy, rx, ry, phi, theta1, total, numsegs)
+
+
+_unit_circle_cache = dict()
+
+
+def _UnitCircle(n):
+    """Return the points dividing the unit circle into n equal arcs.
+
+    Args:
+      n: int - number of points
+    Returns:
+      (cos, sin) - two numpy arrays (or lists, if no numpy) of
+          length n, holding cos(2*pi*k/n) and sin(2*pi*k/n)
+    """
+
+    table = _unit_circle_cache.get(n)
+    if table is None:
+        if numpy is not None:
+            angles = numpy.arange(n) * (2.0 * math.pi / n)
+            table = (numpy.cos(angles), numpy.sin(angles))
+        else:
+            angles = [k * (2.0 * math.pi / n) for k in range(n)]
+            table = ([math.cos(a) for a in angles],
+                [math.sin(a) for a in angles])
+        _unit_circle_cache[n] = table
+    return table
+
+
+def _FullEllipsesApprox(ellipses):
+    """Approximate full ellipses by polygons.
+
+    All the trigonometry comes from a cached table of points on the
+    unit circle, rotated to each ellipse's starting angle and then
+    mapped onto the ellipse; with numpy, all ellipses that need the
+    same number of segments are done together.
+
+    Args:
+      ellipses: list of tuples, each from _FullEllipseParams
+    Returns:
+      list of list of tuples (coordinates) - parallel to ellipses,
+          the approximating polygons, starting at each ellipse's
+          start point (and not repeating it at the end)
+    """
+
+    ans = [None] * len(ellipses)
+    bycount = dict()
+    for i, ell in enumerate(ellipses):
+        n = ell[8]
+        if n in bycount:
+            bycount[n].append(i)
+        else:
+            bycount[n] = [i]
+    for n, indices in bycount.items():
+        (tcos, tsin) = _UnitCircle(n)
+        if numpy is not None:
+            e = numpy.array([ellipses[i][1:8] for i in indices])
+            (cx, cy, rx, ry, phi, theta1, total) = [col[:, None] \
+                for col in e.T]
+            sign = numpy.sign(total)
+            (c1, s1) = (numpy.cos(theta1), numpy.sin(theta1))
+            cos_theta = c1 * tcos - sign * s1 * tsin
+            sin_theta = s1 * tcos + sign * c1 * tsin
+            (cos_phi, sin_phi) = (numpy.cos(phi), numpy.sin(phi))
+            x = cos_phi * rx * cos_theta - sin_phi * ry * sin_theta + cx
+            y = sin_phi * rx * cos_theta + cos_phi * ry * sin_theta + cy
+            pts = list(zip(x[:, 1:].ravel().tolist(),
+                y[:, 1:].ravel().tolist()))
+            for j, i in enumerate(indices):
+                ans[i] = [ellipses[i][0]] + pts[j * (n - 1):(j + 1) * (n - 1)]
+            continue
+        for i in indices:
+            (start, cx, cy, rx, ry, phi, theta1, total, _) = ellipses[i]
+            sign = 1.0 if total > 0.0 else -1.0
+            (c1, s1) = (math.cos(theta1), math.sin(theta1))
+            (cos_phi, sin_phi) = (math.cos(phi), math.sin(phi))
+            # rows of (rotate by phi) * (scale by rx, ry)
+            (a, b) = (cos_phi * rx, -sin_phi * ry)
+            (c, d) = (sin_phi * rx, cos_phi * ry)
+            face = [start]
+            for k in range(1, n):
+                (tc, ts) = (tcos[k], sign * tsin[k])
+                cos_theta = c1 * tc - s1 * ts
+                sin_theta = s1 * tc + c1 * ts
+                face.append((a * cos_theta + b * sin_theta + cx,
+                    c * cos_theta + d * sin_theta + cy))
+            ans[i] = face
+    return ans
+
+
+def _ToleranceArcNumSegs(delta_theta, r, tolerance):
+    """Return number of pieces for an arc to stay within tolerance.
+
+    A chord spanning angle a of a circle of radius r is at most
+    r * (1 - cos(a/2)) away from the arc.  An elliptical arc is
+    an affine image of a circular one, so using the larger radius
+    gives a bound for it too.
+
+    Args:
+      delta_theta: float - angle spanned by arc, in radians
+      r: float - larger radius of the ellipse
+      tolerance: float - maximum allowed deviation
+    Returns:
+      int - number of segments (at least 1)
+    """
+
+    if tolerance <= 0.0:
+        tolerance = geom.DISTTOL
+    if tolerance >= r:
+        return max(1, int(math.ceil(abs(delta_theta) / math.pi)))
+    maxangle = 2.0 * math.acos(1.0 - tolerance / r)
+    return max(1, int(math.ceil(abs(delta_theta) / maxangle)))
+
+
 def _Angle(u, v):
     """Return angle between two vectors.
 
@@ -652,6 +2519,7 @@ def _Contains(i, j, areas, lens, cls):
       areas: list of floats - areas of all the paths
       lens: list of ints - lenths of each of the paths
       cls: dict - maps pairs to result of _ClassifyPathPairs
+        (may be a _PairClassifier)
     Returns:
       bool - True if path i contains at least 55% of j's vertices
     """
@@ -670,63 +2538,6 @@ def _Contains(i, j, areas, lens, cls):
             return True
 
 
-def _IsBoundary(i, n, cont, assigned):
-    """Is path i a boundary, given current assignment?
-
-    Args:
-      i: int - index of a path to test for boundary possiblity
-      n: int - total number of paths
-      cont: dict - maps path pairs (i,j) to _Contains(i,j,...) result
-      assigned: set  of int - which paths are already assigned
-    Returns:
-      bool - True if there is no unassigned j, j!=i, such that
-             path j contains path i
-    """
-
-    for j in range(0, n):
-        if j == i or j in assigned:
-            continue
-        if (j, i) in cont:
-            return False
-    return True
-
-
-def _GetHoles(i, n, cont, assigned):
-    """Find holes for path i: i.e., unassigned paths directly inside it.
-
-    Directly inside means there is not some other unassigned path k
-    such that path such that path i contains k and path k contains j.
-    (If such a k is already assigned, then its islands have been assigned too.)
-
-    Args:
-      i: int - index of a boundary path
-      n: int - total number of paths
-      cont: dict - maps path pairs (i,j) to _Contains(i,j,...) result
-      assigned: set  of int - which paths are already assigned
-    Returns:
-      list of int - indices of paths that are islands
-    Side Effect:
-      Adds island indices to assigned set.
-    """
-
-    isls = []
-    for j in range(0, n):
-        if j in assigned:
-            continue   # catches i==j too, since i is assigned by now
-        if (i, j) in cont:
-            directly = True
-            for k in range(0, n):
-                if k == j or k in assigned:
-                    continue
-                if (i, k) in cont and (k, j) in cont:
-                    directly = False
-                    break
-            if directly:
-                isls.append(j)
-                assigned.add(j)
-    return isls
-
-
 def _flatten(l):
     """Return a flattened shallow list.
 
@@ -172,8 +172,12 @@ class PolyArea(object):
           holepa: PolyArea
         """
 
-        vmap = self.points.AddPoints(holepa.points)
-        holepoly = [vmap[i] for i in holepa.poly]
+        if holepa.points is self.points:
+            # usual case, as when made by art2polyarea: shared points
+            holepoly = holepa.poly[:]
+        else:
+            vmap = self.points.AddPoints(holepa.points)
+            holepoly = [vmap[i] for i in holepa.poly]
         holepoly.reverse()
         self.holes.append(holepoly)
 
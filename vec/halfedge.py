@@ -0,0 +1,285 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""Half-edge representation of meshes of polygonal faces.
+
+Each face with n vertices contributes n half-edges, numbered
+consecutively when the mesh is made, and all the adjacency
+(next and previous half-edge around a face, the twin half-edge
+going the other way along an edge, the containing face) is kept
+in parallel lists indexed by half-edge number.  So after the mesh
+is built, neighbors are found without hashing vertex pairs.
+"""
+
+__author__ = "howard.trickey@gmail.com"
+
+
+class HalfEdgeMesh(object):
+    """A mesh of CCW-oriented faces, as half-edges.
+
+    Half-edge h goes from vertex orig[h] to vertex orig[next[h]],
+    with its face on the left.  Vertices are indices into some
+    geom.Points, and needn't be consecutive.
+
+    Attributes:
+      orig: list of int - the vertex each half-edge leaves
+      next: list of int - the half-edge after each one, around its face
+      prev: list of int - the half-edge before each one, around its face
+      twin: list of int - the half-edge going the other way along the
+          same edge, in the adjacent face, or -1 for a boundary half-edge
+      face: list of int - the face of each half-edge, or -1 if the
+          half-edge has been removed (see Join)
+      fixed: list of bool - true for half-edges that are constraints,
+          which Flip and Join callers should leave alone
+      fedge: list of int - for each face, its first half-edge,
+          or -1 if the face has been joined into another
+      vedge: dict of int -> int - for each vertex, a half-edge leaving it
+    """
+
+    def __init__(self, faces, fixed=None):
+        """Make the mesh for faces.
+
+        Where several faces have a half-edge (u, v), only the first
+        is paired with a (v, u) half-edge.
+
+        Args:
+          faces: list of list of int - each sublist is a face,
+              CCW-oriented vertex indices
+          fixed: set of (int, int) - if given, half-edges with these
+              (start, end) vertices are marked fixed
+        """
+
+        self.orig = []
+        self.next = []
+        self.prev = []
+        self.twin = []
+        self.face = []
+        self.fedge = []
+        self.vedge = dict()
+        ends = dict()
+        for (f, verts) in enumerate(faces):
+            n = len(verts)
+            first = len(self.orig)
+            self.fedge.append(first)
+            for i in range(n):
+                h = first + i
+                self.orig.append(verts[i])
+                self.next.append(first + (i + 1) % n)
+                self.prev.append(first + (i - 1) % n)
+                self.face.append(f)
+                self.vedge.setdefault(verts[i], h)
+                e = (verts[i], verts[(i + 1) % n])
+                if e not in ends:
+                    ends[e] = h
+        self.twin = [-1] * len(self.orig)
+        for ((u, v), h) in ends.items():
+            t = ends.get((v, u))
+            if t is not None and self.twin[h] == -1 and self.twin[t] == -1 \
+                    and t != h:
+                self.twin[h] = t
+                self.twin[t] = h
+        if fixed:
+            self.fixed = [(self.orig[h], self.orig[self.next[h]]) in fixed
+                for h in range(len(self.orig))]
+        else:
+            self.fixed = [False] * len(self.orig)
+
+    def Dest(self, h):
+        """Return the vertex half-edge h goes to."""
+
+        return self.orig[self.next[h]]
+
+    def Edge(self, h):
+        """Return half-edge h as a (start, end) vertex pair."""
+
+        return (self.orig[h], self.orig[self.next[h]])
+
+    def FaceEdges(self, f):
+        """Return the list of half-edges around face f, starting
+        with fedge[f]."""
+
+        ans = []
+        first = h = self.fedge[f]
+        if h == -1:
+            return ans
+        while True:
+            ans.append(h)
+            h = self.next[h]
+            if h == first:
+                return ans
+
+    def FaceVerts(self, f):
+        """Return face f as a tuple of vertex indices."""
+
+        return tuple([self.orig[h] for h in self.FaceEdges(f)])
+
+    def Faces(self):
+        """Return the faces still in the mesh, as tuples of vertex
+        indices, in face number order."""
+
+        return [self.FaceVerts(f) for f in range(len(self.fedge))
+            if self.fedge[f] != -1]
+
+    def VertexStar(self, v):
+        """Return the half-edges leaving vertex v, in CW order.
+
+        Only the fan of faces around v reached from vedge[v] through
+        twins is found, so if several fans meet at v (it is a 'pinch'
+        vertex) the others are missed.
+
+        Args:
+          v: int - a vertex of the mesh
+        Returns:
+          list of int - half-edges h with orig[h] == v
+        """
+
+        start = self.vedge.get(v, -1)
+        if start == -1:
+            return []
+        ans = [start]
+        h = start
+        while True:
+            t = self.twin[h]
+            if t == -1:
+                break
+            h = self.next[t]
+            if h == start:
+                return ans
+            ans.append(h)
+        # hit the boundary: go CCW from start too
+        h = start
+        while True:
+            t = self.twin[self.prev[h]]
+            if t == -1:
+                break
+            h = t
+            ans.insert(0, h)
+        return ans
+
+    def Degrees(self):
+        """Return a dict mapping each vertex to the number of half-edges
+        leaving it, which is the number of faces around it (counting
+        a face that visits it twice twice)."""
+
+        ans = dict()
+        face = self.face
+        for (h, v) in enumerate(self.orig):
+            if face[h] != -1:
+                ans[v] = ans.get(v, 0) + 1
+        return ans
+
+    def FindHalfEdge(self, u, v):
+        """Return the half-edge from u to v, or -1 if there isn't one
+        (in the fan of u; see VertexStar)."""
+
+        for h in self.VertexStar(u):
+            if self.orig[self.next[h]] == v:
+                return h
+        return -1
+
+    def NextBoundary(self, h):
+        """Return the boundary half-edge that follows boundary half-edge h,
+        going around the boundary of the union of the faces, which is on
+        the left.
+
+        Args:
+          h: int - a half-edge with no twin
+        Returns:
+          int - the half-edge with no twin leaving the end of h,
+              turning across faces joined by twins
+        """
+
+        g = self.next[h]
+        while self.twin[g] != -1:
+            g = self.next[self.twin[g]]
+            if g == self.next[h]:
+                break  # shouldn't happen
+        return g
+
+    def Flip(self, h):
+        """Replace the edge of h by the other diagonal of its quad.
+
+        The faces of h and its twin must be triangles (a, b, c) and
+        (b, a, d), where h goes from a to b.  They become (c, d, b)
+        and (c, a, d), in the same face numbers, with h going from
+        c to d and its twin from d to c.
+
+        Args:
+          h: int - a half-edge with a twin
+        """
+
+        (orig, nxt, prv, face) = (self.orig, self.next, self.prev, self.face)
+        t = self.twin[h]
+        (a, b) = (orig[h], orig[t])
+        (h1, h2) = (nxt[h], prv[h])  # (b, c), (c, a)
+        (t1, t2) = (nxt[t], prv[t])  # (a, d), (d, b)
+        c = orig[h2]
+        d = orig[t2]
+        (fl, fr) = (face[h], face[t])
+        orig[h] = c
+        orig[t] = d
+        # face fl: h (c, d), t2 (d, b), h1 (b, c)
+        (nxt[h], nxt[t2], nxt[h1]) = (t2, h1, h)
+        (prv[h], prv[t2], prv[h1]) = (h1, h, t2)
+        face[t2] = fl
+        # face fr: h2 (c, a), t1 (a, d), t (d, c)
+        (nxt[h2], nxt[t1], nxt[t]) = (t1, t, h2)
+        (prv[h2], prv[t1], prv[t]) = (t, h2, t1)
+        face[h2] = fr
+        self.fedge[fl] = h
+        self.fedge[fr] = h2
+        if self.vedge[a] == h:
+            self.vedge[a] = t1
+        if self.vedge[b] == t:
+            self.vedge[b] = h1
+
+    def Join(self, h):
+        """Remove the edge of h, joining the face of its twin into
+        the face of h.
+
+        The joined face starts with the half-edge after the twin, so
+        joining triangles (a, b, c) and (b, a, d) by the half-edge from
+        a to b gives face (a, d, b, c).
+
+        Args:
+          h: int - a half-edge with a twin in a different face
+        Returns:
+          int - the joined face
+        """
+
+        (nxt, prv, face) = (self.next, self.prev, self.face)
+        t = self.twin[h]
+        (f, g) = (face[h], face[t])
+        for k in self.FaceEdges(g):
+            face[k] = f
+        (ph, nh, pt, nt) = (prv[h], nxt[h], prv[t], nxt[t])
+        nxt[ph] = nt
+        prv[nt] = ph
+        nxt[pt] = nh
+        prv[nh] = pt
+        self.fedge[f] = nt
+        self.fedge[g] = -1
+        if self.vedge[self.orig[h]] == h:
+            self.vedge[self.orig[h]] = nt
+        if self.vedge[self.orig[t]] == t:
+            self.vedge[self.orig[t]] = nh
+        face[h] = face[t] = -1
+        self.twin[h] = self.twin[t] = -1
+        return f
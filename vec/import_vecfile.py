@@ -29,6 +29,7 @@ from . import vecfile
 from . import art2polyarea
 from . import triquad
 from . import offset
+import copy
 import math
 
 
@@ -46,6 +47,11 @@ class ImportOptions(object):
       bevel_amount: float - if > 0, inset polygons by this amount
       bevel_pitch: float - if > 0, angle in radians of bevel
       cap_back: bool - should we cap the back, if extruding?
+      triquad_budget: float - if > 0, seconds allowed for triangulating
+        or quadrangulating each face, after which cheaper methods are
+        used (see triquad.BUDGET)
+      (convert_options.processes is also the number of processes
+        used to quadrangulate the faces)
     """
 
     def __init__(self):
@@ -56,14 +62,19 @@ class ImportOptions(object):
         self.bevel_amount = 0.0
         self.bevel_pitch = 45.0 * math.pi / 180.0
         self.cap_back = False
+        self.triquad_budget = 0.0
 
 
-def ReadVecFileToModel(fname, options):
+def ReadVecFileToModel(fname, options, stats=None, triquad_stats=None):
     """Read vector art file and convert to Model.
 
     Args:
       fname: string - the file to read
       options: ImportOptions - specifies some choices about import
+      stats: art2polyarea.ConvertStats - if given, conversion
+        counts are added to this
+      triquad_stats: triquad.TriQuadStats - if given, counts and
+        warnings from quadrangulation are added to this
     Returns:
       (Model, string): if there was a major problem, Model may be None.
         The string will be errors and warnings.
@@ -72,28 +83,39 @@ def ReadVecFileToModel(fname, options):
     art = vecfile.ParseVecFile(fname)
     if art is None:
         return (None, "Problem reading file or unhandled type")
-    return ArtToModel(art, options)
+    return ArtToModel(art, options, stats, triquad_stats)
 
 
-def ArtToModel(art, options):
+def ArtToModel(art, options, stats=None, triquad_stats=None):
     """Convert an Art object into a Model object.
 
     Args:
       art: geom.Art - the Art object to convert.
       options: ImportOptions - specifies some choices about import
+      stats: art2polyarea.ConvertStats - if given, conversion
+        counts are added to this
+      triquad_stats: triquad.TriQuadStats - if given, counts and
+        warnings from quadrangulation are added to this
     Returns:
       (geom.Model, string): if there was a major problem, Model may be None.
         The string will be errors and warnings.
     """
 
-    pareas = art2polyarea.ArtToPolyAreas(art, options.convert_options)
+    # tell the converter the final scale, so that a flattening
+    # tolerance can be in final (scaled) units; use a copy so that
+    # the caller's convert_options are left as they were
+    convert_options = copy.copy(options.convert_options)
+    convert_options.scaled_side_target = options.scaled_side_target
+    pareas = art2polyarea.ArtToPolyAreas(art, convert_options, stats)
     if not pareas:
         return (None, "No visible faces found")
     if options.scaled_side_target > 0:
         pareas.scale_and_center(options.scaled_side_target)
+    processes = options.convert_options.processes
     m = model.PolyAreasToModel(pareas, options.bevel_amount,
-      options.bevel_pitch, options.quadrangulate)
+      options.bevel_pitch, options.quadrangulate, triquad_stats,
+      options.triquad_budget, processes)
     if options.extrude_depth > 0:
         model.ExtrudePolyAreasInModel(m, pareas, options.extrude_depth,
-          options.cap_back)
+          options.cap_back, triquad_stats, options.triquad_budget, processes)
     return (m, "")
@@ -81,8 +81,23 @@ class VectorImporter(bpy.types.Operator):
           ('EVEN', "Even",
               "Curves subdivided until segments have a common length," \
               " determined by 'smoothness'"),
+          ('TOLERANCE', "Tolerance",
+              "Curves subdivided until within 'tolerance' of" \
+              " the true curve"),
           ],
         default='ADAPTIVE')
+    tolerance = FloatProperty(name="Tolerance",
+        description="Maximum distance from curves, in scaled Blender" \
+            " units, for Tolerance method",
+        default=0.01,
+        min=0.0001,
+        max=10.0)
+    simplify_tolerance = FloatProperty(name="Simplify",
+        description="If > 0, remove vertices that move the outlines" \
+            " by no more than this, in scaled Blender units",
+        default=0.0,
+        min=0.0,
+        max=10.0)
     filled_only = BoolProperty(name="Filled paths only",
         description="Only import filled paths",
         default=True)
@@ -92,6 +107,33 @@ class VectorImporter(bpy.types.Operator):
     combine_paths = BoolProperty(name="Combine paths",
         description="Use all paths when looking for holes",
         default=False)
+    use_fill_rules = BoolProperty(name="Use fill rules",
+        description="Use each path's fill rule (nonzero or even-odd)" \
+            " to find its holes",
+        default=False)
+    occlusion = EnumProperty(name="Hidden parts",
+        description="What to do with parts of paths painted over" \
+            " by later filled paths",
+        items=[ \
+          ('NONE', "Keep",
+              "Keep everything"),
+          ('CULL', "Cull",
+              "Drop areas that are completely hidden"),
+          ('CLIP', "Clip",
+              "Drop completely hidden areas and cut hidden parts" \
+              " out of others"),
+          ],
+        default='NONE')
+    remove_duplicates = BoolProperty(name="Remove duplicates",
+        description="Import only one of each set of paths with the" \
+            " same shape and place",
+        default=True)
+    processes = IntProperty(name="Processes",
+        description="Number of processes to convert paths and" \
+            " make faces in",
+        default=1,
+        min=1,
+        max=64)
     use_colors = BoolProperty(name="Use colors",
         description="Use colors from vector file as materials",
         default=False)
@@ -116,11 +158,33 @@ class VectorImporter(bpy.types.Operator):
     cap_back = BoolProperty(name="Cap back",
       description="Cap the back if extruding",
       default=False)
+    triquad_budget = FloatProperty(name="Face time budget",
+      description="Seconds allowed to quadrangulate each face before" \
+        " using faster, rougher methods (0 for no limit)",
+      default=0.0,
+      min=0.0,
+      max=600.0)
     # some info display properties
     num_verts = IntProperty(name="Number of vertices",
       default=0)
     num_faces = IntProperty(name="Number of faces",
       default=0)
+    num_hidden = IntProperty(name="Number of hidden areas",
+      default=0)
+    num_hidden_verts = IntProperty(name="Number of hidden vertices",
+      default=0)
+    num_duplicates = IntProperty(name="Number of duplicate paths",
+      default=0)
+    num_simplified = IntProperty(name="Number of simplified vertices",
+      default=0)
+    num_over_budget = IntProperty(name="Number of faces over budget",
+      default=0)
+    num_convex = IntProperty(name="Number of convex faces",
+      default=0)
+    num_single_quads = IntProperty(name="Number of single quad faces",
+      default=0)
+    num_cache_hits = IntProperty(name="Number of faces from the cache",
+      default=0)
 
     def draw(self, context):
         layout = self.layout
@@ -130,17 +194,39 @@ class VectorImporter(bpy.types.Operator):
         box.prop(self, "smoothness")
         box.prop(self, "scale")
         box.prop(self, "subdiv_kind")
+        box.prop(self, "tolerance")
+        box.prop(self, "simplify_tolerance")
         box.prop(self, "filled_only")
         box.prop(self, "ignore_white")
         box.prop(self, "combine_paths")
+        box.prop(self, "use_fill_rules")
+        box.prop(self, "occlusion")
+        box.prop(self, "remove_duplicates")
+        box.prop(self, "processes")
         box.prop(self, "use_colors")
         box.prop(self, "extrude_depth")
         box.prop(self, "bevel_amount")
         box.prop(self, "bevel_pitch")
         box.prop(self, "cap_back")
+        box.prop(self, "triquad_budget")
         if self.num_verts > 0:
             layout.label(text="Ve:" + str(self.num_verts) + \
               " | Fa:" + str(self.num_faces))
+        if self.num_hidden > 0:
+            layout.label(text="Hidden areas:" + str(self.num_hidden) + \
+              " | Hidden Ve:" + str(self.num_hidden_verts))
+        if self.num_duplicates > 0:
+            layout.label(text="Duplicate paths:" + str(self.num_duplicates))
+        if self.num_simplified > 0:
+            layout.label(text="Simplified Ve:" + str(self.num_simplified))
+        if self.num_over_budget > 0:
+            layout.label(text="Faces over budget:" + \
+              str(self.num_over_budget))
+        if self.num_convex > 0:
+            layout.label(text="Convex faces:" + str(self.num_convex) + \
+              " | Single quads:" + str(self.num_single_quads))
+        if self.num_cache_hits > 0:
+            layout.label(text="Repeated faces:" + str(self.num_cache_hits))
 
     def action(self, context):
         #convert the filename to an object name
@@ -156,12 +242,22 @@ class VectorImporter(bpy.types.Operator):
         options.bevel_amount = self.bevel_amount
         options.bevel_pitch = self.bevel_pitch
         options.cap_back = self.cap_back
+        options.triquad_budget = self.triquad_budget
         options.convert_options.subdiv_kind = self.subdiv_kind
         options.convert_options.smoothness = self.smoothness
+        options.convert_options.tolerance = self.tolerance
+        options.convert_options.simplify_tolerance = self.simplify_tolerance
         options.convert_options.filled_only = self.filled_only
         options.convert_options.ignore_white = self.ignore_white
         options.convert_options.combine_paths = self.combine_paths
-        (mdl, msg) = import_vecfile.ReadVecFileToModel(self.filepath, options)
+        options.convert_options.use_fill_rules = self.use_fill_rules
+        options.convert_options.occlusion = self.occlusion
+        options.convert_options.remove_duplicates = self.remove_duplicates
+        options.convert_options.processes = self.processes
+        stats = art2polyarea.ConvertStats()
+        tqstats = triquad.TriQuadStats()
+        (mdl, msg) = import_vecfile.ReadVecFileToModel(self.filepath, options,
+            stats, tqstats)
         if msg:
             self.report({'ERROR'},
                 "Problem reading file " + self.filepath + ": " + msg)
@@ -175,6 +271,16 @@ class VectorImporter(bpy.types.Operator):
         mesh.update()
         self.num_verts = len(verts)
         self.num_faces = len(faces)
+        self.num_hidden = stats.hidden_polyareas + stats.clipped_polyareas
+        self.num_hidden_verts = stats.hidden_verts
+        self.num_duplicates = stats.duplicate_paths
+        self.num_simplified = stats.simplified_verts
+        self.num_over_budget = tqstats.over_budget
+        self.num_convex = tqstats.convex_faces
+        self.num_single_quads = tqstats.single_quads
+        self.num_cache_hits = tqstats.cache_hits
+        for warning in tqstats.warnings:
+            self.report({'WARNING'}, warning)
         obj = bpy.data.objects.new(objname, mesh)
         context.scene.objects.link(obj)
         bpy.ops.object.select_all(action='DESELECT')
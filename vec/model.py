@@ -24,21 +24,30 @@
 __author__ = "howard.trickey@gmail.com"
 
 from . import geom
+from . import halfedge
 from . import triquad
 from . import offset
 import math
 
 
-def PolyAreasToModel(polyareas, bevel_amount, bevel_pitch, quadrangulate):
+def PolyAreasToModel(polyareas, bevel_amount, bevel_pitch, quadrangulate,
+    stats=None, budget=None, processes=1):
     """Convert a PolyAreas into a Model object.
 
     Assumes polyareas are in xy plane.
+    If not beveling, the polyareas are quadrangulated all at once
+    (see triquad.QuadrangulateMany).
 
     Args:
       polyareas: geom.PolyAreas
       bevel_amount: float - if > 0, amount of bevel
       bevel_pitch: float - if > 0, angle in radians of bevel
       quadrangulate: bool - should n-gons be quadrangulated?
+      stats: triquad.TriQuadStats - if given, quadrangulation
+          counts and warnings are added to this
+      budget: float - if > 0, seconds of quadrangulation work
+          allowed per face (see triquad.BUDGET)
+      processes: int - if > 1, quadrangulate in this many processes
     Returns:
       geom.Model
     """
@@ -48,19 +57,30 @@ def PolyAreasToModel(polyareas, bevel_amount, bevel_pitch, quadrangulate):
         return m
     polyareas.points.AddZCoord(0.0)
     m.points = polyareas.points
+    if quadrangulate and bevel_amount <= 0.0:
+        pas = [pa for pa in polyareas.polyareas if len(pa.poly) > 0]
+        qpas = triquad.QuadrangulateMany([(pa.poly, pa.holes) for pa in pas],
+            polyareas.points, stats=stats, budget=budget, workers=processes)
+        for (pa, qpa) in zip(pas, qpas):
+            m.faces.extend(qpa)
+            m.face_data.extend([pa.data] * len(qpa))
+        return m
     for pa in polyareas.polyareas:
-        PolyAreaToModel(m, pa, bevel_amount, bevel_pitch, quadrangulate)
+        PolyAreaToModel(m, pa, bevel_amount, bevel_pitch, quadrangulate,
+            stats, budget)
     return m
 
 
-def PolyAreaToModel(m, pa, bevel_amount, bevel_pitch, quadrangulate):
+def PolyAreaToModel(m, pa, bevel_amount, bevel_pitch, quadrangulate,
+    stats=None, budget=None):
     if bevel_amount > 0.0:
         BevelPolyAreaInModel(m, pa, bevel_amount, bevel_pitch, quadrangulate,
-            False)
+            False, stats, budget)
     elif quadrangulate:
         if len(pa.poly) == 0:
             return
-        qpa = triquad.QuadrangulateFaceWithHoles(pa.poly, pa.holes, pa.points)
+        qpa = triquad.QuadrangulateFaceWithHoles(pa.poly, pa.holes, pa.points,
+            stats=stats, budget=budget)
         m.faces.extend(qpa)
         m.face_data.extend([pa.data] * len(qpa))
     else:
@@ -70,7 +90,8 @@ def PolyAreaToModel(m, pa, bevel_amount, bevel_pitch, quadrangulate):
         m.face_data.append(pa.data)
 
 
-def ExtrudePolyAreasInModel(mdl, polyareas, depth, cap_back):
+def ExtrudePolyAreasInModel(mdl, polyareas, depth, cap_back, stats=None,
+    budget=None, processes=1):
     """Extrude the boundaries given by polyareas by -depth in z.
 
     Assumes polyareas are in xy plane.
@@ -80,28 +101,44 @@ def ExtrudePolyAreasInModel(mdl, polyareas, depth, cap_back):
       polyareas: geom.Polyareas
       depth: float
       cap_back: bool - if True, cap off the back
+      stats: triquad.TriQuadStats - if given, counts for quadrangulating
+          the back are added to this
+      budget: float - if > 0, seconds of work allowed per back face
+      processes: int - if > 1, quadrangulate the backs in this many
+          processes (see triquad.QuadrangulateMany)
     Side Effects:
       For all edges in polys in polyareas, make quads in Model
       extending those edges by depth in the negative z direction.
       The application data will be the data of the face that the edge
       is part of.
+      The back faces of each polyarea follow its side faces.
     """
 
+    backs = []
+    ends = []
     for pa in polyareas.polyareas:
         back_poly = _ExtrudePoly(mdl, pa.poly, depth, pa.data, True)
         back_holes = []
         for p in pa.holes:
             back_holes.append(_ExtrudePoly(mdl, p, depth, pa.data, False))
         if cap_back:
-            qpa = triquad.QuadrangulateFaceWithHoles(back_poly, back_holes,
-              polyareas.points)
-            # need to reverse each poly to get normals pointing down
-            for i, p in enumerate(qpa):
-                t = list(p)
-                t.reverse()
-                qpa[i] = tuple(t)
-            mdl.faces.extend(qpa)
-            mdl.face_data.extend([pa.data] * len(qpa))
+            backs.append((back_poly, back_holes))
+            ends.append((len(mdl.faces), pa.data))
+    if not backs:
+        return
+    qpas = triquad.QuadrangulateMany(backs, polyareas.points, stats=stats,
+        budget=budget, workers=processes)
+    (faces, face_data) = ([], [])
+    start = 0
+    for ((end, data), qpa) in zip(ends, qpas):
+        faces.extend(mdl.faces[start:end])
+        face_data.extend(mdl.face_data[start:end])
+        # need to reverse each poly to get normals pointing down
+        faces.extend([tuple(reversed(p)) for p in qpa])
+        face_data.extend([data] * len(qpa))
+        start = end
+    mdl.faces[:] = faces + mdl.faces[start:]
+    mdl.face_data[:] = face_data + mdl.face_data[start:]
 
 
 def _ExtrudePoly(mdl, poly, depth, data, isccw):
@@ -147,7 +184,8 @@ def _ExtrudePoly(mdl, poly, depth, data, isccw):
 
 
 def BevelPolyAreaInModel(mdl, polyarea,
-    bevel_amount, bevel_pitch, quadrangulate, as_percent):
+    bevel_amount, bevel_pitch, quadrangulate, as_percent, stats=None,
+    budget=None):
     """Bevel the interior of polyarea in model.
 
     This does smart beveling: advancing edges are merged
@@ -164,6 +202,10 @@ def BevelPolyAreaInModel(mdl, polyarea,
       bevel_pitch: float - if > 0, angle in radians of bevel
       quadrangulate: bool - should n-gons be quadrangulated?
       as_percent: bool - if True, interpret amount as percent of max
+      stats: triquad.TriQuadStats - if given, quadrangulation counts
+          are added to this
+      budget: float - if > 0, seconds of quadrangulation work allowed
+          per face
     Side Effects:
       Faces and points are added to model to model the
       bevel and the interior of the polyareas.
@@ -189,7 +231,7 @@ def BevelPolyAreaInModel(mdl, polyarea,
             if len(pa.poly) == 0:
                 continue
             qpa = triquad.QuadrangulateFaceWithHoles(pa.poly, pa.holes,
-                pa.points)
+                pa.points, stats=stats, budget=budget)
             m.faces.extend(qpa)
             m.face_data.extend([pa.data] * len(qpa))
         else:
@@ -296,62 +338,33 @@ def RegionToPolyAreas(faces, points, data):
     """
 
     ans = []
-    (edges, vtoe) = _GetEdgeData(faces)
-    (face_adj, is_interior_edge) = _GetFaceGraph(faces, edges, vtoe, points)
-    (components, ftoc) = _FindFaceGraphComponents(faces, face_adj)
-    for c in range(len(components)):
-        boundary_edges = set()
-        betodata = dict()
-        vstobe = dict()
-        for e, ((vs, ve), f) in enumerate(edges):
-            if ftoc[f] != c or is_interior_edge[e]:
-                continue
-            boundary_edges.add(e)
-            # vstobe[v] is set of edges leaving v
-            # (could be more than one if boundary touches itself at a vertex)
-            if vs in vstobe:
-                vstobe[vs].append(e)
-            else:
-                vstobe[vs] = [e]
-            betodata[(vs, ve)] = data[f]
+    mesh = halfedge.HalfEdgeMesh(faces)
+    ftoc = _FindFaceComponents(mesh)
+    # boundary half-edges of each component, in half-edge order
+    compbounds = dict()
+    for h in range(len(mesh.orig)):
+        if mesh.twin[h] == -1:
+            compbounds.setdefault(ftoc[mesh.face[h]], []).append(h)
+    for c in range(max(ftoc) + 1 if ftoc else 0):
         polys = []
         poly_data = []
-        while boundary_edges:
-            e = boundary_edges.pop()
-            ((vstart, ve), face_i) = edges[e]
-            poly = [vstart, ve]
-            datum = betodata[(vstart, ve)]
-            while ve != vstart:
-                if ve not in vstobe:
-                    print("whoops, couldn't close boundary")
-                    break
-                nextes = vstobe[ve]
-                if len(nextes) == 1:
-                    nexte = nextes[0]
-                else:
-                    # find a next edge with face index face_i
-                    # TODO: this is not guaranteed to work,
-                    # as continuation edge may have been for a different
-                    # face that is now combined with face_i by erasing
-                    # interior edges. Find a better algorithm here.
-                    nexte = -1
-                    for ne_cand in nextes:
-                        if edges[ne_cand][1] == face_i:
-                            nexte = ne_cand
-                            break
-                    if nexte == -1:
-                        # case mentioned in TODO may have happened;
-                        # just choose any nexte - may mess things up
-                        nexte = nextes[0]
-                ((_, ve), face_i) = edges[nexte]
-                if nexte not in boundary_edges:
-                    print("whoops, nexte not a boundary edge", nexte)
-                    break
-                boundary_edges.remove(nexte)
-                if ve != vstart:
-                    poly.append(ve)
+        done = set()
+        for hstart in compbounds.get(c, []):
+            if hstart in done:
+                continue
+            # the next boundary half-edge is found by turning
+            # across the faces around the end vertex, so this
+            # works even where the boundary touches itself
+            poly = []
+            h = hstart
+            while h not in done:
+                done.add(h)
+                poly.append(mesh.orig[h])
+                h = mesh.NextBoundary(h)
+            if h != hstart:
+                print("whoops, couldn't close boundary")
             polys.append(poly)
-            poly_data.append(datum)
+            poly_data.append(data[mesh.face[hstart]])
         if len(polys) == 0:
             # can happen if an entire closed polytope is given
             # at least until we do an edge check
@@ -366,103 +379,33 @@ def RegionToPolyAreas(faces, points, data):
     return ans
 
 
-def _GetEdgeData(faces):
-    """Find edges from faces, and some lookup dictionaries.
+def _FindFaceComponents(mesh):
+    """Partition the faces of mesh into connected components,
+    where faces are connected if they share an edge (with
+    twin half-edges).
 
     Args:
-      faces: list of list of int - each a closed CCW polygon of vertex indices
+      mesh: halfedge.HalfEdgeMesh
     Returns:
-      (list of ((int, int), int), dict{ int->list of int}) -
-        list elements are ((startv, endv), face index)
-        dict maps vertices to edge indices
-    """
-
-    edges = []
-    vtoe = dict()
-    for findex, f in enumerate(faces):
-        nf = len(f)
-        for i, v in enumerate(f):
-            endv = f[(i + 1) % nf]
-            edges.append(((v, endv), findex))
-            eindex = len(edges) - 1
-            if v in vtoe:
-                vtoe[v].append(eindex)
-            else:
-                vtoe[v] = [eindex]
-    return (edges, vtoe)
-
-
-def _GetFaceGraph(faces, edges, vtoe, points):
-    """Find the face adjacency graph.
-
-    Faces are adjacent if they share an edge,
-    and the shared edge goes in the reverse direction,
-    and if the angle between them isn't too large.
-
-    Args:
-      faces: list of list of int
-      edges: list of ((int, int), int) - see _GetEdgeData
-      vtoe: dict{ int->list of int } - see _GetEdgeData
-      points: geom.Points
-    Returns:
-      (list of  list of int, list of bool) -
-        first list: each sublist is adjacent face indices for each face
-        second list: maps edge index to True if it separates adjacent faces
-    """
-
-    face_adj = [[] for i in range(len(faces))]
-    is_interior_edge = [False] * len(edges)
-    for e, ((vs, ve), f) in enumerate(edges):
-        for othere in vtoe[ve]:
-            ((_, we), g) = edges[othere]
-            if we == vs:
-                # face g is adjacent to face f
-                # TODO: angle check
-                if g not in face_adj[f]:
-                    face_adj[f].append(g)
-                    is_interior_edge[e] = True
-                # Don't bother with mirror relations, will catch later
-    return (face_adj, is_interior_edge)
-
-
-def _FindFaceGraphComponents(faces, face_adj):
-    """Partition faces into connected components.
-
-    Args:
-      faces: list of list of int
-      face_adj: list of list of int - see _GetFaceGraph
-    Returns:
-      (list of list of int, list of int) -
-        first list partitions face indices into separate lists,
-            each a component
-        second list maps face indices into their component index
-    """
-
-    if not faces:
-        return ([], [])
-    components = []
-    ftoc = [-1] * len(faces)
-    for i in range(len(faces)):
-        if ftoc[i] == -1:
-            compi = len(components)
-            comp = []
-            _FFGCSearch(i, faces, face_adj, ftoc, compi, comp)
-            components.append(comp)
-    return (components, ftoc)
-
-
-def _FFGCSearch(findex, faces, face_adj, ftoc, compi, comp):
-    """Depth first search helper function for _FindFaceGraphComponents
-
-    Searches recursively through all faces connected to findex, adding
-    each face found to comp and setting ftoc for that face to compi.
+      list of int - maps face indices to their component index
     """
 
-    comp.append(findex)
-    ftoc[findex] = compi
-    for otherf in face_adj[findex]:
-        if ftoc[otherf] == -1:
-            _FFGCSearch(otherf, faces, face_adj, ftoc, compi, comp)
+    ftoc = [-1] * len(mesh.fedge)
+    ncomp = 0
+    for f in range(len(mesh.fedge)):
+        if ftoc[f] != -1:
+            continue
+        ftoc[f] = ncomp
+        stack = [f]
+        while stack:
+            g = stack.pop()
+            for h in mesh.FaceEdges(g):
+                t = mesh.twin[h]
+                if t != -1 and ftoc[mesh.face[t]] == -1:
+                    ftoc[mesh.face[t]] = ncomp
+                    stack.append(mesh.face[t])
+        ncomp += 1
+    return ftoc
 
 
 def _FindOuterPoly(polys, points, faces):
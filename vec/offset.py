@@ -22,6 +22,8 @@
 
 __author__ = "howard.trickey@gmail.com"
 
+import heapq
+import itertools
 import math
 from . import triquad
 from . import geom
@@ -48,6 +50,10 @@ class Spoke(object):
       face: int - index of face containing this Spoke, in Offset
       index: int - index of this Spoke in its face
       destindex: int - index of Spoke dest in its face
+      inline: int - during Offset.Build, the id of the wavefront line
+          (see _EventQueue) of the edge into the origin
+      line: int - during Offset.Build, the id of the wavefront line
+          of the edge out of the origin
     """
 
     def __init__(self, v, prev, next, face, index, points):
@@ -73,6 +79,8 @@ class Spoke(object):
         self.face = face
         self.index = index
         self.destindex = -1
+        self.inline = -1
+        self.line = -1
         vmap = points.pos
         vp = vmap[v]
         prevp = vmap[prev]
@@ -161,7 +169,7 @@ class Spoke(object):
                 return OffsetEvent(True, time, p, self, other)
         return None
 
-    def EdgeEvent(self, other, offset):
+    def EdgeEvent(self, other, offset, slack=0.0):
         """Intersect self with advancing edge and return OffsetEvent, if any.
 
         An edge event is when one advancing spoke intersects an advancing
@@ -197,6 +205,9 @@ class Spoke(object):
           other: Spoke - the edge out of this spoke's origin is the advancing
               edge to be checked for intersection
           offset: Offset - the containing Offset
+          slack: float - if > 0, also allow intersections this far
+              before the start of self or outside the ends of the edge
+              (by the parameters t and w below)
         Returns:
           None or OffsetEvent - with data about the intersection, if any
         """
@@ -230,10 +241,10 @@ class Spoke(object):
                 return None
         else:
             return None
-        if t < 0.0:
+        if t < -slack:
             # intersection is in backward direction along self spoke
             return None
-        if w < 0.0:
+        if w < -slack:
             # intersection on wrong side of first end of advancing line segment
             return None
         # calculate the equivalent of w for the other end
@@ -249,7 +260,7 @@ class Spoke(object):
             ww = (dd - ee * t) / ff
         else:
             return None
-        if ww < 0.0:
+        if ww < -slack:
             return None
         evertex = (o[0] + self.dir[0] * self.speed * t, \
                    o[1] + self.dir[1] * self.speed * t)
@@ -294,6 +305,162 @@ class OffsetEvent(object):
                                       repr(self.spoke), repr(self.other))
 
 
+class _EventQueue(object):
+    """The state kept from one Offset to the next during Offset.Build.
+
+    Each edge of the original faces starts a 'wavefront line', which
+    moves inward at speed 1; the edges of the inner Offsets are
+    pieces of these lines, and are given their ids, so a Spoke can be
+    recognized as the same one in an inner Offset by the ids of the
+    lines it is between.
+
+    For each reflex spoke, the edge events found for it are kept in
+    a heap, ordered by absolute time.  These are candidates: when an
+    inner Offset needs that spoke's next edge event, the earliest
+    candidates are checked again, and dropped if their edge has
+    gone or no longer has an event with the spoke, even allowing
+    TOL of slack for roundoff (see EdgeEvents).
+
+    Attributes:
+      lines: dict of (int, int) -> int - maps a directed edge, as
+          (start vertex, end vertex), to the id of its wavefront line
+      cands: dict of (int, int) -> [Offset, list] - maps a spoke's
+          (inline, line) to the Offset whose events last used its
+          candidates, and the heap of candidates, which are
+          (absolute time, sequence number, edge key) tuples
+    """
+
+    def __init__(self):
+        self.lines = dict()
+        self.cands = dict()
+        self.seq = itertools.count()
+
+    def Line(self, u, v):
+        """Return the id of the wavefront line of edge (u, v), making
+        a new line if there isn't one yet."""
+
+        ans = self.lines.get((u, v))
+        if ans is None:
+            ans = self.lines[(u, v)] = len(self.lines)
+        return ans
+
+    def AssignLines(self, off):
+        """Set the inline and line fields of the spokes of Offset off."""
+
+        for f in off.facespokes:
+            n = len(f)
+            for (i, spoke) in enumerate(f):
+                spoke.line = self.Line(spoke.origin, f[(i + 1) % n].origin)
+            for (i, spoke) in enumerate(f):
+                spoke.inline = f[i - 1].line
+
+    def AddFaceLines(self, off):
+        """Give the edges of the faces just made at the ends of the
+        spokes of off (see Offset.MakeNewFaces) the lines of the edges
+        they came from."""
+
+        for f in off.facespokes:
+            n = len(f)
+            for (i, spoke) in enumerate(f):
+                nextspoke = f[(i + 1) % n]
+                if spoke.dest != nextspoke.dest:
+                    self.lines[(spoke.dest, nextspoke.dest)] = spoke.line
+
+    def AddSplitLines(self, newfaces, ev):
+        """Give the two edges that edge event ev will split an edge of
+        newfaces into (see Offset.SplitJoinFaces) the line of that edge.
+        """
+
+        other = ev.other
+        if other.face >= len(newfaces) or newfaces[other.face] is None:
+            return
+        othface = newfaces[other.face]
+        f = othface[other.destindex]
+        g = othface[(other.destindex + 1) % len(othface)]
+        line = self.lines.get((f, g))
+        if line is not None:
+            d = ev.spoke.dest
+            self.lines[(f, d)] = line
+            self.lines[(d, g)] = line
+
+    def EdgeEvents(self, off, spoke, prev_spoke, edges, allspokes, newedges,
+        parent):
+        """Return the next edge events of a reflex spoke of Offset off.
+
+        If spoke's candidates were last used for parent, only the
+        edges in newedges need to be checked for new candidates;
+        otherwise all are.  Then the earliest candidates are checked
+        again with off's spokes.
+
+        Args:
+          off: Offset - the Offset whose events are wanted
+          spoke: Spoke - a reflex spoke of off
+          prev_spoke: Spoke - the spoke before spoke in its face
+          edges: dict of tuple -> Spoke - maps edge keys (see
+              Offset._NextEvents) of off to their start spokes
+          allspokes: list of Spoke - all of off's spokes
+          newedges: list of Spoke - start spokes of the edges of off
+              that weren't edges of parent
+          parent: Offset - the Offset off is inside, or None
+        Returns:
+          list of OffsetEvent - the edge events of spoke with the least
+              time (within TOL), in the order of their edges in off
+        """
+
+        key = (spoke.inline, spoke.line)
+        entry = self.cands.get(key)
+        if parent is None or entry is None or entry[0] is not parent:
+            heap = []
+            tocheck = allspokes
+        else:
+            heap = entry[1]
+            tocheck = newedges
+        self.cands[key] = [off, heap]
+        for other in tocheck:
+            if other is spoke or other is prev_spoke:
+                continue
+            ev = spoke.EdgeEvent(other, off, TOL)
+            if ev:
+                heapq.heappush(heap, (off.timesofar + ev.time,
+                    next(self.seq), _EdgeKey(off, other)))
+        found = []
+        kept = []
+        while heap:
+            (t, k, ekey) = heap[0]
+            if found and t > found[0][0] + TOL:
+                break
+            heapq.heappop(heap)
+            other = edges.get(ekey)
+            if other is None or other is spoke or other is prev_spoke:
+                continue
+            ev = spoke.EdgeEvent(other, off, TOL)
+            if ev is None:
+                continue
+            evt = off.timesofar + ev.time
+            if abs(evt - t) > TOL:
+                heapq.heappush(heap, (evt, next(self.seq), ekey))
+                continue
+            kept.append((t, k, ekey))
+            # an intersection just past an end of the edge (or just
+            # behind the spoke) may come and go with roundoff from one
+            # Offset to the next, so it stays a candidate
+            ev = spoke.EdgeEvent(other, off)
+            if ev:
+                found.append((t, ev))
+        for item in kept:
+            heapq.heappush(heap, item)
+        found.sort(key=lambda x: (x[1].other.face, x[1].other.index))
+        return [ev for (_, ev) in found]
+
+
+def _EdgeKey(off, spoke):
+    """Return the key of the edge of Offset off out of spoke's origin:
+    the wavefront lines of spoke and its next spoke."""
+
+    f = off.facespokes[spoke.face]
+    return (spoke.inline, spoke.line, f[(spoke.index + 1) % len(f)].line)
+
+
 class Offset(object):
     """Represents an offset polygonal area, and used to construct one.
 
@@ -423,28 +590,53 @@ class Offset(object):
         """Build the complete Offset structure or up until target time.
 
         Find the next event(s), makes the appropriate inner Offsets
-        that are inside this one, and calls Build on those Offsets to continue
-        the process until only a single point is left or time reaches target.
+        that are inside this one, and continues with those Offsets
+        until only a single point is left or time reaches target.
+
+        The inner Offsets are built one after another (depth first),
+        not by recursion, so there can be any number of events.
+        Only some of the events of each Offset are found again from
+        scratch (see _EventQueue and _NextEvents).
         """
 
-        bestt = 1e100
-        bestevs = [[], []]
-        for f in self.facespokes:
-            for s in f:
-                (t, ve, ee) = self.NextSpokeEvents(s)
-                if t < bestt - TOL:
-                    bestevs = [[], []]
-                    bestt = t
-                if abs(t - bestt) < TOL:
-                    bestevs[0].extend(ve)
-                    bestevs[1].extend(ee)
+        queue = _EventQueue()
+        stack = [(self, target, None, frozenset())]
+        while stack:
+            (o, t, parent, parentedges) = stack.pop()
+            (nexttarget, edges) = o._BuildStep(t, queue, parent,
+                parentedges)
+            if nexttarget > TOL:
+                for inner in reversed(o.inneroffsets):
+                    stack.append((inner, nexttarget, o, edges))
+
+    def _BuildStep(self, target, queue, parent, parentedges):
+        """Do the part of Build for just this Offset.
+
+        Finds the next event(s), and makes the inner Offsets
+        (but doesn't build them).
+
+        Args:
+          target: float - time to build until, relative to this Offset
+          queue: _EventQueue - the wavefront lines and candidate
+              events so far
+          parent: Offset - the Offset this is inside, or None
+          parentedges: set of tuple - the edge keys of parent
+              (see _NextEvents)
+        Returns:
+          (float, set of tuple) - the time left to build the inner
+              Offsets until, and the edge keys of this Offset
+        """
+
+        queue.AssignLines(self)
+        (bestt, bestevs, edges) = self._NextEvents(queue, parent,
+            parentedges)
         if bestt == 1e100:
             # could happen if polygon is oriented wrong
             # or in other special cases
-            return
+            return (0.0, edges)
         if abs(bestt) < TOL:
             # seems to be in a loop, so quit
-            return
+            return (0.0, edges)
         self.endtime = bestt
         (ve, ee) = bestevs
         newfaces = []
@@ -452,17 +644,21 @@ class Offset(object):
         if target < self.endtime:
             self.endtime = target
             newfaces = self.MakeNewFaces(self.endtime)
+            queue.AddFaceLines(self)
         elif ve and not ee:
             # Only vertex events.
             # Merging of successive vertices in inset face will
             # take care of the vertex events
             newfaces = self.MakeNewFaces(self.endtime)
+            queue.AddFaceLines(self)
         else:
             # Edge events too
             # First make the new faces (handles all vertex events)
             newfaces = self.MakeNewFaces(self.endtime)
+            queue.AddFaceLines(self)
             # Only do one edge event (handle other simultaneous edge
-            # events in subsequent recursive Build calls)
+            # events in subsequent Build steps)
+            queue.AddSplitLines(newfaces, ee[0])
             splitjoin = self.SplitJoinFaces(newfaces, ee[0])
         nexttarget = target - self.endtime
         if len(newfaces) > 0:
@@ -517,9 +713,74 @@ class Offset(object):
             self.inneroffsets = [Offset(pa, newt, self.vspeed)]
             if pa2:
                 self.inneroffsets.append(Offset(pa2, newt, self.vspeed))
-            if nexttarget > TOL:
-                for o in self.inneroffsets:
-                    o.Build(nexttarget)
+        return (nexttarget, edges)
+
+    def _NextEvents(self, queue, parent, parentedges):
+        """Find the next events of this Offset, for Build.
+
+        Like calling NextSpokeEvents on every spoke, but the edge
+        events of reflex spokes are kept in queue as candidates.
+        A reflex spoke that was in parent (with the same wavefront
+        lines) only has to be checked against the edges that weren't;
+        its candidates are checked again before being used, and
+        dropped if their edges are gone.
+
+        Edges are keyed by the wavefront lines of their start spoke
+        and of that spoke's next spoke.
+
+        Args:
+          queue: _EventQueue
+          parent: Offset - the Offset this is inside, or None
+          parentedges: set of tuple - the edge keys of parent
+        Returns:
+          (float, [list of OffsetEvent, list of OffsetEvent],
+              set of tuple) - time of the next event(s), the vertex
+              and edge events happening then, and the edge keys
+              of this Offset
+        """
+
+        edges = dict()
+        newedges = []
+        for f in self.facespokes:
+            n = len(f)
+            for (i, spoke) in enumerate(f):
+                key = (spoke.inline, spoke.line, f[(i + 1) % n].line)
+                edges[key] = spoke
+                if key not in parentedges:
+                    newedges.append(spoke)
+        allspokes = [spoke for f in self.facespokes for spoke in f]
+        bestt = 1e100
+        bestevs = [[], []]
+        for f in self.facespokes:
+            n = len(f)
+            for spoke in f:
+                # vertex event, as in NextSpokeEvents
+                t = 1e100
+                ve = []
+                ee = []
+                ev = spoke.VertexEvent(f[(spoke.index + 1) % n],
+                    self.polyarea.points)
+                if ev:
+                    ve = [ev]
+                    t = ev.time
+                if spoke.is_reflex:
+                    prev_spoke = f[(spoke.index - 1) % n]
+                    found = queue.EdgeEvents(self, spoke, prev_spoke, edges,
+                        allspokes, newedges, parent)
+                    for ev in found:
+                        if ev.time < t - TOL:
+                            ee = []
+                            ve = []
+                            t = ev.time
+                        if abs(ev.time - t) < TOL:
+                            ee.append(ev)
+                if t < bestt - TOL:
+                    bestevs = [[], []]
+                    bestt = t
+                if abs(t - bestt) < TOL:
+                    bestevs[0].extend(ve)
+                    bestevs[1].extend(ee)
+        return (bestt, bestevs, set(edges))
 
     def FaceAtSpokeEnds(self, f, t):
         """Return a new face that is at the spoke ends of face f at time t.
@@ -714,10 +975,15 @@ class Offset(object):
         return max_amount
 
     def _MaxTime(self):
-        if self.inneroffsets:
-            return max([o._MaxTime() for o in self.inneroffsets])
-        else:
-            return self.timesofar + self.endtime
+        ans = 0.0
+        stack = [self]
+        while stack:
+            o = stack.pop()
+            if o.inneroffsets:
+                stack.extend(o.inneroffsets)
+            else:
+                ans = max(ans, o.timesofar + o.endtime)
+        return ans
 
 
 def _AddInnerAreas(off, polyareas):
@@ -733,23 +999,32 @@ def _AddInnerAreas(off, polyareas):
       added to polyareas.
     """
 
-    if off.inneroffsets:
-        for o in off.inneroffsets:
-            _AddInnerAreas(o, polyareas)
-    else:
-        newpa = geom.PolyArea(polyareas.points)
-        for i, f in enumerate(off.facespokes):
-            newface = off.FaceAtSpokeEnds(f, off.endtime)
-            area = abs(geom.SignedArea(newface, polyareas.points))
-            if area < AREATOL:
-                if i == 0:
-                    break
-                else:
-                    continue
+    stack = [off]
+    while stack:
+        o = stack.pop()
+        if o.inneroffsets:
+            stack.extend(reversed(o.inneroffsets))
+        else:
+            _AddInnerArea(o, polyareas)
+
+
+def _AddInnerArea(off, polyareas):
+    """Add the area of innermost offset off to polyareas, if it has
+    non-zero area."""
+
+    newpa = geom.PolyArea(polyareas.points)
+    for i, f in enumerate(off.facespokes):
+        newface = off.FaceAtSpokeEnds(f, off.endtime)
+        area = abs(geom.SignedArea(newface, polyareas.points))
+        if area < AREATOL:
             if i == 0:
-                newpa.poly = newface
-                newpa.data = off.polyarea.data
+                break
             else:
-                newpa.holes.append(newface)
-        if newpa.poly:
-            polyareas.polyareas.append(newpa)
+                continue
+        if i == 0:
+            newpa.poly = newface
+            newpa.data = off.polyarea.data
+        else:
+            newpa.holes.append(newface)
+    if newpa.poly:
+        polyareas.polyareas.append(newpa)
@@ -0,0 +1,820 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""Boolean operations on polygons, and filling by winding rules.
+
+The operands are lists of rings: each ring is a list of vertex
+indices into a geom.Points, and is taken to be closed.
+Rings may cross themselves and each other, and may be oriented
+either way.  The interior of an operand is where the winding
+number of its rings is nonzero (or odd, for the even-odd rule).
+
+All the functions work the same way:
+  1. Find where the ring edges intersect or touch, with a sweep
+     over the edge bounding boxes, and split the edges there.
+  2. Merge coincident edges, keeping for each edge how many times
+     each operand crosses it in each direction.
+  3. Sort the edges around each vertex and trace the faces of
+     the resulting planar arrangement.
+  4. Find the winding numbers of every face, by walking across
+     edges from the face outside each connected component
+     (which is found by shooting a ray to the left).
+  5. Select the faces wanted by the operation, and trace the
+     boundaries between selected and unselected faces into
+     CCW outer rings and CW holes.
+
+New vertices made at intersections are added to the Points,
+and the answers are geom.PolyAreas sharing those Points.
+
+SimpleRings uses the same steps on a single ring, to split
+a self-crossing ring into simple ones.
+"""
+
+__author__ = "howard.trickey@gmail.com"
+
+import math
+from . import geom
+
+# Most inputs need only one or two passes to split all crossings;
+# this just guards against the snapping of crossing points cycling.
+_MAX_SPLIT_PASSES = 10
+
+
+def Union(a, b, points):
+    """Return the union of two operands.
+
+    Args:
+      a: list of list of int - rings of first operand
+      b: list of list of int - rings of second operand
+      points: geom.Points - coordinates for the rings;
+          intersection points will be added
+    Returns:
+      list of geom.PolyArea
+    """
+
+    return _Resolve([a, b], lambda w: w[0] != 0 or w[1] != 0, points)
+
+
+def Intersection(a, b, points):
+    """Return the intersection of two operands.
+
+    Args:
+      a: list of list of int - rings of first operand
+      b: list of list of int - rings of second operand
+      points: geom.Points - coordinates for the rings;
+          intersection points will be added
+    Returns:
+      list of geom.PolyArea
+    """
+
+    return _Resolve([a, b], lambda w: w[0] != 0 and w[1] != 0, points)
+
+
+def Difference(a, b, points):
+    """Return the part of operand a that is not in operand b.
+
+    Args:
+      a: list of list of int - rings of first operand
+      b: list of list of int - rings of second operand
+      points: geom.Points - coordinates for the rings;
+          intersection points will be added
+    Returns:
+      list of geom.PolyArea
+    """
+
+    return _Resolve([a, b], lambda w: w[0] != 0 and w[1] == 0, points)
+
+
+def FillRings(rings, points, evenodd=False):
+    """Return the area filled by rings, as in PostScript or SVG filling.
+
+    Args:
+      rings: list of list of int - the rings (e.g., subpaths of a path)
+      points: geom.Points - coordinates for the rings;
+          intersection points will be added
+      evenodd: bool - if True, use even-odd fill rule,
+          else use nonzero winding rule
+    Returns:
+      list of geom.PolyArea
+    """
+
+    if evenodd:
+        return _Resolve([rings], lambda w: w[0] % 2 != 0, points)
+    else:
+        return _Resolve([rings], lambda w: w[0] != 0, points)
+
+
+def ClipToBox(rings, box, points):
+    """Clip rings to a box, keeping their winding numbers inside it.
+
+    Uses Sutherland-Hodgman clipping against each side of the box in
+    turn.  The answer may have edges going back and forth along the
+    sides of the box, but those cancel out in the other operations
+    here, so this is a cheap way of dropping the parts of big operands
+    that are far from where they matter.
+
+    Args:
+      rings: list of list of int - rings of an operand
+      box: (float, float, float, float) - minx, miny, maxx, maxy
+      points: geom.Points - coordinates for the rings;
+          points where the rings cross the box are added
+    Returns:
+      list of list of int - the clipped rings (those with fewer
+          than three vertices left are dropped)
+    """
+
+    pos = points.pos
+    ans = []
+    for ring in rings:
+        coords = [pos[v] for v in ring]
+        if all([box[0] <= c[0] <= box[2] and box[1] <= c[1] <= box[3] \
+                for c in coords]):
+            ans.append(ring)
+            continue
+        for (k, bound, keepless) in ((0, box[0], False), (0, box[2], True),
+                (1, box[1], False), (1, box[3], True)):
+            if not coords:
+                break
+            clipped = []
+            prev = coords[-1]
+            previn = (prev[k] <= bound) == keepless or prev[k] == bound
+            for cur in coords:
+                curin = (cur[k] <= bound) == keepless or cur[k] == bound
+                if curin != previn:
+                    t = (bound - prev[k]) / (cur[k] - prev[k])
+                    p = [prev[0] + t * (cur[0] - prev[0]),
+                        prev[1] + t * (cur[1] - prev[1])]
+                    p[k] = bound
+                    clipped.append(tuple(p))
+                if curin:
+                    clipped.append(cur)
+                (prev, previn) = (cur, curin)
+            coords = clipped
+        clipring = []
+        for c in coords:
+            v = points.AddPoint(c)
+            if not clipring or clipring[-1] != v:
+                clipring.append(v)
+        while len(clipring) > 1 and clipring[0] == clipring[-1]:
+            clipring.pop()
+        if len(clipring) >= 3:
+            ans.append(clipring)
+    return ans
+
+
+def SimpleRings(ring, points, evenodd=False):
+    """Split a ring that crosses or touches itself into simple rings.
+
+    The answer covers the area the ring alone would fill, using
+    the given fill rule.  A ring that doesn't cross or touch itself
+    is returned unchanged (and this is checked quickly: the sweep
+    finds no splits and no vertex repeats); otherwise the boundary
+    rings of the filled area are returned, all made CCW, so that
+    holes become rings nested inside others.
+    For example, a figure 8 becomes its two lobes.
+
+    Args:
+      ring: list of int - vertex indices of the ring
+      points: geom.Points - coordinates for the ring;
+          intersection points will be added
+      evenodd: bool - if True, use even-odd fill rule,
+          else use nonzero winding rule
+    Returns:
+      list of list of int - simple rings, sharing points
+    """
+
+    n = len(ring)
+    segs = [(ring[i], ring[(i + 1) % n], 0) for i in range(n) \
+        if ring[i] != ring[(i + 1) % n]]
+    if not segs:
+        return []
+    splits = _FindSplits(segs, points)
+    if len(set(ring)) == n and not any(splits):
+        return [ring]
+    edges = _SplitSegments(segs, 1, points, splits)
+    if not edges:
+        return []
+    arr = _Arrangement(edges, points)
+    arr.FindWindings(1)
+    if evenodd:
+        pas = arr.SelectedPolyAreas(lambda w: w[0] % 2 != 0)
+    else:
+        pas = arr.SelectedPolyAreas(lambda w: w[0] != 0)
+    ans = []
+    for pa in pas:
+        ans.append(pa.poly)
+        ans.extend([hole[::-1] for hole in pa.holes])
+    return ans
+
+
+def _Resolve(operands, select, points):
+    """Find the region of the plane where select is true of the windings.
+
+    Args:
+      operands: list of list of rings
+      select: function from tuple of int (winding number with
+          respect to each operand) to bool
+      points: geom.Points
+    Returns:
+      list of geom.PolyArea - with CCW polys and CW holes
+    """
+
+    segs = []
+    for k, rings in enumerate(operands):
+        for ring in rings:
+            n = len(ring)
+            for i in range(n):
+                (u, v) = (ring[i], ring[(i + 1) % n])
+                if u != v:
+                    segs.append((u, v, k))
+    if not segs:
+        return []
+    edges = _SplitSegments(segs, len(operands), points)
+    if not edges:
+        return []
+    arr = _Arrangement(edges, points)
+    arr.FindWindings(len(operands))
+    return arr.SelectedPolyAreas(select)
+
+
+def _SplitSegments(segs, nops, points, splits=None):
+    """Split segments where they touch or cross, and merge duplicates.
+
+    Intersection points may merge with nearby vertices (when they
+    quantize the same), and segments are split at vertices that
+    are just near them, so the pieces of split segments can move
+    a little and cross segments they didn't before.  So the moved
+    pieces made by one pass are checked again against all the
+    edges, until no more splits are found.
+
+    Args:
+      segs: list of (int, int, int) - (start vertex, end vertex, operand)
+      nops: int - number of operands
+      points: geom.Points - intersection points are added to this
+      splits: list of list of (float, int, bool) - if given, the
+          result of _FindSplits(segs, points)
+    Returns:
+      dict - maps (u, v), u < v, to tuple of int: the number of times
+          each operand goes from u to v minus the number of times it
+          goes from v to u; only edges with some nonzero count are kept
+    """
+
+    if splits is None:
+        splits = _FindSplits(segs, points)
+    edges = dict()
+    fresh = set()
+    for i, (u, v, k) in enumerate(segs):
+        delta = [0] * nops
+        delta[k] = 1
+        _AddSplitEdge(edges, fresh, u, v, delta, splits[i])
+    for npass in range(_MAX_SPLIT_PASSES):
+        keys = [key for (key, d) in edges.items() if any(d)]
+        fresh = set([i for i, key in enumerate(keys) if key in fresh])
+        if not fresh:
+            break
+        esegs = [(u, v, 0) for (u, v) in keys]
+        splits = _FindSplits(esegs, points, fresh)
+        if not any(splits):
+            break
+        old = edges
+        edges = dict()
+        fresh = set()
+        for i, (u, v) in enumerate(keys):
+            _AddSplitEdge(edges, fresh, u, v, old[(u, v)], splits[i])
+    return dict([(key, tuple(d)) for (key, d) in edges.items() if any(d)])
+
+
+def _AddSplitEdge(edges, fresh, u, v, delta, splits):
+    """Add the pieces of segment uv, split at splits, to edges.
+
+    Args:
+      edges: dict - maps (a, b), a < b, to list of int (see _SplitSegments)
+      fresh: set of (int, int) - the keys of pieces of segments
+          split at moved vertices are added to this
+      u: int - start vertex
+      v: int - end vertex
+      delta: list of int - windings deltas of uv
+      splits: list of (float, int, bool) - see _Intersect
+    """
+
+    chain = [u]
+    moved = False
+    if splits:
+        splits.sort()
+        chain.extend([w for (_, w, _) in splits])
+        moved = any([m for (_, _, m) in splits])
+    chain.append(v)
+    for m in range(len(chain) - 1):
+        (a, b) = (chain[m], chain[m + 1])
+        if a == b:
+            continue
+        if a < b:
+            key = (a, b)
+            d = 1
+        else:
+            key = (b, a)
+            d = -1
+        e = edges.get(key)
+        if e is None:
+            e = [0] * len(delta)
+            edges[key] = e
+        for k in range(len(delta)):
+            e[k] += d * delta[k]
+        if moved:
+            fresh.add(key)
+
+
+def _FindSplits(segs, points, fresh=None):
+    """Find where segments touch or cross each other.
+
+    Args:
+      segs: list of (int, int, int) - see _SplitSegments
+      points: geom.Points - intersection points are added to this
+      fresh: set of int - if given, only look at pairs
+          where at least one segment index is in fresh
+    Returns:
+      list of list of (float, int, bool) - for each segment, the
+          parameter and vertex of places to split it (unsorted),
+          and whether the split moves the pieces (see _Intersect)
+    """
+
+    splits = [[] for s in segs]
+    for (i, j) in _CandidatePairs(segs, points.pos, fresh):
+        _Intersect(i, j, segs, splits, points)
+    return splits
+
+
+def _CandidatePairs(segs, pos, fresh=None):
+    """Yield pairs of indices of segs whose bounding boxes overlap.
+
+    Sweeps a vertical line across the segments in order of their
+    leftmost x, keeping the list of segments the line crosses.
+    If fresh is given, only pairs with at least one segment in fresh
+    are wanted: then the other segments the line crosses are kept
+    in a separate list, only pruned when a fresh segment is reached,
+    so that a pass with few fresh segments is quick.
+    """
+
+    tol = geom.DISTTOL
+    boxes = []
+    for (u, v, _) in segs:
+        (x0, y0) = (pos[u][0], pos[u][1])
+        (x1, y1) = (pos[v][0], pos[v][1])
+        boxes.append((min(x0, x1) - tol, min(y0, y1) - tol,
+            max(x0, x1) + tol, max(y0, y1) + tol))
+    active = []
+    cold = []
+    for i in sorted(range(len(segs)), key=lambda s: boxes[s][0]):
+        (minx, miny, maxx, maxy) = boxes[i]
+        active = [a for a in active if boxes[a][2] >= minx]
+        for a in active:
+            if boxes[a][1] <= maxy and boxes[a][3] >= miny:
+                yield (a, i)
+        if fresh is None or i in fresh:
+            cold = [a for a in cold if boxes[a][2] >= minx]
+            for a in cold:
+                if boxes[a][1] <= maxy and boxes[a][3] >= miny:
+                    yield (a, i)
+            active.append(i)
+        else:
+            cold.append(i)
+
+
+def _Intersect(i, j, segs, splits, points):
+    """Record where segments i and j touch or cross.
+
+    If an end of one segment is on (or within geom.DISTTOL of)
+    the other, the other is split there at that end vertex.
+    This also takes care of collinear overlapping segments.
+    Otherwise, if they cross, both are split at a new vertex.
+
+    Args:
+      i: int - index in segs
+      j: int - index in segs
+      segs: list of (int, int, int) - see _SplitSegments
+      splits: list of list of (float, int, bool) - for each segment,
+          the parameter and vertex of places to split it, and whether
+          the vertex is off the segment (so the pieces are moved);
+          updated by this function
+      points: geom.Points
+    """
+
+    pos = points.pos
+    (p0, p1, _) = segs[i]
+    (q0, q1, _) = segs[j]
+    touched = False
+    for (s, e0, e1, t, o) in ((i, p0, p1, j, q0), (i, p0, p1, j, q1),
+            (j, q0, q1, i, p0), (j, q0, q1, i, p1)):
+        if o == e0 or o == e1:
+            continue
+        tparam = _TouchParam(pos[e0], pos[e1], pos[o])
+        if tparam is not None:
+            splits[s].append((tparam, o, True))
+            touched = True
+    if touched or p0 in (q0, q1) or p1 in (q0, q1):
+        return
+    (ax, ay) = (pos[p0][0], pos[p0][1])
+    (bx, by) = (pos[p1][0], pos[p1][1])
+    (cx, cy) = (pos[q0][0], pos[q0][1])
+    (dx, dy) = (pos[q1][0], pos[q1][1])
+    (d1x, d1y) = (bx - ax, by - ay)
+    (d2x, d2y) = (dx - cx, dy - cy)
+    o1 = d1x * (cy - ay) - d1y * (cx - ax)
+    o2 = d1x * (dy - ay) - d1y * (dx - ax)
+    o3 = d2x * (ay - cy) - d2y * (ax - cx)
+    o4 = d2x * (by - cy) - d2y * (bx - cx)
+    if not ((o1 > 0.0 > o2 or o1 < 0.0 < o2) and \
+            (o3 > 0.0 > o4 or o3 < 0.0 < o4)):
+        return
+    denom = d1x * d2y - d1y * d2x
+    t = ((cx - ax) * d2y - (cy - ay) * d2x) / denom
+    u = ((cx - ax) * d1y - (cy - ay) * d1x) / denom
+    n = len(pos)
+    w = points.AddPoint((ax + t * d1x, ay + t * d1y))
+    # if w is an existing point, the pieces are moved off the segments
+    moved = len(pos) == n
+    if w not in (p0, p1):
+        splits[i].append((t, w, moved))
+    if w not in (q0, q1):
+        splits[j].append((u, w, moved))
+
+
+def _TouchParam(a, b, p):
+    """If p is on the interior of segment ab, return its parameter there.
+
+    Args:
+      a: coordinate tuple - segment start
+      b: coordinate tuple - segment end
+      p: coordinate tuple - point to test
+    Returns:
+      float in (0, 1), or None if p is not within geom.DISTTOL of
+      the segment (or is nearest to one of its ends, or is within
+      geom.DISTTOL of one of them - else a few vertices all close
+      together could keep splitting each other's edges)
+    """
+
+    (dx, dy) = (b[0] - a[0], b[1] - a[1])
+    len2 = dx * dx + dy * dy
+    if len2 == 0.0:
+        return None
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / len2
+    if t <= 0.0 or t >= 1.0:
+        return None
+    tol2 = geom.DISTTOL * geom.DISTTOL
+    ex = a[0] + t * dx - p[0]
+    ey = a[1] + t * dy - p[1]
+    if ex * ex + ey * ey > tol2:
+        return None
+    for q in (a, b):
+        (qx, qy) = (p[0] - q[0], p[1] - q[1])
+        if qx * qx + qy * qy <= tol2:
+            return None
+    return t
+
+
+class _Arrangement(object):
+    """The planar subdivision made by a set of non-crossing edges.
+
+    Half-edges are (u, v) vertex pairs; the face of a half-edge
+    is the one on its left.
+
+    Attributes:
+      edges: dict - maps (u, v), u < v, to tuple of winding deltas
+          (see _SplitSegments)
+      points: geom.Points
+      around: dict - maps vertex to list of neighbor vertices,
+          in CCW order around the vertex
+      index: dict - maps half-edge (u, v) to index of v in around[u]
+      hedges: list of (int, int) - all half-edges
+      face: dict - maps half-edge to its face number
+      cycles: list of list of (int, int) - half-edges around each face
+      winding: list of tuple of int - winding numbers of each face
+      region: list of int - for union-find of faces into regions
+    """
+
+    def __init__(self, edges, points):
+        self.edges = edges
+        self.points = points
+        pos = points.pos
+        self.around = dict()
+        self.hedges = []
+        for (u, v) in edges:
+            self.hedges.append((u, v))
+            self.hedges.append((v, u))
+            self.around.setdefault(u, []).append(v)
+            self.around.setdefault(v, []).append(u)
+        self.index = dict()
+        for (u, nbrs) in self.around.items():
+            (x, y) = (pos[u][0], pos[u][1])
+            nbrs.sort(key=lambda v: math.atan2(pos[v][1] - y, pos[v][0] - x))
+            for i, v in enumerate(nbrs):
+                self.index[(u, v)] = i
+        self.face = dict()
+        self.cycles = []
+        for h in self.hedges:
+            if h in self.face:
+                continue
+            f = len(self.cycles)
+            cycle = []
+            while h not in self.face:
+                self.face[h] = f
+                cycle.append(h)
+                h = self.Next(h)
+            self.cycles.append(cycle)
+        self.winding = [None] * len(self.cycles)
+        self.region = list(range(len(self.cycles)))
+
+    def Next(self, h):
+        """Return the half-edge following h around its face."""
+
+        (u, v) = h
+        nbrs = self.around[v]
+        return (v, nbrs[self.index[(v, u)] - 1])
+
+    def Delta(self, h):
+        """Return winding number on left of h minus that on its right."""
+
+        (u, v) = h
+        if u < v:
+            return self.edges[(u, v)]
+        else:
+            return tuple([-d for d in self.edges[(v, u)]])
+
+    def FaceRightOf(self, v):
+        """Return the face just to the right (+x direction) of vertex v."""
+
+        pos = self.points.pos
+        (x, y) = (pos[v][0], pos[v][1])
+        nbrs = self.around[v]
+        # the face is left of the edge to the neighbor with the
+        # largest angle less than 0 (cyclically)
+        w = nbrs[-1]
+        for u in nbrs:
+            if math.atan2(pos[u][1] - y, pos[u][0] - x) < 0.0:
+                w = u
+            else:
+                break
+        return self.face[(v, w)]
+
+    def CycleArea(self, f):
+        pos = self.points.pos
+        a = 0.0
+        for (u, v) in self.cycles[f]:
+            a += pos[u][0] * pos[v][1] - pos[u][1] * pos[v][0]
+        return 0.5 * a
+
+    def FindWindings(self, nops):
+        """Set the winding numbers of all faces.
+
+        Each connected component has one outside cycle (CW).
+        The winding number of the outside of a component is that
+        of the face of some other component that contains it:
+        the one whose nearest edge is hit by a ray going left
+        from the component's leftmost vertex.  So components are
+        done in order of their leftmost vertex, and then the
+        windings across the component's edges follow from the deltas.
+        Also joins the outside cycle of each component into
+        the same region as the containing face.
+
+        Args:
+          nops: int - number of operands
+        """
+
+        pos = self.points.pos
+        ncycles = len(self.cycles)
+        comp = [None] * ncycles
+        comps = []
+        for f in range(ncycles):
+            if comp[f] is not None:
+                continue
+            c = len(comps)
+            members = [f]
+            comp[f] = c
+            k = 0
+            while k < len(members):
+                for (u, v) in self.cycles[members[k]]:
+                    g = self.face[(v, u)]
+                    if comp[g] is None:
+                        comp[g] = c
+                        members.append(g)
+                k += 1
+            outside = min(members, key=self.CycleArea)
+            (lx, ly, lv) = min([(pos[u][0], pos[u][1], u) \
+                for (u, _) in self.cycles[outside]])
+            comps.append((lx, ly, lv, outside, members))
+        hcomp = dict([(h, comp[self.face[h]]) for h in self.hedges])
+        index = _StripIndex([(pos[u][0], pos[u][1], pos[v][0], pos[v][1],
+            (u, v)) for (u, v) in self.edges], pos)
+        zero = tuple([0] * nops)
+        for (lx, ly, lv, outside, members) in sorted(comps):
+            hit = index.NearestLeft(lx, ly,
+                lambda e: hcomp[e] == comp[outside])
+            if hit is None:
+                self.winding[outside] = zero
+            else:
+                (u, v) = hit
+                if pos[u][1] == ly:
+                    # ray hit a vertex
+                    g = self.FaceRightOf(u)
+                elif pos[v][1] == ly:
+                    g = self.FaceRightOf(v)
+                else:
+                    # want the downward half-edge, whose left side faces us
+                    if pos[u][1] < pos[v][1]:
+                        hit = (v, u)
+                    g = self.face[hit]
+                self.winding[outside] = self.winding[g]
+                self._Join(outside, g)
+            queue = [outside]
+            k = 0
+            while k < len(queue):
+                f = queue[k]
+                wf = self.winding[f]
+                for h in self.cycles[f]:
+                    g = self.face[(h[1], h[0])]
+                    if self.winding[g] is None:
+                        d = self.Delta(h)
+                        self.winding[g] = tuple([wf[i] - d[i] \
+                            for i in range(nops)])
+                        queue.append(g)
+                k += 1
+
+    def SelectedPolyAreas(self, select):
+        """Return PolyAreas for the faces whose windings satisfy select.
+
+        Args:
+          select: function from tuple of int to bool
+        Returns:
+          list of geom.PolyArea
+        """
+
+        sel = [select(w) for w in self.winding]
+        boundary = []
+        bset = set()
+        for h in self.hedges:
+            f = self.face[h]
+            g = self.face[(h[1], h[0])]
+            if sel[f]:
+                if sel[g]:
+                    self._Join(f, g)
+                else:
+                    boundary.append(h)
+                    bset.add(h)
+        # trace the boundary rings, taking the sharpest left turn
+        # at each vertex so that rings touching at a vertex stay separate
+        rings = []
+        done = set()
+        for h in boundary:
+            if h in done:
+                continue
+            start = h
+            ring = []
+            while h not in done:
+                done.add(h)
+                (u, v) = h
+                ring.append(u)
+                nbrs = self.around[v]
+                i = self.index[(v, u)]
+                for k in range(1, len(nbrs) + 1):
+                    h = (v, nbrs[i - k])
+                    if h in bset:
+                        break
+            r = self._Find(self.face[start])
+            rings.extend([(r, loop) for loop in _SplitRing(ring)])
+        # group the rings into regions: one outer ring plus holes
+        regions = dict()
+        order = []
+        tinyarea = geom.DISTTOL * geom.DISTTOL
+        for (r, ring) in rings:
+            area = geom.SignedArea(ring, self.points)
+            if abs(area) <= tinyarea:
+                # slivers left by snapping near-coincident crossings
+                continue
+            if r not in regions:
+                regions[r] = ([], [])
+                order.append(r)
+            regions[r][0 if area > 0.0 else 1].append(ring)
+        ans = []
+        for r in order:
+            (outers, holes) = regions[r]
+            if len(outers) != 1:
+                # shouldn't happen
+                print("whoops, polybool region with", len(outers), "outers")
+                if not outers:
+                    continue
+            ans.append(geom.PolyArea(self.points, outers[0], holes))
+            for outer in outers[1:]:
+                ans.append(geom.PolyArea(self.points, outer))
+        return ans
+
+    def _Find(self, f):
+        while self.region[f] != f:
+            self.region[f] = self.region[self.region[f]]
+            f = self.region[f]
+        return f
+
+    def _Join(self, f, g):
+        (rf, rg) = (self._Find(f), self._Find(g))
+        if rf != rg:
+            self.region[max(rf, rg)] = min(rf, rg)
+
+
+def _SplitRing(ring):
+    """Split a ring that touches itself into loops that don't.
+
+    A hole touching the outside of its region at a vertex is traced
+    as part of the outer ring; this separates it again.
+
+    Args:
+      ring: list of int - vertices, maybe with repeats
+    Returns:
+      list of list of int - the loops between repeated vertices
+    """
+
+    ans = []
+    stack = []
+    at = dict()
+    for v in ring:
+        if v in at:
+            p = at[v]
+            ans.append(stack[p:])
+            for u in stack[p:]:
+                del at[u]
+            del stack[p:]
+        at[v] = len(stack)
+        stack.append(v)
+    ans.append(stack)
+    return ans
+
+
+class _StripIndex(object):
+    """Edges bucketed into horizontal strips, for horizontal ray queries.
+
+    Attributes:
+      edges: list of (x0, y0, x1, y1, tag)
+      ymin: float - bottom of the lowest strip
+      height: float - height of each strip
+      strips: list of list of int - indices of edges that overlap
+          each strip in y
+    """
+
+    def __init__(self, edges, pos):
+        self.edges = edges
+        ys = [e[1] for e in edges] + [e[3] for e in edges]
+        self.ymin = min(ys)
+        n = max(1, int(math.sqrt(len(edges))))
+        self.height = (max(ys) - self.ymin) / n
+        if self.height <= 0.0:
+            self.height = 1.0
+        self.strips = [[] for i in range(n)]
+        for i, (x0, y0, x1, y1, _) in enumerate(edges):
+            for s in range(self._Strip(min(y0, y1)),
+                    self._Strip(max(y0, y1)) + 1):
+                self.strips[s].append(i)
+
+    def _Strip(self, y):
+        s = int((y - self.ymin) / self.height)
+        return min(max(s, 0), len(self.strips) - 1)
+
+    def NearestLeft(self, px, py, ignore):
+        """Find the nearest edge crossed by a ray going left from (px, py).
+
+        An edge is crossed if one end is above py and the other is not,
+        and it crosses y = py at some x < px.
+
+        Args:
+          px: float
+          py: float
+          ignore: function from tag to bool - skip edges where it is True
+        Returns:
+          the tag of the nearest crossed edge, or None
+        """
+
+        best = None
+        bestx = None
+        for i in self.strips[self._Strip(py)]:
+            (x0, y0, x1, y1, tag) = self.edges[i]
+            if (y0 > py) == (y1 > py):
+                continue
+            x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+            if x < px and (bestx is None or x > bestx) and not ignore(tag):
+                best = tag
+                bestx = x
+        return best
@@ -20,10 +20,29 @@
 
 
 from . import geom
+from . import halfedge
+import array
+import bisect
+import collections
+import itertools
 import math
-import random
+import time
+from fractions import Fraction
 from math import sqrt
 
+try:
+    import numpy
+except ImportError:
+    # Blender's bundled Python may not have numpy;
+    # then the _*Batch kernels work one edge at a time.
+    numpy = None
+
+try:
+    import concurrent.futures
+except ImportError:
+    # then QuadrangulateMany always works in this process
+    concurrent = None
+
 # Points are 3-tuples or 2-tuples of reals: (x,y,z) or (x,y)
 # Faces are lists of integers (vertex indices into coord lists)
 # After triangulation/quadrangulation, the tris and quads will
@@ -31,9 +50,35 @@ from math import sqrt
 # Vmaps are lists taking vertex index -> Point
 
 TOL = 1e-7     # a tolerance for fuzzy equality
-GTHRESH = 75   # threshold above which use greedy to _Quandrangulate
+BTHRESH = 1000 # threshold above which _MaxMatch doesn't use blossoms
 ANGFAC = 1.0   # weighting for angles in quad goodness measure
 DEGFAC = 10.0  # weighting for degree in quad goodness measure
+JTHRESH = 4    # threshold above which _JoinIslands indexes the face
+NTHRESH = 64   # threshold above which the _*Batch kernels use numpy
+
+# Triangulation algorithms:
+# 'EARCHOP' - ear chopping, then flipping edges to make it a
+#     constrained Delaunay triangulation (worst case O(n^3))
+# 'SWEEP' - sweep-line Delaunay triangulation of the vertices,
+#     then inserting the boundary edges (see _SweepCDT)
+ALGORITHM = 'SWEEP'  # default algorithm
+
+# If > 0, the default number of seconds of work allowed for each face
+# passed to the Triangulate* and Quadrangulate* functions; after that,
+# cheaper methods are used (see _Work)
+BUDGET = 0.0
+
+# Triangulations and quadrangulations are remembered (see _TriQuadCache)
+# so that faces that are the same up to translation as one done before,
+# such as repeated letters or symbols, needn't be done again.
+# CACHE_SIZE is the most faces remembered (0 turns the cache off);
+# coordinates are compared after rounding to multiples of _CACHE_QUANTUM.
+CACHE_SIZE = 5000
+_CACHE_QUANTUM = 1e-7
+
+# When quadrangulating in several processes, the faces are split into
+# about this many chunks per process, to even out the work.
+_CHUNKS_PER_WORKER = 4
 
 # Angle kind constants
 Ang0 = 1
@@ -43,15 +88,25 @@ Angtangential = 4
 Ang360 = 5
 
 
-def TriangulateFace(face, points):
+def TriangulateFace(face, points, algorithm=None, stats=None, budget=None):
     """Triangulate the given face.
 
-    Uses an easy triangulation first, followed by a constrained delauney
-    triangulation to get better shaped triangles.
+    Makes a constrained delauney triangulation, to get well shaped
+    triangles.  With the 'EARCHOP' algorithm, uses an easy
+    triangulation first, followed by edge flipping; with 'SWEEP'
+    the triangulation is made directly (see _SweepCDT).
+    Strictly convex faces skip all that and are cut into a strip
+    (see _ConvexStrip), and faces that are translated copies of
+    ones done before are taken from the cache (see _TriQuadCache).
 
     Args:
       face: list of int - indices in points, assumed CCW-oriented
       points: geom.Points - holds coordinates for vertices
+      algorithm: string - 'EARCHOP' or 'SWEEP'; if None, ALGORITHM
+      stats: TriQuadStats - if given, counts of the work done are
+          added to this
+      budget: float - if > 0, seconds of work allowed for the face
+          (see _Work); if None, BUDGET
     Returns:
       list of (int, int, int) - 3-tuples are CCW-oriented vertices of
           triangles making up the triangulation
@@ -59,49 +114,54 @@ def TriangulateFace(face, points):
 
     if len(face) <= 3:
         return [tuple(face)]
-    tris = EarChopTriFace(face, points)
-    bord = _BorderEdges([face])
-    triscdt = _CDT(tris, bord, points)
-    return triscdt
+    ans = _ConvexStrip(face, points, False, stats)
+    if ans is not None:
+        return ans
+    return _CachedTriQuad(face, [], points, algorithm, False, stats, budget)
 
 
-def TriangulateFaceWithHoles(face, holes, points):
+def TriangulateFaceWithHoles(face, holes, points, algorithm=None, stats=None,
+    budget=None):
     """Like TriangulateFace, but with holes inside the face.
 
-    Works by making one complex polygon that has segments to
-    and from the holes ("islands"), and then using the same method
-    as TriangulateFace.
+    With the 'EARCHOP' algorithm, works by making one complex
+    polygon that has segments to and from the holes ("islands"),
+    and then using the same method as TriangulateFace.
 
     Args:
       face: list of int - indices in points, assumed CCW-oriented
       holes: list of list of int - each sublist is like face
           but CW-oriented and assumed to be inside face
       points: geom.Points - holds coordinates for vertices
+      algorithm: string - 'EARCHOP' or 'SWEEP'; if None, ALGORITHM
+      stats: TriQuadStats - if given, counts are added to this
+      budget: float - seconds of work allowed (see TriangulateFace)
     Returns:
       list of (int, int, int) - 3-tuples are CCW-oriented vertices of
           triangles making up the triangulation
     """
 
     if len(holes) == 0:
-        return TriangulateFace(face, points)
-    allfaces = [face] + holes
-    sholes = [_SortFace(h, points) for h in holes]
-    joinedface = _JoinIslands(face, sholes, points)
-    tris = EarChopTriFace(joinedface, points)
-    bord = _BorderEdges(allfaces)
-    triscdt = _CDT(tris, bord, points)
-    return triscdt
+        return TriangulateFace(face, points, algorithm, stats, budget)
+    return _CachedTriQuad(face, holes, points, algorithm, False, stats,
+        budget)
 
 
-def QuadrangulateFace(face, points):
+def QuadrangulateFace(face, points, algorithm=None, stats=None, budget=None):
     """Quadrangulate the face (subdivide into convex quads and tris).
 
     Like TriangulateFace, but after triangulating, join as many pairs
     of triangles as possible into convex quadrilaterals.
+    Strictly convex faces are cut directly into a strip of quads
+    (and a triangle, if the number of vertices is odd); so convex
+    quadrilaterals, such as rectangles, are returned as is.
 
     Args:
       face: list of int - indices in points, assumed CCW-oriented
       points: geom.Points - holds coordinates for vertices
+      algorithm: string - triangulation algorithm (see TriangulateFace)
+      stats: TriQuadStats - if given, counts are added to this
+      budget: float - seconds of work allowed (see TriangulateFace)
     Returns:
       list of 3-tuples or 4-tuples of ints - CCW-oriented vertices of
           quadrilaterals and triangles making up the quadrangulation.
@@ -109,14 +169,14 @@ def QuadrangulateFace(face, points):
 
     if len(face) <= 3:
         return [tuple(face)]
-    tris = EarChopTriFace(face, points)
-    bord = _BorderEdges([face])
-    triscdt = _CDT(tris, bord, points)
-    qs = _Quandrangulate(triscdt, bord, points)
-    return qs
+    ans = _ConvexStrip(face, points, True, stats)
+    if ans is not None:
+        return ans
+    return _CachedTriQuad(face, [], points, algorithm, True, stats, budget)
 
 
-def QuadrangulateFaceWithHoles(face, holes, points):
+def QuadrangulateFaceWithHoles(face, holes, points, algorithm=None,
+    stats=None, budget=None):
     """Like QuadrangulateFace, but with holes inside the faces.
 
     Args:
@@ -124,21 +184,863 @@ def QuadrangulateFaceWithHoles(face, holes, points):
       holes: list of list of int - each sublist is like face
           but CW-oriented and assumed to be inside face
       points: geom.Points - holds coordinates for vertices
+      algorithm: string - triangulation algorithm (see TriangulateFace)
+      stats: TriQuadStats - if given, counts are added to this
+      budget: float - seconds of work allowed (see TriangulateFace)
     Returns:
       list of 3-tuples or 4-tuples of ints - CCW-oriented vertices of
           quadrilaterals and triangles making up the quadrangulation.
     """
 
     if len(holes) == 0:
-        return QuadrangulateFace(face, points)
+        return QuadrangulateFace(face, points, algorithm, stats, budget)
+    return _CachedTriQuad(face, holes, points, algorithm, True, stats,
+        budget)
+
+
+def QuadrangulateMany(faces, points, algorithm=None, stats=None,
+    budget=None, workers=1):
+    """Quadrangulate a list of faces with holes, all with the same points.
+
+    Like calling QuadrangulateFaceWithHoles on each, but if workers
+    is more than 1, the faces that aren't convex are quadrangulated
+    in that many worker processes.  Each worker is sent a chunk of
+    faces with about the same number of vertices, and compact arrays
+    of just the vertices they use and their coordinates (see
+    _ChunkArgs).  The vertex numbers stay the same (tie-breaking in
+    the triangulation and matching can depend on them), so the
+    answer is the same as doing them here, in the same order.
+
+    Args:
+      faces: list of (list of int, list of list of int) - each is a
+          CCW-oriented face and its CW-oriented holes, as indices
+          in points
+      points: geom.Points - holds coordinates for vertices
+      algorithm: string - triangulation algorithm (see TriangulateFace)
+      stats: TriQuadStats - if given, counts are added to this
+      budget: float - seconds of work allowed per face
+          (see TriangulateFace)
+      workers: int - number of processes to use
+    Returns:
+      list of list of 3-tuples or 4-tuples of ints - parallel to faces,
+          the quadrangulation of each (see QuadrangulateFace)
+    """
+
+    if workers <= 1 or concurrent is None or len(faces) <= 1:
+        return [QuadrangulateFaceWithHoles(face, holes, points, algorithm,
+            stats, budget) for (face, holes) in faces]
+    if algorithm is None:
+        algorithm = ALGORITHM
+    if budget is None:
+        budget = BUDGET
+    ans = [None] * len(faces)
+    todo = []
+    for (i, (face, holes)) in enumerate(faces):
+        if len(face) <= 3 and not holes:
+            ans[i] = [tuple(face)]
+        elif not holes:
+            ans[i] = _ConvexStrip(face, points, True, stats)
+        if ans[i] is None:
+            todo.append(i)
+    if not todo:
+        return ans
+    sizes = [len(faces[i][0]) + sum([len(h) for h in faces[i][1]])
+        for i in todo]
+    target = sum(sizes) / float(workers * _CHUNKS_PER_WORKER)
+    chunks = []
+    chunk = []
+    size = 0
+    for (i, n) in zip(todo, sizes):
+        chunk.append(i)
+        size += n
+        if size >= target:
+            chunks.append(chunk)
+            (chunk, size) = ([], 0)
+    if chunk:
+        chunks.append(chunk)
+    args = [_ChunkArgs([faces[i] for i in c], points) for c in chunks]
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(_QuadrangulateChunk,
+            [a[0] for a in args], [a[1] for a in args],
+            [[faces[i] for i in c] for c in chunks],
+            [algorithm] * len(chunks), [budget] * len(chunks)))
+    for (c, (chunkans, chunkstats)) in zip(chunks, results):
+        for (i, qs) in zip(c, chunkans):
+            ans[i] = qs
+        if stats is not None:
+            stats.Add(chunkstats)
+    return ans
+
+
+def _ChunkArgs(faces, points):
+    """Return the vertices used by a chunk of faces with holes,
+    for sending to a worker.
+
+    Returns:
+      (array.array, array.array) - the vertices used, in order of
+          first use, and their x and y coordinates, one after another
+    """
+
+    verts = array.array('l')
+    seen = set()
+    for (face, holes) in faces:
+        for ring in [face] + holes:
+            for v in ring:
+                if v not in seen:
+                    seen.add(v)
+                    verts.append(v)
+    pos = points.pos
+    coords = array.array('d', [x for v in verts for x in pos[v][:2]])
+    return (verts, coords)
+
+
+def _QuadrangulateChunk(verts, coords, faces, algorithm, budget):
+    """Quadrangulate a chunk of faces, in a worker process.
+
+    Args:
+      verts: array.array - the vertices used by faces
+      coords: array.array - their x and y coordinates, one after another
+      faces: list of (list of int, list of list of int) - faces with holes
+      algorithm: string - triangulation algorithm
+      budget: float - seconds of work allowed per face
+    Returns:
+      (list of list of tuple of int, TriQuadStats) - the
+          quadrangulation of each face, and the counts
+    """
+
+    points = geom.Points()
+    points.pos = [None] * (max(verts) + 1)
+    for (i, v) in enumerate(verts):
+        points.pos[v] = (coords[2 * i], coords[2 * i + 1])
+    stats = TriQuadStats()
+    ans = [QuadrangulateFaceWithHoles(face, holes, points, algorithm,
+        stats, budget) for (face, holes) in faces]
+    return (ans, stats)
+
+
+class TriQuadStats(object):
+    """Counts of the work done triangulating and quadrangulating faces.
+
+    Attributes:
+      faces: int - number of faces triangulated
+      convex_faces: int - number of those that were strictly convex,
+        so were cut directly into strips (see _ConvexStrip)
+      single_quads: int - number of convex faces with four vertices,
+        returned as is by the Quadrangulate* functions
+      cache_hits: int - number of faces whose triangulation or
+        quadrangulation was found in the cache (see _TriQuadCache)
+      cache_misses: int - number that had to be done
+      cache_evictions: int - number of cached faces dropped to keep
+        the cache within CACHE_SIZE
+      sweep_fallbacks: int - number of faces that the 'SWEEP'
+        algorithm couldn't triangulate, so were ear chopped
+      ears: list of int - number of ears chopped in each desperation
+        mode (see _IsEar), indexed by mode
+      flips: int - number of edges flipped to make triangulations
+        Delaunay
+      diag_searches: int - number of searches for a diagonal to join
+        a hole to its face
+      tree_matches: int - number of parts of quad matchings done by
+        dynamic programming on a tree (see _MaxMatch)
+      blossom_matches: int - number done by the blossom algorithm
+      forest_matches: int - number done on a spanning forest
+      blossom_stages: int - number of augmenting stages of the
+        blossom algorithm
+      over_budget: int - number of faces whose budget ran out
+      warnings: list of str - what was done instead when budgets
+        ran out
+    """
+
+    def __init__(self):
+        self.faces = 0
+        self.convex_faces = 0
+        self.single_quads = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self.sweep_fallbacks = 0
+        self.ears = [0, 0, 0, 0, 0]
+        self.flips = 0
+        self.diag_searches = 0
+        self.tree_matches = 0
+        self.blossom_matches = 0
+        self.forest_matches = 0
+        self.blossom_stages = 0
+        self.over_budget = 0
+        self.warnings = []
+
+    def Add(self, other):
+        """Add the counts in TriQuadStats other to these."""
+
+        for (name, value) in vars(other).items():
+            if name == 'ears':
+                self.ears = [a + b for (a, b) in zip(self.ears, value)]
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+
+class _Work(object):
+    """The counters and time budget for the work on one face.
+
+    When the budget runs out, the slow parts switch to cheaper
+    methods: ear chopping stops checking that ears don't overlap
+    the rest of the face, flipping to make the triangulation
+    Delaunay stops, and quad matching uses spanning forests
+    instead of blossoms.  Each switch adds a warning to stats.
+
+    Attributes:
+      nverts: int - number of vertices on the face's boundary
+      stats: TriQuadStats - where the counts go
+      deadline: float - time.time() at which the budget runs out,
+          or None if there is no budget
+      over: bool - has the budget run out?
+    """
+
+    def __init__(self, face, stats, budget):
+        if budget is None:
+            budget = BUDGET
+        self.nverts = len(face)
+        self.stats = stats if stats is not None else TriQuadStats()
+        self.deadline = time.time() + budget if budget > 0.0 else None
+        self.over = False
+        self.stats.faces += 1
+
+    def Over(self, instead):
+        """Return True if the budget has run out.
+
+        The first time it has, counts that and adds a warning
+        that 'instead' is being done."""
+
+        if self.over:
+            return True
+        if self.deadline is None or time.time() < self.deadline:
+            return False
+        self.over = True
+        self.stats.over_budget += 1
+        self.stats.warnings.append("face with %d vertices ran out of "
+            "triangulation time: %s" % (self.nverts, instead))
+        return True
+
+
+def _TriangulateRings(face, holes, points, algorithm, work=None):
+    """Return a constrained Delaunay triangulation of face with holes.
+
+    If the 'SWEEP' algorithm fails (as it can for faces that
+    cross themselves), the 'EARCHOP' algorithm is used.
+
+    Args:
+      face: list of int - indices in points, assumed CCW-oriented
+      holes: list of list of int - CW-oriented holes inside face
+      points: geom.Points - holds coordinates for vertices
+      algorithm: string - 'EARCHOP' or 'SWEEP'; if None, ALGORITHM
+      work: _Work - counters and budget, if given
+    Returns:
+      halfedge.HalfEdgeMesh - the CCW-oriented triangles, with the
+          border edges (see _BorderEdges) fixed
+    """
+
+    if algorithm is None:
+        algorithm = ALGORITHM
     allfaces = [face] + holes
-    sholes = [_SortFace(h, points) for h in holes]
-    joinedface = _JoinIslands(face, sholes, points)
-    tris = EarChopTriFace(joinedface, points)
     bord = _BorderEdges(allfaces)
-    triscdt = _CDT(tris, bord, points)
-    qs = _Quandrangulate(triscdt, bord, points)
-    return qs
+    if algorithm == 'SWEEP':
+        tris = _SweepCDT(allfaces, points, work)
+        if tris is not None:
+            return halfedge.HalfEdgeMesh(tris, bord)
+        if work:
+            work.stats.sweep_fallbacks += 1
+    if holes:
+        sholes = [_SortFace(h, points) for h in holes]
+        face = _JoinIslands(face, sholes, points, work)
+    mesh = halfedge.HalfEdgeMesh(EarChopTriFace(face, points, work), bord)
+    _CDT(mesh, points, work)
+    return mesh
+
+
+def _ConvexStrip(face, points, quads, stats=None):
+    """If face is strictly convex, return a strip cutting it up.
+
+    The strip starts at an extreme vertex along the longer side of
+    the face's bounding box, and goes across to the opposite side,
+    taking the next vertex from each side of the face in turn.
+    Every four vertices of a strictly convex face make a convex quad,
+    so the strip is all quads, with a triangle in the middle if the
+    number of vertices is odd.  For a triangulation, each quad is cut
+    along its shorter diagonal.  This takes O(n) time.
+
+    Args:
+      face: list of int - indices in points, with at least four
+      points: geom.Points - holds coordinates for vertices
+      quads: bool - should quads be returned, rather than triangles?
+      stats: TriQuadStats - if given, counts are added to this
+    Returns:
+      list of 3-tuples or 4-tuples of ints - CCW-oriented faces of
+          the strip, or None if face isn't strictly convex and
+          CCW-oriented
+    """
+
+    if not _IsConvex(face, points):
+        return None
+    n = len(face)
+    if stats is not None:
+        stats.faces += 1
+        stats.convex_faces += 1
+        if quads and n == 4:
+            stats.single_quads += 1
+    if n == 4:
+        strip = [tuple(face)]
+    else:
+        pos = points.pos
+        xs = [pos[v][0] for v in face]
+        ys = [pos[v][1] for v in face]
+        c = xs if max(xs) - min(xs) >= max(ys) - min(ys) else ys
+        s = c.index(min(c))
+        ring = face[s:] + face[:s]
+        strip = []
+        (i, j) = (0, n - 1)
+        while j - i >= 3:
+            strip.append((ring[i], ring[i + 1], ring[j - 1], ring[j]))
+            i += 1
+            j -= 1
+        if j - i == 2:
+            strip.append((ring[i], ring[i + 1], ring[j]))
+    if quads:
+        return strip
+    ans = []
+    for f in strip:
+        if len(f) == 3:
+            ans.append(f)
+            continue
+        (a, b, c, d) = f
+        if _DistSq(a, c, points) <= _DistSq(b, d, points):
+            ans.extend([(a, b, c), (a, c, d)])
+        else:
+            ans.extend([(b, c, d), (b, d, a)])
+    return ans
+
+
+def _IsConvex(face, points):
+    """Return True if face is strictly convex and CCW-oriented.
+
+    Every turn must be strictly left, and the face must go around
+    just once, which it does if the x-direction of its edges changes
+    sign twice.
+    """
+
+    n = len(face)
+    pos = points.pos
+    signs = []
+    for i in range(n):
+        (a, b, c) = (face[i - 1], face[i], face[(i + 1) % n])
+        if not Ccw(a, b, c, points):
+            return False
+        dx = pos[c][0] - pos[b][0]
+        if dx != 0.0:
+            signs.append(dx > 0.0)
+    changes = 0
+    for i in range(len(signs)):
+        if signs[i] != signs[i - 1]:
+            changes += 1
+    return changes == 2
+
+
+class _TriQuadCache(object):
+    """A least-recently-used cache of triangulations and
+    quadrangulations.
+
+    Each is remembered as a pattern: its faces, with each vertex given
+    as a position in the face's rings (see _CacheKey), so that it can
+    be used for any translated copy of the face, whatever its vertex
+    indices.
+
+    Attributes:
+      entries: collections.OrderedDict - maps keys to tuples of
+        patterns of faces, least recently used first
+      values: int - number of ints held in the keys and patterns,
+        a measure of the memory used
+    """
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.values = 0
+
+    def Get(self, key):
+        """Return the pattern for key (marking it recently used), or None."""
+
+        ans = self.entries.get(key)
+        if ans is not None:
+            self.entries.move_to_end(key)
+        return ans
+
+    def Put(self, key, pattern):
+        """Remember pattern for key, dropping the oldest entries while
+        there are more than CACHE_SIZE.
+
+        Returns:
+          int - number of entries dropped
+        """
+
+        self.entries[key] = pattern
+        self.values += _CacheValues(key, pattern)
+        dropped = 0
+        while len(self.entries) > CACHE_SIZE:
+            (k, p) = self.entries.popitem(last=False)
+            self.values -= _CacheValues(k, p)
+            dropped += 1
+        return dropped
+
+
+def _CacheValues(key, pattern):
+    """Return the number of ints in a cache key and pattern."""
+
+    return len(key[3]) + len(key[2]) + sum([len(f) for f in pattern])
+
+
+_triquad_cache = _TriQuadCache()
+
+
+def CacheInfo():
+    """Return (number of faces, number of ints held) for the
+    triangulation cache (see _TriQuadCache)."""
+
+    return (len(_triquad_cache.entries), _triquad_cache.values)
+
+
+def ClearCache():
+    """Forget all the remembered triangulations and quadrangulations."""
+
+    global _triquad_cache
+    _triquad_cache = _TriQuadCache()
+
+
+def _CachedTriQuad(face, holes, points, algorithm, quads, stats, budget):
+    """Triangulate or quadrangulate face with holes, using the cache.
+
+    Answers made after the budget ran out are rougher than usual,
+    so are not remembered.
+
+    Args:
+      face: list of int - indices in points, assumed CCW-oriented
+      holes: list of list of int - CW-oriented holes inside face
+      points: geom.Points - holds coordinates for vertices
+      algorithm: string - 'EARCHOP' or 'SWEEP'; if None, ALGORITHM
+      quads: bool - quadrangulate, rather than triangulate?
+      stats: TriQuadStats - if given, counts are added to this
+      budget: float - seconds of work allowed (see TriangulateFace)
+    Returns:
+      list of 3-tuples or 4-tuples of ints - CCW-oriented vertices of
+          the faces
+    """
+
+    if algorithm is None:
+        algorithm = ALGORITHM
+    key = None
+    if CACHE_SIZE > 0:
+        (key, verts) = _CacheKey(face, holes, points, algorithm, quads)
+        pattern = _triquad_cache.Get(key)
+        if pattern is not None:
+            if stats is not None:
+                stats.faces += 1
+                stats.cache_hits += 1
+            return [tuple([verts[i] for i in f]) for f in pattern]
+    work = _Work(face, stats, budget)
+    mesh = _TriangulateRings(face, holes, points, algorithm, work)
+    if quads:
+        ans = _Quandrangulate(mesh, points, work)
+    else:
+        ans = mesh.Faces()
+    if key is None:
+        return ans
+    work.stats.cache_misses += 1
+    where = dict()
+    for (i, v) in enumerate(verts):
+        where.setdefault(v, i)
+    if work.over or len(where) < len(verts):
+        # rough, or a vertex is in the rings twice, so positions
+        # can't be found from vertex indices
+        return ans
+    pattern = tuple([tuple([where[v] for v in f]) for f in ans])
+    work.stats.cache_evictions += _triquad_cache.Put(key, pattern)
+    return ans
+
+
+def _CacheKey(face, holes, points, algorithm, quads):
+    """Return the cache key for a face with holes, and the vertices
+    the key's positions refer to.
+
+    Each ring is rotated to start at its least point, and the holes
+    are sorted by their first points, so that the same face given
+    with different starting vertices or hole order has the same key.
+    Coordinates are taken relative to the first point of the outer
+    ring and rounded to multiples of _CACHE_QUANTUM.
+
+    Returns:
+      (tuple, list of int) - the key, and the vertices of the
+          rotated and sorted rings, one after another
+    """
+
+    pos = points.pos
+    (x0, y0) = pos[min(face, key=lambda v: pos[v][:2])][:2]
+    q = _CACHE_QUANTUM
+    rings = []
+    for ring in [face] + holes:
+        coords = [(int(round((pos[v][0] - x0) / q)),
+            int(round((pos[v][1] - y0) / q))) for v in ring]
+        s = coords.index(min(coords))
+        rings.append((coords[s:] + coords[:s], ring[s:] + ring[:s]))
+    rings[1:] = sorted(rings[1:], key=lambda r: r[0][0])
+    verts = [v for (_, ring) in rings for v in ring]
+    flat = tuple([x for (coords, _) in rings for c in coords for x in c])
+    key = (algorithm, quads, tuple([len(ring) for (_, ring) in rings]),
+        flat)
+    return (key, verts)
+
+
+class _CDTError(Exception):
+    """Raised when _SweepCDT can't triangulate its input."""
+    pass
+
+
+def _SweepCDT(rings, points, work=None):
+    """Constrained Delaunay triangulation of the inside of rings.
+
+    First makes the Delaunay triangulation of the ring vertices by
+    sweeping a line across them in x order: each vertex is joined to
+    the edges of the convex hull of the vertices so far that it can
+    see, and then edges are flipped until the new triangles are
+    Delaunay (see _Legalize).  Then each ring edge that isn't an edge
+    already is put in, by removing the triangles it crosses and
+    retriangulating the two sides (see _InsertConstraint).  Finally
+    the triangles inside are found by spreading from the left sides
+    of the ring edges without crossing any ring edge.
+
+    The sort makes this O(n log n), with the usual expected linear
+    number of flips, as long as few ring edges cross many triangles.
+    As a check, the area of the triangles must match that of the rings.
+
+    Args:
+      rings: list of list of int - indices in points; the first
+          is CCW-oriented and the rest are CW-oriented holes inside it
+      points: geom.Points - holds coordinates for vertices
+      work: _Work - counters, if given
+    Returns:
+      list of (int, int, int) - CCW-oriented triangles, or None
+          if the rings cross each other or themselves, or some
+          other problem stops the triangulation
+    """
+
+    pos = points.pos
+    verts = sorted(set([v for ring in rings for v in ring]),
+        key=lambda v: (pos[v][0], pos[v][1]))
+    if len(verts) < 3:
+        return None
+    # opp maps each directed edge (a, b) of a triangle (a, b, c),
+    # CCW-oriented, to c; vedge maps each vertex v to a w with (v, w)
+    # in opp
+    opp = dict()
+    vedge = dict()
+    try:
+        flips = _SweepTriangulate(verts, pos, opp, vedge)
+        if work:
+            work.stats.flips += flips
+        constraints = set()
+        for ring in rings:
+            n = len(ring)
+            for i in range(n):
+                (u, v) = (ring[i], ring[(i + 1) % n])
+                if u != v:
+                    _InsertConstraint(u, v, pos, opp, vedge, constraints)
+    except _CDTError:
+        return None
+    # spread from the left sides of the ring edges
+    ans = []
+    seen = set()
+    stack = []
+    for ring in rings:
+        n = len(ring)
+        for i in range(n):
+            (u, v) = (ring[i], ring[(i + 1) % n])
+            if u != v and (u, v) in opp:
+                stack.append((u, v))
+    while stack:
+        (a, b) = stack.pop()
+        c = opp.get((a, b))
+        if c is None or (a, b) in seen:
+            continue
+        seen.update([(a, b), (b, c), (c, a)])
+        ans.append((a, b, c))
+        for (x, y) in ((a, b), (b, c), (c, a)):
+            if (x, y) not in constraints and (y, x) not in seen:
+                stack.append((y, x))
+    # check the triangles cover the rings exactly
+    area = 0.0
+    scale = 0.0
+    for ring in rings:
+        # measured from a ring vertex: geom.SignedArea loses precision
+        # for small rings far from the origin
+        p0 = pos[ring[0]]
+        a = 0.0
+        for i in range(1, len(ring) - 1):
+            a += 0.5 * _TwiceArea(p0, pos[ring[i]], pos[ring[i + 1]])
+        area += a
+        scale += abs(a)
+    triarea = 0.0
+    for (a, b, c) in ans:
+        triarea += 0.5 * _TwiceArea(pos[a], pos[b], pos[c])
+    if abs(triarea - area) > 1e-9 * scale:
+        return None
+    return ans
+
+
+def _SweepTriangulate(verts, pos, opp, vedge):
+    """Make the Delaunay triangulation of verts, by a sweep line.
+
+    Args:
+      verts: list of int - vertex indices, sorted by x then y
+      pos: list of coordinate tuples
+      opp: dict - triangles are added to this (see _SweepCDT)
+      vedge: dict - maps vertices to neighbors (see _SweepCDT)
+    Returns:
+      int - the number of edges flipped
+    """
+
+    # skip over any collinear vertices at the start, then fan them
+    # to the first vertex not on their line
+    p0 = pos[verts[0]]
+    k = 2
+    while k < len(verts) and Orient2d(p0, pos[verts[1]], pos[verts[k]]) == 0.0:
+        k += 1
+    if k == len(verts):
+        raise _CDTError()
+    apex = verts[k]
+    left = Orient2d(p0, pos[verts[1]], pos[apex]) > 0.0
+    hnext = dict()
+    hprev = dict()
+    chain = verts[0:k]
+    for i in range(k - 1):
+        if left:
+            _AddTri(chain[i], chain[i + 1], apex, opp, vedge)
+        else:
+            _AddTri(chain[i + 1], chain[i], apex, opp, vedge)
+    # the hull, as a CCW cycle
+    hull = chain + [apex] if left else [apex] + chain[::-1]
+    for i in range(len(hull)):
+        hnext[hull[i]] = hull[(i + 1) % len(hull)]
+        hprev[hull[(i + 1) % len(hull)]] = hull[i]
+    last = apex
+    stack = []
+    flips = 0
+    for p in verts[k + 1:]:
+        pp = pos[p]
+        # the hull edges visible from p are around the last vertex added
+        e = last
+        while Orient2d(pos[e], pos[hnext[e]], pp) < 0.0:
+            e = hnext[e]
+        s = last
+        while Orient2d(pos[hprev[s]], pos[s], pp) < 0.0:
+            s = hprev[s]
+        if s == e:
+            raise _CDTError()
+        u = s
+        while u != e:
+            w = hnext[u]
+            _AddTri(w, u, p, opp, vedge)
+            stack.append((w, u, p))
+            if u != s:
+                del hnext[u]
+                del hprev[u]
+            u = w
+        hnext[s] = p
+        hprev[p] = s
+        hnext[p] = e
+        hprev[e] = p
+        flips += _Legalize(stack, pos, opp, vedge)
+        last = p
+    return flips
+
+
+def _Legalize(stack, pos, opp, vedge):
+    """Flip edges until the triangles on the stack are Delaunay.
+
+    Each stack entry (a, b, p) is a triangle whose edge (a, b) may
+    need flipping: if so, the two new triangles' edges opposite p
+    are checked too.  Returns the number of edges flipped.
+    """
+
+    flips = 0
+    while stack:
+        (a, b, p) = stack.pop()
+        if opp.get((a, b)) != p:
+            continue
+        d = opp.get((b, a))
+        if d is None:
+            continue
+        if InCircle2d(pos[a], pos[b], pos[p], pos[d]) > 0.0:
+            _RemoveTri(a, b, p, opp)
+            _RemoveTri(b, a, d, opp)
+            _AddTri(a, d, p, opp, vedge)
+            _AddTri(d, b, p, opp, vedge)
+            stack.append((a, d, p))
+            stack.append((d, b, p))
+            flips += 1
+    return flips
+
+
+def _InsertConstraint(u, v, pos, opp, vedge, constraints):
+    """Make (u, v) an edge of the triangulation, keeping it CDT.
+
+    The triangles crossed by segment uv are removed, and the
+    vertices on each side of uv are retriangulated
+    (see _FillPseudoPolygon).  If uv goes through a vertex w,
+    (u, w) and (w, v) are inserted instead.
+
+    Args:
+      u, v: int - vertex indices
+      pos: list of coordinate tuples
+      opp: dict - the triangulation (see _SweepCDT)
+      vedge: dict - maps vertices to neighbors (see _SweepCDT)
+      constraints: set of (int, int) - edges inserted so far;
+          (u, v) and (v, u) are added to this
+    Raises:
+      _CDTError - if uv crosses another constraint
+    """
+
+    while u != v:
+        if (u, v) in opp or (v, u) in opp:
+            constraints.update([(u, v), (v, u)])
+            return
+        (pu, pv) = (pos[u], pos[v])
+        # find the triangle (u, r, l) around u that uv goes into
+        start = None
+        for (r, l) in _Fan(u, opp, vedge):
+            (orr, ol) = (Orient2d(pu, pv, pos[r]), Orient2d(pu, pv, pos[l]))
+            if orr == 0.0 and _Dot2(pu, pv, pos[r]) > 0.0:
+                start = r
+                break
+            if orr < 0.0 and ol > 0.0:
+                break
+        else:
+            raise _CDTError()
+        if start is not None:
+            # uv goes through r
+            _InsertConstraint(u, start, pos, opp, vedge, constraints)
+            u = start
+            continue
+        crossed = [(u, r, l)]
+        lefts = [l]
+        rights = [r]
+        w = None
+        while True:
+            if (r, l) in constraints:
+                raise _CDTError()
+            y = opp.get((l, r))
+            if y is None:
+                raise _CDTError()
+            crossed.append((l, r, y))
+            if y == v:
+                break
+            o = Orient2d(pu, pv, pos[y])
+            if o > 0.0:
+                lefts.append(y)
+                l = y
+            elif o < 0.0:
+                rights.append(y)
+                r = y
+            else:
+                w = y
+                break
+        if w is not None:
+            # uv goes through w
+            _InsertConstraint(u, w, pos, opp, vedge, constraints)
+            u = w
+            continue
+        for (a, b, c) in crossed:
+            _RemoveTri(a, b, c, opp)
+        _FillPseudoPolygon(u, v, lefts, pos, opp, vedge)
+        _FillPseudoPolygon(v, u, rights[::-1], pos, opp, vedge)
+        constraints.update([(u, v), (v, u)])
+        return
+
+
+def _Fan(u, opp, vedge):
+    """Return the (w, x) such that (u, w, x) is a triangle.
+
+    They are in CCW order around u, if u is inside the triangulation.
+    """
+
+    w0 = vedge[u]
+    ans = []
+    w = w0
+    while True:
+        x = opp.get((u, w))
+        if x is None:
+            break
+        ans.append((w, x))
+        w = x
+        if w == w0:
+            return ans
+    # u is on the hull: go the other way from w0 too
+    w = w0
+    while True:
+        y = opp.get((w, u))
+        if y is None:
+            break
+        ans.append((y, w))
+        w = y
+    return ans
+
+
+def _FillPseudoPolygon(a, b, chain, pos, opp, vedge):
+    """Triangulate the polygon left of ab, bounded by a, chain, b.
+
+    Uses the method of Anglada: the vertex c of chain whose
+    circle through a, b and c has no other vertex of chain in it
+    makes triangle abc, and the parts of chain on either
+    side of c are done the same way.
+    """
+
+    stack = [(a, b, chain)]
+    while stack:
+        (a, b, chain) = stack.pop()
+        if not chain:
+            continue
+        (pa, pb) = (pos[a], pos[b])
+        ci = 0
+        for i in range(1, len(chain)):
+            if InCircle2d(pa, pb, pos[chain[ci]], pos[chain[i]]) > 0.0:
+                ci = i
+        c = chain[ci]
+        _AddTri(a, b, c, opp, vedge)
+        stack.append((a, c, chain[:ci]))
+        stack.append((c, b, chain[ci + 1:]))
+
+
+def _AddTri(a, b, c, opp, vedge):
+    opp[(a, b)] = c
+    opp[(b, c)] = a
+    opp[(c, a)] = b
+    vedge[a] = b
+    vedge[b] = c
+    vedge[c] = a
+
+
+def _RemoveTri(a, b, c, opp):
+    del opp[(a, b)]
+    del opp[(b, c)]
+    del opp[(c, a)]
+
+
+def _TwiceArea(a, b, c):
+    """Return twice the signed area of triangle abc (coordinates),
+    without the exactness of Orient2d."""
+
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _Dot2(a, b, c):
+    """Return the dot product of b - a and c - a (coordinates)."""
+
+    return (b[0] - a[0]) * (c[0] - a[0]) + (b[1] - a[1]) * (c[1] - a[1])
 
 
 def _SortFace(face, points):
@@ -159,10 +1061,210 @@ def _SortFace(face, points):
     return face[lefti:] + face[0:lefti]
 
 
-def EarChopTriFace(face, points):
+def EarChopTriFace(face, points, work=None):
     """Triangulate given face, with coords given by indexing into points.
     Return list of faces, each of which will be a triangle.
-    Use the ear-chopping method."""
+    Use the ear-chopping method: first with _LinkedEarChop, and
+    then, if that gets stuck on a degenerate face, with _ChopEars.
+    work is a _Work, for counters and budget, if given."""
+
+    (ans, face) = _LinkedEarChop(face, points)
+    if work:
+        work.stats.ears[0] += len(ans)
+    return ans + _ChopEars(face, points, work)
+
+
+def _LinkedEarChop(face, points):
+    """Chop ears from face while ordinary (mode 0) ears can be found.
+
+    Like _ChopEars, but faster on big faces: the face is kept as a
+    doubly linked ring, so chopping an ear doesn't copy the face;
+    only the angle kinds of the two neighbors of a chopped ear are
+    recomputed; and the reflex vertices are kept sorted by the
+    z-order (Morton) codes of their coordinates, so that the ear
+    check only looks at those whose codes are in the range spanned
+    by the ear's bounding box.
+
+    Args:
+      face: list of int - indices in points, assumed CCW-oriented
+      points: geom.Points - holds coordinates for vertices
+    Returns:
+      (list of (int, int, int), list of int) - the chopped
+          triangles, and the rest of face (just 3 vertices,
+          unless no ordinary ear could be found)
+    """
+
+    n = len(face)
+    if n <= 3:
+        return ([], face)
+    pos = points.pos
+    nxt = [(i + 1) % n for i in range(n)]
+    prv = [(i - 1) % n for i in range(n)]
+    angk = _ClassifyAngles(face, n, points)
+    xs = [pos[v][0] for v in face]
+    ys = [pos[v][1] for v in face]
+    (minx, miny) = (min(xs), min(ys))
+    size = max(max(xs) - minx, max(ys) - miny)
+    scale = 65535.0 / size if size > 0.0 else 0.0
+    zorder = lambda x, y: _ZOrder(int((x - minx) * scale),
+        int((y - miny) * scale))
+    # (z-order code, index in face) of reflex vertices, sorted;
+    # entries for vertices no longer reflex are skipped, not removed
+    reflex = sorted([(zorder(xs[i], ys[i]), i) for i in range(n)
+        if angk[i] == Angreflex])
+    i = _GetLeastIndex(face, points)
+    stop = i
+    ans = []
+    while n > 3:
+        if _IsLinkedEar(face, i, nxt, prv, angk, reflex, zorder, points):
+            (a, b) = (prv[i], nxt[i])
+            ans.append((face[a], face[i], face[b]))
+            nxt[a] = b
+            prv[b] = a
+            n -= 1
+            for j in (a, b):
+                k = _AngleKind(face[prv[j]], face[j], face[nxt[j]], points)
+                if k == Angreflex and angk[j] != Angreflex:
+                    bisect.insort(reflex, (zorder(xs[j], ys[j]), j))
+                angk[j] = k
+            # skipping a vertex avoids making long fans of slivers
+            i = nxt[b]
+            stop = i
+        else:
+            i = nxt[i]
+            if i == stop:
+                break
+    rest = [face[i]]
+    j = nxt[i]
+    while j != i:
+        rest.append(face[j])
+        j = nxt[j]
+    return (ans, rest)
+
+
+def _IsLinkedEar(face, i, nxt, prv, angk, reflex, zorder, points):
+    """Return True if vertex i of the linked ring of _LinkedEarChop
+    is the tip of an ear.  Makes the same tests as _IsEar and
+    _EarCheck in mode 0, but only reflex vertices within the
+    bounding box of the ear are checked."""
+
+    (im1, i1) = (prv[i], nxt[i])
+    vm2 = face[prv[im1]]
+    vm1 = face[im1]
+    v0 = face[i]
+    v1 = face[i1]
+    v2 = face[nxt[i1]]
+    if vm1 == v0 or v0 == v1:
+        return False
+    k = angk[i]
+    if not (k == Angconvex or k == Angtangential or k == Ang0):
+        return False
+    if not (_InCone(vm1, v0, v1, v2, angk[i1], points) and
+            _InCone(v1, vm2, vm1, v0, angk[im1], points)):
+        return False
+    pos = points.pos
+    (pm1, p0, p1) = (pos[vm1], pos[v0], pos[v1])
+    minx = min(pm1[0], p0[0], p1[0])
+    maxx = max(pm1[0], p0[0], p1[0])
+    miny = min(pm1[1], p0[1], p1[1])
+    maxy = max(pm1[1], p0[1], p1[1])
+    zmin = zorder(minx, miny)
+    zmax = zorder(maxx, maxy)
+    (zminx, zminy) = (zmin & _ZXBITS, zmin & _ZYBITS)
+    (zmaxx, zmaxy) = (zmax & _ZXBITS, zmax & _ZYBITS)
+    nreflex = len(reflex)
+    r = bisect.bisect_left(reflex, (zmin, -1))
+    misses = 0
+    while r < nreflex:
+        (z, j) = reflex[r]
+        if z > zmax:
+            break
+        (zx, zy) = (z & _ZXBITS, z & _ZYBITS)
+        if zx < zminx or zx > zmaxx or zy < zminy or zy > zmaxy:
+            misses += 1
+            if misses < _ZSKIP:
+                r += 1
+                continue
+            # skip the part of the z-order range outside the box
+            misses = 0
+            z = _ZBigMin(z, zmin, zmax)
+            if z is None:
+                break
+            r = bisect.bisect_left(reflex, (z, -1), r + 1)
+            continue
+        misses = 0
+        r += 1
+        fv = face[j]
+        if angk[j] != Angreflex or fv == vm1 or fv == v0 or fv == v1:
+            continue
+        (x, y) = (pos[fv][0], pos[fv][1])
+        if x < minx or x > maxx or y < miny or y > maxy:
+            continue
+        if nxt[prv[j]] != j:
+            continue  # chopped off already
+        c = not(Ccw(v0, vm1, fv, points)
+                or Ccw(vm1, v1, fv, points)
+                or Ccw(v1, v0, fv, points))
+        fvm1 = face[prv[j]]
+        fv1 = face[nxt[j]]
+        d = SegsIntersect(fvm1, fv, vm1, v0, points) or \
+            SegsIntersect(fvm1, fv, v0, v1, points) or \
+            SegsIntersect(fv, fv1, vm1, v0, points) or \
+            SegsIntersect(fv, fv1, v0, v1, points)
+        if c or d:
+            return False
+    return True
+
+
+_ZXBITS = 0x55555555  # bits of z-order codes from x
+_ZYBITS = 0xAAAAAAAA  # bits of z-order codes from y
+_ZSKIP = 8  # after this many codes outside a box, use _ZBigMin
+
+
+def _ZBigMin(z, zmin, zmax):
+    """Return the least z-order code greater than z that is in the
+    box with corner codes zmin and zmax, where zmin < z < zmax but z
+    is outside the box, or None if there is none (the BIGMIN
+    calculation of Tropf and Herzog)."""
+
+    bigmin = None
+    for bit in range(31, -1, -1):
+        mask = 1 << bit
+        below = (_ZXBITS if bit % 2 == 0 else _ZYBITS) & (mask - 1)
+        zb = z & mask
+        minb = zmin & mask
+        maxb = zmax & mask
+        if zb:
+            if not minb:
+                if not maxb:
+                    return bigmin
+                zmin = (zmin | mask) & ~below
+        elif maxb:
+            if minb:
+                return zmin
+            bigmin = (zmin | mask) & ~below
+            zmax = (zmax & ~mask) | below
+    return bigmin
+
+
+def _ZOrder(x, y):
+    """Return the z-order (Morton) code of 16-bit ints x and y,
+    made by interleaving their bits."""
+
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+    y = (y | (y << 8)) & 0x00FF00FF
+    y = (y | (y << 4)) & 0x0F0F0F0F
+    y = (y | (y << 2)) & 0x33333333
+    y = (y | (y << 1)) & 0x55555555
+    return x | (y << 1)
+
+
+def _ChopEars(face, points, work=None):
+    """Triangulate face by ear chopping, as in EarChopTriFace,
+    with desperation modes for degenerate faces (see _IsEar)."""
 
     # start with lowest coord in 2d space to try
     # to get a pleasing uniform triangulation if starting with
@@ -172,7 +1274,7 @@ def EarChopTriFace(face, points):
     incr = 1
     n = len(face)
     while n > 3:
-        i = _FindEar(face, n, start, incr, points)
+        i = _FindEar(face, n, start, incr, points, work)
         vm1 = face[(i - 1) % n]
         v0 = face[i]
         v1 = face[(i + 1) % n]
@@ -202,7 +1304,7 @@ def _GetLeastIndex(face, points):
     return bestindex
 
 
-def _FindEar(face, n, start, incr, points):
+def _FindEar(face, n, start, incr, points, work=None):
     """An ear of a polygon consists of three consecutive vertices
     v(-1), v0, v1 such that v(-1) can connect to v1 without intersecting
     the polygon.
@@ -210,13 +1312,25 @@ def _FindEar(face, n, start, incr, points):
     in direction incr. (We attempt to alternate directions, to find
     'nice' triangulations for simple convex polygons.)
     Returns index into faces of v0 (will always find one, because
-    uses a desperation mode if fails to find one with above rule)."""
+    uses a desperation mode if fails to find one with above rule).
+    If work's budget has run out, just takes the first vertex that
+    isn't reflex, as mode 4 would, without checking for an ear."""
 
     angk = _ClassifyAngles(face, n, points)
+    if work and work.Over("chopped ears without checking them"):
+        work.stats.ears[4] += 1
+        i = start
+        while angk[i] == Angreflex:
+            i = (i + incr) % n
+            if i == start:
+                break
+        return i
     for mode in range(0, 5):
         i = start
         while True:
             if _IsEar(face, i, n, angk, points, mode):
+                if work:
+                    work.stats.ears[mode] += 1
                 return i
             i = (i + incr) % n
             if i == start:
@@ -315,20 +1429,225 @@ def _InCone(vtest, a, b, c, bkind, points):
         return Ccw(a, b, vtest, points) and Ccw(b, c, vtest, points)
 
 
-def _JoinIslands(face, holes, points):
+def _JoinIslands(face, holes, points, work=None):
     """face is a CCW face containing the CW faces in the holes list,
     where each hole is sorted so the leftmost-lowest vertex is first.
     faces and holes are given as lists of indices into points.
     The holes should be sorted by softface.
     Add edges to make a new face that includes the holes (a Ccw traversal
     of the new face will have the inside always on the left),
-    and return the new face."""
+    and return the new face.
+    work is a _Work, for counters, if given."""
+
+    # like taking _LeftMostFace repeatedly, but sorting once;
+    # the face is grown in an _IslandJoiner, so finding each
+    # diagonal only looks at nearby vertices and edges
+    holes = sorted([h for h in holes if len(h) > 0],
+        key=lambda h: points.pos[h[0]])
+    if work:
+        work.stats.diag_searches += len(holes)
+    if len(holes) <= JTHRESH:
+        for hole in holes:
+            face = _JoinIsland(face, hole, points)
+        return face
+    joiner = _IslandJoiner(face, holes, points)
+    for hole in holes:
+        hv0 = hole[0]
+        d = joiner.FindDiag(hv0)
+        if d is None:
+            # use the desperation modes of _FindDiag
+            nodes = joiner.Nodes()
+            d = nodes[_FindDiag([joiner.vert[i] for i in nodes], hv0,
+                points)]
+        joiner.Splice(d, hole)
+    return [joiner.vert[i] for i in joiner.Nodes()]
+
+
+class _IslandJoiner(object):
+    """The face being made by _JoinIslands, as a linked ring of nodes
+    (vertex occurrences), with a grid indexing its vertices and edges.
+
+    Attributes:
+      points: geom.Points - holds coordinates for vertices
+      vert: list of int - the vertex (index in points) of each node
+      nxt: list of int - the next node around the face, for each node
+      prv: list of int - the previous node around the face
+      key: list of tuple - for each node, a key that sorts in the
+          order of the nodes around the face, starting at node 0
+      minx, miny: float - lower left of the grid
+      cell: float - side of each (square) cell of the grid
+      side: int - number of cells along a side of the grid
+      vcells: dict - maps (column, row) to list of nodes whose
+          vertices are in that cell
+      ecells: dict - maps (column, row) to list of (a, b) for edges
+          from node a to node b crossing that cell; entries where
+          nxt[a] is no longer b are out of date, and skipped
+    """
 
-    while len(holes) > 0:
-        (hole, holeindex) = _LeftMostFace(holes, points)
-        holes = holes[0:holeindex] + holes[holeindex + 1:]
-        face = _JoinIsland(face, hole, points)
-    return face
+    def __init__(self, face, holes, points):
+        self.points = points
+        self.vert = []
+        self.nxt = []
+        self.prv = []
+        self.key = []
+        pos = points.pos
+        allv = face + [v for h in holes for v in h]
+        xs = [pos[v][0] for v in allv]
+        ys = [pos[v][1] for v in allv]
+        (self.minx, self.miny) = (min(xs), min(ys))
+        extent = max(max(xs) - self.minx, max(ys) - self.miny)
+        self.cell = max(extent / math.sqrt(len(allv)), TOL)
+        self.side = int(extent / self.cell) + 1
+        self.vcells = dict()
+        self.ecells = dict()
+        n = len(face)
+        for v in face:
+            self._AddNode(v)
+        for i in range(n):
+            self.nxt[i] = (i + 1) % n
+            self.prv[i] = (i - 1) % n
+            self.key[i] = (i,)
+        for i in range(n):
+            self._AddEdge(i)
+
+    def _Cell(self, p):
+        return (int((p[0] - self.minx) // self.cell),
+            int((p[1] - self.miny) // self.cell))
+
+    def _SegCells(self, p, q):
+        """Return the cells that segment pq passes through."""
+
+        (c0, r0) = self._Cell(p)
+        (c1, r1) = self._Cell(q)
+        if c0 == c1 or r0 == r1:
+            return [(c, r) for c in range(min(c0, c1), max(c0, c1) + 1)
+                for r in range(min(r0, r1), max(r0, r1) + 1)]
+        if c0 > c1:
+            (p, q, c0, c1) = (q, p, c1, c0)
+        ans = []
+        slope = (q[1] - p[1]) / (q[0] - p[0])
+        for c in range(c0, c1 + 1):
+            x0 = max(p[0], self.minx + c * self.cell)
+            x1 = min(q[0], self.minx + (c + 1) * self.cell)
+            ra = int((p[1] + (x0 - p[0]) * slope - self.miny) // self.cell)
+            rb = int((p[1] + (x1 - p[0]) * slope - self.miny) // self.cell)
+            for r in range(min(ra, rb), max(ra, rb) + 1):
+                ans.append((c, r))
+        return ans
+
+    def _AddNode(self, v):
+        i = len(self.vert)
+        self.vert.append(v)
+        self.nxt.append(i)
+        self.prv.append(i)
+        self.key.append(None)
+        self.vcells.setdefault(self._Cell(self.points.pos[v]), []).append(i)
+        return i
+
+    def _AddEdge(self, a):
+        b = self.nxt[a]
+        pos = self.points.pos
+        for c in self._SegCells(pos[self.vert[a]], pos[self.vert[b]]):
+            self.ecells.setdefault(c, []).append((a, b))
+
+    def Nodes(self):
+        """Return the list of nodes around the face, starting at 0."""
+
+        ans = [0]
+        i = self.nxt[0]
+        while i != 0:
+            ans.append(i)
+            i = self.nxt[i]
+        return ans
+
+    def Splice(self, d, hole):
+        """Splice hole into the face, joined to node d,
+        as _JoinIsland does."""
+
+        after = self.nxt[d]
+        chain = [d] + [self._AddNode(v) for v in hole + [hole[0]]] + \
+            [self._AddNode(self.vert[d]), after]
+        for k in range(len(chain) - 1):
+            self.nxt[chain[k]] = chain[k + 1]
+            self.prv[chain[k + 1]] = chain[k]
+        # keys for the new nodes that sort between those of d and after
+        (dkey, akey) = (self.key[d], self.key[after])
+        base = dkey
+        if after != 0 and akey[0:len(dkey)] == dkey:
+            base = dkey + (akey[len(dkey)] - 1,)
+        for k in range(1, len(chain) - 1):
+            self.key[chain[k]] = base + (k,)
+        for a in chain[0:-1]:
+            self._AddEdge(a)
+
+    def FindDiag(self, hv):
+        """Like _FindDiag in mode 0, but only looking at vertices in
+        cells near hv, in rings of increasing size.  Return the
+        node found, or None if there is none."""
+
+        pos = self.points.pos
+        php = pos[hv]
+        (hc, hr) = self._Cell(php)
+        # of equally near vertices, _FindDiag takes the first in face
+        best = None
+        bestdist = 1e30
+        bestkey = ()
+        for k in range(0, self.side + 1):
+            if best is not None and bestdist < ((k - 1) * self.cell) ** 2:
+                break
+            cands = []
+            for (c, r) in _CellRing(hc, hr, k):
+                for i in self.vcells.get((c, r), []):
+                    v = self.vert[i]
+                    if pos[v] > php:
+                        continue
+                    dist = _DistSq(v, hv, self.points)
+                    if dist <= bestdist:
+                        cands.append((dist, self.key[i], i))
+            cands.sort()
+            for (dist, key, i) in cands:
+                if best is not None and (dist, key) >= (bestdist, bestkey):
+                    break
+                if self._IsDiag(i, hv):
+                    (best, bestdist, bestkey) = (i, dist, key)
+                    break
+        return best
+
+    def _IsDiag(self, i, hv):
+        """Like _IsDiag, for node i, checking only edges near the
+        diagonal."""
+
+        points = self.points
+        (vm1, v, v1) = (self.vert[self.prv[i]], self.vert[i],
+            self.vert[self.nxt[i]])
+        k = _AngleKind(vm1, v, v1, points)
+        if not _InCone(hv, vm1, v, v1, k, points):
+            return False
+        seen = set()
+        for c in self._SegCells(points.pos[v], points.pos[hv]):
+            for (a, b) in self.ecells.get(c, []):
+                if self.nxt[a] != b or a in seen:
+                    continue
+                seen.add(a)
+                if SegsIntersect(v, hv, self.vert[a], self.vert[b], points):
+                    return False
+        return True
+
+
+def _CellRing(c, r, k):
+    """Return the grid cells at distance k (in the max norm)
+    from cell (c, r)."""
+
+    if k == 0:
+        return [(c, r)]
+    ans = []
+    for i in range(-k, k + 1):
+        ans.append((c + i, r - k))
+        ans.append((c + i, r + k))
+    for j in range(-k + 1, k):
+        ans.append((c - k, r + j))
+        ans.append((c + k, r + j))
+    return ans
 
 
 def _JoinIsland(face, hole, points):
@@ -434,118 +1753,150 @@ def _BorderEdges(facelist):
     return ans
 
 
-def _CDT(tris, bord, points):
-    """Tris is a list of triangles ((a,b,c), CCW-oriented indices into points)
-    Bord is a set of border edges (u,v), oriented so that tris
-    is a triangulation of the left face of the border(s).
+def _CDT(mesh, points, work=None):
+    """Mesh is a halfedge.HalfEdgeMesh of CCW triangles, whose fixed
+    half-edges are the border edges, oriented so that the triangles
+    are a triangulation of the left face of the border(s).
     Make the triangulation "Constrained Delaunay" by flipping "reversed"
-    quadrangulaterals until can flip no more.
-    Return list of triangles in new triangulation."""
+    quadrangulaterals until can flip no more, or work's budget runs out.
+    The mesh is changed in place."""
 
-    td = _TriDict(tris)
-    re = _ReveresedEdges(tris, td, bord, points)
-    ts = set(tris)
+    re = _ReveresedEdges(mesh, points)
     # reverse the reversed edges until done.
     # reversing and edge adds new edges, which may or
     # may not be reversed or border edges, to re for
     # consideration, but the process will stop eventually.
+    (nxt, prv, twin) = (mesh.next, mesh.prev, mesh.twin)
     while len(re) > 0:
-        (a, b) = e = re.pop()
-        if e in bord or not _IsReversed(e, td, points):
+        h = re.pop()
+        if mesh.fixed[h] or not _IsReversed(mesh, h, points):
             continue
-        # rotate e in quad adbc to get other diagonal
-        erev = (b, a)
-        tl = td.get(e)
-        tr = td.get(erev)
-        if not tl or not tr:
-            continue  # shouldn't happen
-        c = _OtherVert(tl, a, b)
-        d = _OtherVert(tr, a, b)
-        if c is None or d is None:
-            continue  # shouldn't happen
-        newt1 = (c, d, b)
-        newt2 = (c, a, d)
-        del td[e]
-        del td[erev]
-        td[(c, d)] = newt1
-        td[(d, b)] = newt1
-        td[(b, c)] = newt1
-        td[(d, c)] = newt2
-        td[(c, a)] = newt2
-        td[(a, d)] = newt2
-        if tl in ts:
-            ts.remove(tl)
-        if tr in ts:
-            ts.remove(tr)
-        ts.add(newt1)
-        ts.add(newt2)
-        re.extend([(d, b), (b, c), (c, a), (a, d)])
-    return list(ts)
-
-
-def _TriDict(tris):
-    """tris is a list of triangles (a,b,c), CCW-oriented indices.
-    Return dict mapping all edges in the triangles to the containing
-    triangle list."""
-
-    ans = dict()
-    for i in range(0, len(tris)):
-        (a, b, c) = t = tris[i]
-        ans[(a, b)] = t
-        ans[(b, c)] = t
-        ans[(c, a)] = t
-    return ans
+        if work:
+            if work.Over("stopped flipping edges to make triangles "
+                    "Delaunay"):
+                break
+            work.stats.flips += 1
+        # rotate h in quad adbc to get other diagonal
+        t = twin[h]
+        mesh.Flip(h)
+        re.extend([nxt[h], prv[h], nxt[t], prv[t]])
 
 
-def _ReveresedEdges(tris, td, bord, points):
-    """Return list of reversed edges in tris.
-    Only want edges not in bord, and only need one representative
-    of (u,v)/(v,u), so choose the one with u < v.
-    td is dictionary from _TriDict, and is used to find left and right
-    triangles of edges."""
+def _ReveresedEdges(mesh, points):
+    """Return list of reversed half-edges in mesh.
+    Only want edges not fixed, and only need one representative
+    of (u,v)/(v,u), so choose the one with u < v."""
 
+    edges = _InteriorEdges(mesh, range(len(mesh.fedge)))
+    quads = [q[0:4] for q in edges]
+    return [q[4] for (q, rev) in
+        zip(edges, _InCircleBatch(quads, points)) if rev]
+
+
+def _InteriorEdges(mesh, faces):
+    """Return the edges shared by two triangles, for _ReveresedEdges
+    and _ERGraph.
+
+    Args:
+      mesh: halfedge.HalfEdgeMesh - a mesh of triangles
+      faces: iterable of int - the faces to look at, in order
+    Returns:
+      list of (a, b, c, d, h) - for each half-edge h from a to b
+        with a < b that isn't fixed and has a twin, in the order found
+        in faces, its left triangle is (a, b, c) and its right one is
+        (b, a, d)
+    """
+
+    (orig, nxt, prv, twin, fixed) = (mesh.orig, mesh.next, mesh.prev,
+        mesh.twin, mesh.fixed)
+    fedge = mesh.fedge
     ans = []
-    for i in range(0, len(tris)):
-        (a, b, c) = tris[i]
-        for e in [(a, b), (b, c), (c, a)]:
-            if e in bord:
+    for f in faces:
+        h0 = fedge[f]
+        if h0 == -1:
+            continue
+        for h in (h0, nxt[h0], prv[h0]):
+            t = twin[h]
+            if t == -1 or fixed[h]:
+                continue
+            (a, b) = (orig[h], orig[t])
+            if a > b:
                 continue
-            (u, v) = e
-            if u < v:
-                if _IsReversed(e, td, points):
-                    ans.append(e)
+            c = orig[prv[h]]
+            d = orig[prv[t]]
+            if c == a or c == b or d == a or d == b:
+                continue  # degenerate triangle
+            ans.append((a, b, c, d, h))
     return ans
 
 
-def _IsReversed(e, td, points):
-    """If e=(a,b) is a non-border edge, with left-face triangle tl and
-    right-face triangle tr, then it is 'reversed' if the circle through
-    a, b, and (say) the other vertex of tl containts the other vertex of tr.
-    td is a _TriDict, for finding triangles containing edges, and points
-    gives the coordinates for vertex indices used in edges."""
+def _InCircleBatch(quads, points):
+    """Return [InCircle(a, b, c, d, points) for (a, b, c, d) in quads].
 
-    tl = td.get(e)
-    if not tl:
-        return False
-    (a, b) = e
-    tr = td.get((b, a))
-    if not tr:
-        return False
-    c = _OtherVert(tl, a, b)
-    d = _OtherVert(tr, a, b)
-    if c is None or d is None:
-        return False
-    return InCircle(a, b, c, d, points)
+    With numpy, the determinants are all evaluated at once, with
+    the same error bound as InCircle2d; only those too close to
+    call are evaluated again (exactly) one at a time.
+    """
 
+    if numpy is None or len(quads) <= NTHRESH:
+        return [InCircle(a, b, c, d, points) for (a, b, c, d) in quads]
+    (xs, ys) = _GatherCoords(quads, points)
+    (adx, ady) = (xs[:, 0] - xs[:, 3], ys[:, 0] - ys[:, 3])
+    (bdx, bdy) = (xs[:, 1] - xs[:, 3], ys[:, 1] - ys[:, 3])
+    (cdx, cdy) = (xs[:, 2] - xs[:, 3], ys[:, 2] - ys[:, 3])
+    (bdxcdy, cdxbdy) = (bdx * cdy, cdx * bdy)
+    (cdxady, adxcdy) = (cdx * ady, adx * cdy)
+    (adxbdy, bdxady) = (adx * bdy, bdx * ady)
+    alift = adx * adx + ady * ady
+    blift = bdx * bdx + bdy * bdy
+    clift = cdx * cdx + cdy * cdy
+    det = alift * (bdxcdy - cdxbdy) + blift * (cdxady - adxcdy) + \
+        clift * (adxbdy - bdxady)
+    permanent = alift * (numpy.abs(bdxcdy) + numpy.abs(cdxbdy)) + \
+        blift * (numpy.abs(cdxady) + numpy.abs(adxcdy)) + \
+        clift * (numpy.abs(adxbdy) + numpy.abs(bdxady))
+    ans = (det > 0.0).tolist()
+    for i in numpy.flatnonzero(numpy.abs(det) <= _ICCERRBOUND * permanent):
+        (qa, qb, qc, qd) = quads[i]
+        ans[i] = InCircle(qa, qb, qc, qd, points)
+    return ans
 
-def _OtherVert(tri, a, b):
-    """tri should be a tuple of 3 vertex indices, two of which are a and b.
-    Return the third index, or None if all vertices are a or b"""
 
-    for v in tri:
-        if v != a and v != b:
-            return v
-    return None
+def _GatherCoords(quads, points):
+    """Return n x 4 numpy arrays (xs, ys) of the x and y coordinates
+    of the vertices of the n quads (each a 4-tuple of indices)."""
+
+    n = len(quads)
+    (verts, inv) = numpy.unique(numpy.fromiter(
+        itertools.chain.from_iterable(quads), dtype=numpy.intp,
+        count=4 * n), return_inverse=True)
+    pos = points.pos
+    verts = verts.tolist()
+    xs = numpy.fromiter([pos[v][0] for v in verts], dtype=float,
+        count=len(verts))
+    ys = numpy.fromiter([pos[v][1] for v in verts], dtype=float,
+        count=len(verts))
+    inv = inv.reshape((n, 4))
+    return (xs[inv], ys[inv])
+
+
+def _IsReversed(mesh, h, points):
+    """If h is a half-edge from a to b with a twin, with left-face
+    triangle tl and right-face triangle tr in mesh, then it is 'reversed'
+    if the circle through a, b, and (say) the other vertex of tl contains
+    the other vertex of tr.  Points gives the coordinates for vertex
+    indices in mesh."""
+
+    t = mesh.twin[h]
+    if t == -1:
+        return False
+    orig = mesh.orig
+    (a, b) = (orig[h], orig[t])
+    c = orig[mesh.prev[h]]
+    d = orig[mesh.prev[t]]
+    if c == a or c == b or d == a or d == b:
+        return False
+    return InCircle(a, b, c, d, points)
 
 
 def _ClassifyAngles(face, n, points):
@@ -573,50 +1924,37 @@ def _AngleKind(a, b, c, points):
             return Ang0   # to fix: return Ang360 if "inside" spur
 
 
-def _Quandrangulate(tris, bord, points):
-    """Tris is list of triangles, forming a triangulation of region whose
-    border edges are in set bord.
+def _Quandrangulate(mesh, points, work=None):
+    """Mesh is a halfedge.HalfEdgeMesh of triangles, forming a
+    triangulation of a region whose border half-edges are fixed.
     Combine adjacent triangles to make quads, trying for "good" quads where
-    possible. Some triangles will probably remain uncombined"""
+    possible. Some triangles will probably remain uncombined.
+    Return the list of quads and triangles (the mesh is changed too)."""
 
-    (er, td) = _ERGraph(tris, bord, points)
+    er = _ERGraph(mesh, points)
     if len(er) == 0:
-        return tris
-    if len(er) > GTHRESH:
-        match = _GreedyMatch(er)
-    else:
-        match = _MaxMatch(er)
-    return _RemoveEdges(tris, match)
+        return mesh.Faces()
+    match = _MaxMatch(er, work)
+    return _RemoveEdges(mesh, match)
 
 
-def _RemoveEdges(tris, match):
-    """tris is list of triangles.
-    er is as returned from _MaxMatch or _GreedyMatch.
+def _RemoveEdges(mesh, match):
+    """mesh is a halfedge.HalfEdgeMesh of triangles.
+    match is as returned from _MaxMatch.
 
-    Return list of (A,D,B,C) resulting from deleting edge (A,B) causing a merge
-    of two triangles; append to that list the remaining unmatched triangles."""
+    Delete each matched edge (A,B), merging its two triangles into
+    (A,D,B,C), and return the list of the merged quads and the
+    remaining unmatched triangles."""
 
-    ans = []
-    triset = set(tris)
-    while len(match) > 0:
-        (_, e, tl, tr) = match.pop()
-        (a, b) = e
-        if tl in triset:
-            triset.remove(tl)
-        if tr in triset:
-            triset.remove(tr)
-        c = _OtherVert(tl, a, b)
-        d = _OtherVert(tr, a, b)
-        if c is None or d is None:
-            continue
-        ans.append((a, d, b, c))
-    return ans + list(triset)
+    for (_, h, _, _) in match:
+        mesh.Join(h)
+    return mesh.Faces()
 
 
-def _ERGraph(tris, bord, points):
+def _ERGraph(mesh, points):
     """Make an 'Edge Removal Graph'.
 
-    Given a list of triangles, the 'Edge Removal Graph' is a graph whose
+    Given a mesh of triangles, the 'Edge Removal Graph' is a graph whose
     nodes are the triangles (think of a point in the center of them),
     and whose edges go between adjacent triangles (they share a non-border
     edge), such that it would be possible to remove the shared edge
@@ -628,320 +1966,645 @@ def _ERGraph(tris, bord, points):
     are more desirable to remove.  Then we want a maximum weight matching
     in this graph.
 
-    We'll return the graph in a kind of implicit form, using edges of
-    the original triangles as a proxy for the edges between the faces
+    We'll return the graph in a kind of implicit form, using half-edges
+    of the mesh as a proxy for the edges between the faces
     (i.e., the edge of the triangle is the shared edge). We'll arbitrarily
-    pick the triangle graph edge with lower-index start vertex.
+    pick the half-edge with lower-index start vertex.
     Also, to aid in traversing the implicit graph, we'll keep the left
-    and right triangle triples with edge 'ER edge'.
-    Finally, since we calculate it anyway, we'll return a dictionary
-    mapping edges of the triangles to the triangle triples they're in.
+    and right faces of the half-edge with each 'ER edge'.
 
     Args:
-      tris: list of (int, int, int) giving a triple of vertex indices for
-          triangles, assumed CCW oriented
-      bord: set of (int, int) giving vertex indices for border edges
+      mesh: halfedge.HalfEdgeMesh - CCW oriented triangles, with the
+          border edges fixed
       points: geom.Points - for mapping vertex indices to coords
     Returns:
-      (list of (weight,e,tl,tr), dict)
-        where edge e=(a,b) is non-border edge
-        with left face tl and right face tr (each a triple (i,j,k)),
+      list of (weight,h,tl,tr)
+        where half-edge h is a non-border edge
+        with left face tl and right face tr (face numbers in mesh),
         where removing the edge would form an "OK" quad (no concave angles),
         with weight representing the desirability of removing the edge
-        The dict maps int pairs (a,b) to int triples (i,j,k), that is,
-        mapping edges to their containing triangles.
     """
 
-    td = _TriDict(tris)
-    dd = _DegreeDict(tris)
+    dd = mesh.Degrees()
+    (face, twin) = (mesh.face, mesh.twin)
     ans = []
-    ctris = tris[:]  # copy, so argument not affected
-    while len(ctris) > 0:
-        (i, j, k) = tl = ctris.pop()
-        for e in [(i, j), (j, k), (k, i)]:
-            if e in bord:
-                continue
-            (a, b) = e
-            # just consider one of (a,b) and (b,a), to avoid dups
-            if a > b:
-                continue
-            erev = (b, a)
-            tr = td.get(erev)
-            if not tr:
-                continue
-            c = _OtherVert(tl, a, b)
-            d = _OtherVert(tr, a, b)
-            if c is None or d is None:
-                continue
-            # calculate amax, the max of the new angles that would
-            # be formed at a and b if tl and tr were combined
-            amax = max(Angle(c, a, b, points) + Angle(d, a, b, points),
-                       Angle(c, b, a, points) + Angle(d, b, a, points))
-            if amax > 180.0:
-                continue
-            weight = ANGFAC * (180.0 - amax) + DEGFAC * (dd[a] + dd[b])
-            ans.append((weight, e, tl, tr))
-    return (ans, td)
-
-
-def _GreedyMatch(er):
-    """er is list of (weight,e,tl,tr).
+    edges = _InteriorEdges(mesh, range(len(mesh.fedge) - 1, -1, -1))
+    amaxes = _QuadAngleBatch([q[0:4] for q in edges], points)
+    for ((a, b, c, d, h), amax) in zip(edges, amaxes):
+        # the quad (a, d, b, c) is convex if it turns left at a and b;
+        # decided exactly, as amax may be a little off at 180 degrees
+        if not (Ccw(c, a, d, points) and Ccw(d, b, c, points)):
+            continue
+        weight = ANGFAC * (180.0 - amax) + DEGFAC * (dd[a] + dd[b])
+        ans.append((weight, h, face[h], face[twin[h]]))
+    return ans
 
-    Find maximal set so that each triangle appears in at most
-    one member of set"""
 
-    # sort in order of decreasing weight
-    er.sort(key=lambda v: v[0], reverse=True)
-    match = set()
-    ans = []
-    while len(er) > 0:
-        (_, _, tl, tr) = q = er.pop()
-        if tl not in match and tr not in match:
-            match.add(tl)
-            match.add(tr)
-            ans.append(q)
-    return ans
+def _QuadAngleBatch(quads, points):
+    """For each (a, b, c, d) in quads, where triangles (a, b, c) and
+    (b, a, d) share edge (a, b), return amax, the max of the new
+    angles (in degrees) that would be formed at a and b if the
+    triangles were combined.  This is only for weighting: the
+    rounding differs a little from Angle's, so whether the quad is
+    convex is left to Ccw (see _ERGraph).
 
+    With numpy, all the angles are computed at once, in the same way
+    as Angle does.
+    """
 
-def _MaxMatch(er):
-    """Like _GreedyMatch, but use divide and conquer to find best possible set.
+    if numpy is None or len(quads) <= NTHRESH:
+        return [max(Angle(c, a, b, points) + Angle(d, a, b, points),
+            Angle(c, b, a, points) + Angle(d, b, a, points))
+            for (a, b, c, d) in quads]
+    xy = numpy.dstack(_GatherCoords(quads, points))
+    (a, b, c, d) = (xy[:, 0], xy[:, 1], xy[:, 2], xy[:, 3])
+    (ab, ac, ad) = (b - a, c - a, d - a)
+    (ba, bc, bd) = (-ab, c - b, d - b)
+    amax = numpy.maximum(_AngleArray(ab, ac) + _AngleArray(ab, ad),
+        _AngleArray(ba, bc) + _AngleArray(ba, bd))
+    return amax.tolist()
+
+
+def _AngleArray(u, v):
+    """Return the angles in degrees between the rows of n x 2 arrays
+    u and v, or 0 where either is zero (see Angle)."""
+
+    n1 = numpy.sqrt(u[:, 0] * u[:, 0] + u[:, 1] * u[:, 1])
+    n2 = numpy.sqrt(v[:, 0] * v[:, 0] + v[:, 1] * v[:, 1])
+    zero = (n1 == 0.0) | (n2 == 0.0)
+    nn = numpy.where(zero, 1.0, n1 * n2)
+    dot = u[:, 0] * v[:, 0] + u[:, 1] * v[:, 1]
+    costheta = numpy.clip(dot / nn, -1.0, 1.0)
+    return numpy.where(zero, 0.0, numpy.arccos(costheta) * 180.0 / math.pi)
+
+
+def _MaxMatch(er, work=None):
+    """Find a maximum weight set of edges from er so that each
+    triangle appears in at most one member of the set.
+
+    Each connected component of the edge removal graph is matched
+    separately: if it has no cycles (as when the face has no holes)
+    a maximum weight matching is found by dynamic programming over
+    the tree (see _TreeMatch), in linear time; otherwise Edmonds'
+    blossom algorithm is used (see _BlossomMatch), in O(n^3) time.
+    Components with more than BTHRESH triangles and cycles are too
+    slow for that, so they are matched by _TreeMatch over a maximum
+    weight spanning forest instead: not always the best possible
+    set, but close.  So are all components with cycles, once work's
+    budget has run out.
 
     Args:
       er: list of (weight,e,tl,tr)  - see _ERGraph
+      work: _Work - counters and budget, if given
     Returns:
       list that is a subset of er giving a maximum weight match
     """
 
-    (ans, _) = _DCMatch(er)
+    # number the triangles, keeping the best edge between any two
+    tnum = dict()
+    best = dict()
+    for q in er:
+        (w, _, tl, tr) = q
+        for t in (tl, tr):
+            if t not in tnum:
+                tnum[t] = len(tnum)
+        (i, j) = (tnum[tl], tnum[tr])
+        if i == j:
+            continue
+        key = (min(i, j), max(i, j))
+        if key not in best or w > best[key][0]:
+            best[key] = q
+    adj = [[] for _ in range(len(tnum))]
+    for ((i, j), q) in best.items():
+        adj[i].append((j, q))
+        adj[j].append((i, q))
+    ans = []
+    comp = [-1] * len(adj)
+    for root in range(len(adj)):
+        if comp[root] != -1:
+            continue
+        comp[root] = root
+        verts = [root]
+        nedges = 0
+        k = 0
+        while k < len(verts):
+            for (j, _) in adj[verts[k]]:
+                nedges += 1
+                if comp[j] == -1:
+                    comp[j] = root
+                    verts.append(j)
+            k += 1
+        if nedges // 2 == len(verts) - 1:
+            ans.extend(_TreeMatch(root, adj))
+            if work:
+                work.stats.tree_matches += 1
+            continue
+        if len(verts) <= BTHRESH:
+            match = _CompBlossomMatch(verts, adj, work)
+            if match is not None:
+                ans.extend(match)
+                if work:
+                    work.stats.blossom_matches += 1
+                continue
+        ans.extend(_ForestMatch(verts, adj))
+        if work:
+            work.stats.forest_matches += 1
     return ans
 
 
-def _DCMatch(er):
-    """Recursive helper for _MaxMatch.
-
-    Divide and Conquer approach to finding max weight matching.
-    If we're lucky, there's an edge in er that separates the edge removal
-    graph into (at least) two separate components.  Then the max weight
-    is either one that includes that edge or excludes it - and we can
-    use a recursive call to _DCMatch to handle each component separately
-    on what remains of the graph after including/excluding the separating edge.
-    If we're not lucky, we fall back on _EMatch (see below).
+def _ForestMatch(verts, adj):
+    """Return a matching of the component with vertices verts made
+    by _TreeMatch on the trees of a maximum weight spanning forest
+    (found by Kruskal's algorithm).
 
     Args:
-      er: list of (weight, e, tl, tr) (see _ERGraph)
+      verts: list of int - the vertices of the component
+      adj: list of list of (int, (weight,e,tl,tr)) - see _TreeMatch
     Returns:
-      (list of (weight, e, tl, tr), float) - the subset forming a maximum
-          matching, and the total weight of the match.
+      list of (weight,e,tl,tr) - the matched edges
     """
 
-    if not er:
-        return ([], 0.0)
-    if len(er) == 1:
-        return (er, er[0][0])
-    match = []
-    matchw = 0.0
-    for i in range(0, len(er)):
-        (nc, comp) = _FindComponents(er, i)
-        if nc == 1:
-            # er[i] doesn't separate er
-            continue
-        (wi, _, tl, tr) = er[i]
-        if comp[tl] != comp[tr]:
-            # case 1: er separates graph
-            # compare the matches that include er[i] versus
-            # those that exclude it
-            (a, b) = _PartitionComps(er, comp, i, comp[tl], comp[tr])
-            ax = _CopyExcluding(a, tl, tr)
-            bx = _CopyExcluding(b, tl, tr)
-            (axmatch, wax) = _DCMatch(ax)
-            (bxmatch, wbx) = _DCMatch(bx)
-            if len(ax) == len(a):
-                wa = wax
-                amatch = axmatch
-            else:
-                (amatch, wa) = _DCMatch(a)
-            if len(bx) == len(b):
-                wb = wbx
-                bmatch = bxmatch
-            else:
-                (bmatch, wb) = _DCMatch(b)
-            w = wa + wb
-            wx = wax + wbx + wi
-            if w > wx:
-                match = amatch + bmatch
-                matchw = w
-            else:
-                match = [er[i]] + axmatch + bxmatch
-                matchw = wx
-        else:
-            # case 2: er not needed to separate graph
-            (a, b) = _PartitionComps(er, comp, -1, 0, 0)
-            (amatch, wa) = _DCMatch(a)
-            (bmatch, wb) = _DCMatch(b)
-            match = amatch + bmatch
-            matchw = wa + wb
-        if match:
-            break
-    if not match:
-        return _EMatch(er)
-    return (match, matchw)
-
+    edges = sorted([(q[0], v, j, q) for v in verts for (j, q) in adj[v]
+        if v < j], key=lambda x: x[0], reverse=True)
+    root = dict([(v, v) for v in verts])
+
+    def Find(v):
+        while root[v] != v:
+            root[v] = root[root[v]]
+            v = root[v]
+        return v
+
+    fadj = dict([(v, []) for v in verts])
+    for (_, v, j, q) in edges:
+        (rv, rj) = (Find(v), Find(j))
+        if rv != rj:
+            root[rv] = rj
+            fadj[v].append((j, q))
+            fadj[j].append((v, q))
+    ans = []
+    done = set()
+    for v in verts:
+        if Find(v) not in done:
+            done.add(Find(v))
+            ans.extend(_TreeMatch(v, fadj))
+    return ans
 
-def _EMatch(er):
-    """Exhaustive match helper for _MaxMatch.
 
-    This is the case when we were unable to find a single edge
-    separating the edge removal graph into two components.
-    So pick a single edge and try _DCMatch on the two cases of
-    including or excluding that edge.  We may be lucky in these
-    subcases (say, if the graph is currently a simple cycle, so
-    only needs one more edge after the one we pick here to separate
-    it into components).  Otherwise, we'll end up back in _EMatch
-    again, and the worse case will be exponential.
+def _TreeMatch(root, adj):
+    """Return a maximum weight matching of the tree containing root.
 
-    Pick a random edge rather than say, the first, to hopefully
-    avoid some pathological cases.
+    For each vertex v, with the tree hanging from root, computes
+    the best weight of a matching of the subtree under v: free[v]
+    when v isn't matched to a child, and best[v] overall.
 
     Args:
-      er: list of (weight, el, tl, tr) (see _ERGraph)
+      root: int - a vertex of the tree
+      adj: list of list of (int, (weight,e,tl,tr)) - for each vertex,
+          its neighbors and the edge removal graph edges to them
     Returns:
-       (list of (weight, e, tl, tr), float) - the subset forming a maximum
-          matching, and the total weight of the match.
+      list of (weight,e,tl,tr) - the matched edges
     """
 
-    if not er:
-        return ([], 0.0)
-    if len(er) == 1:
-        return (er, er[1][1])
-    i = random.randint(0, len(er) - 1)
-    eri = (wi, _, tl, tr) = er[i]
-    # case a: include eri.  exlude other edges that touch tl or tr
-    a = _CopyExcluding(er, tl, tr)
-    a.append(eri)
-    (amatch, wa) = _DCMatch(a)
-    wa += wi
-    if len(a) == len(er) - 1:
-        # if a excludes only eri, then er didn't touch anything else
-        # in the graph, and the best match will always include er
-        # and we can skip the call for case b
-        wb = -1.0
-        bmatch = []
-    else:
-        b = er[:i] + er[i + 1:]
-        (bmatch, wb) = _DCMatch(b)
-    if wa > wb:
-        match = amatch
-        match.append(eri)
-        matchw = wa
-    else:
-        match = bmatch
-        matchw = wb
-    return (match, matchw)
+    order = [root]
+    parent = {root: -1}
+    for v in order:
+        for (j, _) in adj[v]:
+            if j not in parent:
+                parent[j] = v
+                order.append(j)
+    free = dict()
+    best = dict()
+    choice = dict()
+    for v in reversed(order):
+        f = 0.0
+        for (c, _) in adj[v]:
+            if c != parent[v]:
+                f += best[c]
+        free[v] = f
+        best[v] = f
+        choice[v] = None
+        for (c, q) in adj[v]:
+            if c != parent[v]:
+                w = f - best[c] + free[c] + q[0]
+                if w > best[v]:
+                    (best[v], choice[v]) = (w, (c, q))
+    ans = []
+    stack = [(root, False)]
+    while stack:
+        (v, taken) = stack.pop()
+        matched = None
+        if not taken and choice[v] is not None:
+            (matched, q) = choice[v]
+            ans.append(q)
+        for (c, _) in adj[v]:
+            if c != parent[v]:
+                stack.append((c, c == matched))
+    return ans
 
 
-def _FindComponents(er, excepti):
-    """Find connected components induced by edges, excluding one edge.
+def _CompBlossomMatch(verts, adj, work=None):
+    """Return a maximum weight matching of the component with
+    vertices verts, using _BlossomMatch.
 
     Args:
-      er: list of (weight, el, tl, tr) (see _ERGraph)
-      excepti: index in er of edge to be excluded
+      verts: list of int - the vertices of the component
+      adj: list of list of (int, (weight,e,tl,tr)) - see _TreeMatch
+      work: _Work - counters and budget, if given
     Returns:
-      (int, dict): int is number of connected components found,
-          dict maps triangle triple ->
-              connected component index (starting at 1)
-     """
-
-    ncomps = 0
-    comp = dict()
-    for i in range(0, len(er)):
-        (_, _, tl, tr) = er[i]
-        for t in [tl, tr]:
-            if t not in comp:
-                ncomps += 1
-                _FCVisit(er, excepti, comp, t, ncomps)
-    return (ncomps, comp)
-
-
-def _FCVisit(er, excepti, comp, t, compnum):
-    """Helper for _FindComponents depth-first-search."""
-
-    comp[t] = compnum
-    for i in range(0, len(er)):
-        if i == excepti:
-            continue
-        (_, _, tl, tr) = er[i]
-        if tl == t or tr == t:
-            s = tl
-            if s == t:
-                s = tr
-            if s not in comp:
-                _FCVisit(er, excepti, comp, s, compnum)
+      list of (weight,e,tl,tr) - the matched edges, or None
+          if work's budget ran out
+    """
 
+    if work and work.Over("matched quads on spanning forests"):
+        return None
 
-def _PartitionComps(er, comp, excepti, compa, compb):
-    """Partition the edges of er by component number, into two lists.
+    local = dict([(v, i) for (i, v) in enumerate(verts)])
+    edges = []
+    eq = []
+    for v in verts:
+        for (j, q) in adj[v]:
+            if v < j:
+                # integral weights keep the algorithm's arithmetic exact
+                edges.append((local[v], local[j],
+                    int(round(q[0] * _MATCHSCALE))))
+                eq.append(q)
+    mate = _BlossomMatch(edges, work)
+    if mate is None:
+        return None
+    return [eq[k] for (k, (i, j, _)) in enumerate(edges) if mate[i] == j]
 
-    Generally, put odd components into first list and even into second,
-    except that component compa goes in the first and compb goes in the second,
-    and we ignore edge er[excepti].
 
-    Args:
-      er: list of (weight, el, tl, tr) (see _ERGraph)
-      comp: dict - mapping triangle triple -> connected component index
-      excepti: int - index in er to ignore (unless excepti==-1)
-      compa: int - component to go in first list of answer (unless 0)
-      compb: int - component to go in second list of answer (unless 0)
-    Returns:
-      (list, list) - a partition of er according to above rules
-    """
-
-    parta = []
-    partb = []
-    for i in range(0, len(er)):
+_MATCHSCALE = 1000.0  # weights are rounded to multiples of 1/this
 
-        if i == excepti:
-            continue
-        tl = er[i][2]
-        c = comp[tl]
-        if c == compa or (c != compb and (c & 1) == 1):
-            parta.append(er[i])
-        else:
-            partb.append(er[i])
-    return (parta, partb)
 
+def _BlossomMatch(edges, work=None):
+    """Find a maximum weight matching in a general graph.
 
-def _CopyExcluding(er, s, t):
-    """Return a copy of er, excluding all those involving triangles s and t.
+    This is Edmonds' blossom algorithm, with Galil's primal-dual
+    method to make it O(n^3), following the well known implementation
+    by Joris van Rantwijk.  Vertices are labeled S (1) or T (2) as
+    alternating trees are grown from the free vertices; odd cycles of
+    S vertices are shrunk into blossoms, and the dual variables are
+    adjusted until an augmenting path of tight edges is found.
 
     Args:
-      er: list of (weight, e, tl, tr) - see _ERGraph
-      s: 3-tuple of int - a triangle
-      t: 3-tuple of int - a triangle
+      edges: list of (int, int, int) - (i, j, w) for an edge between
+          vertices i and j (numbered from 0) with integer weight w
+      work: _Work - counters and budget, if given
     Returns:
-      Copy of er excluding those with tl or tr == s or t
+      list of int - for each vertex, the vertex it is matched to,
+          or -1 if it isn't matched; or None if work's budget ran out
     """
 
-    ans = []
-    for e in er:
-        (_, _, tl, tr) = e
-        if tl == s or tr == s or tl == t or tr == t:
-            continue
-        ans.append(e)
-    return ans
-
-
-def _DegreeDict(tris):
-    """Return a dictionary mapping vertices in tris to the number of triangles
-    that they are touch."""
+    if not edges:
+        return []
+    nedge = len(edges)
+    nvertex = 1 + max([max(i, j) for (i, j, _) in edges])
+    maxweight = max(0, max([w for (_, _, w) in edges]))
+    # edge k has endpoints 2k (its first vertex) and 2k+1 (its second)
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * nedge)]
+    # for each vertex, the remote endpoints of its edges
+    neighbend = [[] for _ in range(nvertex)]
+    for (k, (i, j, _)) in enumerate(edges):
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+    # mate[v] is the remote endpoint of v's matched edge, or -1
+    mate = [-1] * nvertex
+    # label and labelend are per vertex and per top-level blossom;
+    # blossoms are numbered nvertex to 2*nvertex-1
+    label = [0] * (2 * nvertex)
+    labelend = [-1] * (2 * nvertex)
+    inblossom = list(range(nvertex))
+    blossomparent = [-1] * (2 * nvertex)
+    blossomchilds = [None] * (2 * nvertex)
+    blossombase = list(range(nvertex)) + [-1] * nvertex
+    blossomendps = [None] * (2 * nvertex)
+    bestedge = [-1] * (2 * nvertex)
+    blossombestedges = [None] * (2 * nvertex)
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+    dualvar = [maxweight] * nvertex + [0] * nvertex
+    allowedge = [False] * nedge
+    queue = []
+
+    def Slack(k):
+        (i, j, w) = edges[k]
+        return dualvar[i] + dualvar[j] - 2 * w
+
+    def Leaves(b):
+        if b < nvertex:
+            return [b]
+        ans = []
+        stack = [b]
+        while stack:
+            t = stack.pop()
+            if t < nvertex:
+                ans.append(t)
+            else:
+                stack.extend(blossomchilds[t])
+        return ans
 
-    ans = dict()
-    for t in tris:
-        for v in t:
-            if v in ans:
-                ans[v] = ans[v] + 1
+    def AssignLabel(w, t, p):
+        while True:
+            b = inblossom[w]
+            label[w] = label[b] = t
+            labelend[w] = labelend[b] = p
+            bestedge[w] = bestedge[b] = -1
+            if t == 1:
+                queue.extend(Leaves(b))
+                return
+            # t == 2: label the mate of the base S
+            base = blossombase[b]
+            (w, t, p) = (endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def ScanBlossom(v, w):
+        # trace back from v and w to find a new blossom's base,
+        # or -1 if there is an augmenting path instead
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
             else:
-                ans[v] = 1
-    return ans
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                (v, w) = (w, v)
+        for b in path:
+            label[b] = 1
+        return base
+
+    def AddBlossom(base, k):
+        (v, w, _) = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in Leaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+        # find the least-slack edges to other S blossoms
+        bestedgeto = dict()
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblist = [p // 2 for v in Leaves(bv) for p in neighbend[v]]
+            else:
+                nblist = blossombestedges[bv]
+            for k in nblist:
+                (i, j, _) = edges[k]
+                if inblossom[j] == b:
+                    (i, j) = (j, i)
+                bj = inblossom[j]
+                if bj != b and label[bj] == 1 and \
+                        (bj not in bestedgeto or
+                         Slack(k) < Slack(bestedgeto[bj])):
+                    bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = list(bestedgeto.values())
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or Slack(k) < Slack(bestedge[b]):
+                bestedge[b] = k
+
+    def ExpandBlossom(b, endstage):
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                ExpandBlossom(s, endstage)
+            else:
+                for v in Leaves(s):
+                    inblossom[v] = s
+        if not endstage and label[b] == 2:
+            # relabel the children on the path through the blossom
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^
+                    endptrick ^ 1]] = 0
+                AssignLabel(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in Leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    AssignLabel(v, 2, labelend[v])
+                j += jstep
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def AugmentBlossom(b, v):
+        # swap matched and unmatched edges on the path through b to v
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            AugmentBlossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                AugmentBlossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                AugmentBlossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def AugmentMatching(k):
+        (v, w, _) = edges[k]
+        for (s, p) in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    AugmentBlossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    AugmentBlossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    for _ in range(nvertex):
+        # one stage: find an augmenting path, or stop
+        if work:
+            if work.Over("matched quads on spanning forests"):
+                return None
+            work.stats.blossom_stages += 1
+        label[:] = [0] * (2 * nvertex)
+        bestedge[:] = [-1] * (2 * nvertex)
+        blossombestedges[nvertex:] = [None] * nvertex
+        allowedge[:] = [False] * nedge
+        queue[:] = []
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                AssignLabel(v, 1, -1)
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = Slack(k)
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            AssignLabel(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = ScanBlossom(v, w)
+                            if base >= 0:
+                                AddBlossom(base, k)
+                            else:
+                                AugmentMatching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < Slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < Slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+            # no tight edge to use, so change the dual variables
+            deltatype = 1
+            delta = min(dualvar[:nvertex])
+            deltaedge = deltablossom = -1
+            for v in range(nvertex):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = Slack(bestedge[v])
+                    if d < delta:
+                        (delta, deltatype, deltaedge) = (d, 2, bestedge[v])
+            for b in range(2 * nvertex):
+                if blossomparent[b] == -1 and label[b] == 1 and \
+                        bestedge[b] != -1:
+                    d = Slack(bestedge[b]) // 2
+                    if d < delta:
+                        (delta, deltatype, deltaedge) = (d, 3, bestedge[b])
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1 and \
+                        label[b] == 2 and dualvar[b] < delta:
+                    (delta, deltatype, deltablossom) = (dualvar[b], 4, b)
+            for v in range(nvertex):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+            if deltatype == 1:
+                break  # optimum reached
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                (i, j, _) = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i = j
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                queue.append(edges[deltaedge][0])
+            else:
+                ExpandBlossom(deltablossom, False)
+        if not augmented:
+            break
+        for b in range(nvertex, 2 * nvertex):
+            if blossomparent[b] == -1 and blossombase[b] >= 0 and \
+                    label[b] == 1 and dualvar[b] == 0:
+                ExpandBlossom(b, True)
+    return [endpoint[p] if p >= 0 else -1 for p in mate]
 
 
 def PolygonPlane(face, points):
@@ -1099,74 +2762,174 @@ def Angle(a, b, c, points):
 def SegsIntersect(ixa, ixb, ixc, ixd, points):
     """Return true if segment AB intersects CD,
     false if they just touch.  ixa, ixb, ixc, ixd are indices
-    into points."""
+    into points.  If the segments are collinear, return true
+    only if A and B are both strictly inside CD.
+    The answer is exact (see Orient2d)."""
 
     a = points.pos[ixa]
     b = points.pos[ixb]
     c = points.pos[ixc]
     d = points.pos[ixd]
-    u = Sub2(b, a)
-    v = Sub2(d, c)
-    w = Sub2(a, c)
-    pp = Perp2(u, v)
-    if abs(pp) > TOL:
-        si = Perp2(v, w) / pp
-        ti = Perp2(u, w) / pp
-        return 0.0 < si < 1.0 and 0.0 < ti < 1.0
-    else:
-        # parallel or overlapping
-        if Dot2(u, u) == 0.0 or Dot2(v, v) == 0.0:
+    oca = Orient2d(c, d, a)
+    ocb = Orient2d(c, d, b)
+    if oca != 0.0 or ocb != 0.0:
+        if oca == 0.0 or ocb == 0.0 or (oca > 0.0) == (ocb > 0.0):
             return False
-        else:
-            pp2 = Perp2(w, v)
-            if abs(pp2) > TOL:
-                return False  # parallel, not collinear
-            z = Sub2(b, c)
-            (vx, vy) = v
-            (wx, wy) = w
-            (zx, zy) = z
-            if vx == 0.0:
-                (t0, t1) = (wy / vy, zy / vy)
-            else:
-                (t0, t1) = (wx / vx, zx / vx)
-            return 0.0 < t0 < 1.0 and 0.0 < t1 < 1.0
+        oac = Orient2d(a, b, c)
+        oad = Orient2d(a, b, d)
+        return (oac > 0.0 and oad < 0.0) or (oac < 0.0 and oad > 0.0)
+    # collinear, or one of the segments is a point
+    if (a[0] == b[0] and a[1] == b[1]) or (c[0] == d[0] and c[1] == d[1]):
+        return False
+    k = 0 if c[0] != d[0] else 1
+    (lo, hi) = (min(c[k], d[k]), max(c[k], d[k]))
+    return lo < a[k] < hi and lo < b[k] < hi
 
 
 def Ccw(a, b, c, points):
     """Return true if ABC is a counterclockwise-oriented triangle,
     where a, b, and c are indices into points.
-    Returns false if not, or if colinear within TOL."""
-
-    (ax, ay) = (points.pos[a][0], points.pos[a][1])
-    (bx, by) = (points.pos[b][0], points.pos[b][1])
-    (cx, cy) = (points.pos[c][0], points.pos[c][1])
-    d = ax * by - bx * ay - ax * cy + cx * ay + bx * cy - cx * by
-    return d > TOL
+    Returns false if not, or if exactly colinear."""
+
+    # Orient2d's filter, inlined since this is called so often
+    pos = points.pos
+    (pa, pb, pc) = (pos[a], pos[b], pos[c])
+    detleft = (pa[0] - pc[0]) * (pb[1] - pc[1])
+    detright = (pa[1] - pc[1]) * (pb[0] - pc[0])
+    if detleft > 0.0:
+        if detright <= 0.0:
+            return True
+        detsum = detleft + detright
+    elif detleft < 0.0:
+        if detright >= 0.0:
+            return False
+        detsum = -detleft - detright
+    else:
+        return detright < 0.0
+    det = detleft - detright
+    errbound = _CCWERRBOUND * detsum
+    if det > errbound:
+        return True
+    if det < -errbound:
+        return False
+    return _Orient2dExact(pa, pb, pc) > 0
 
 
 def InCircle(a, b, c, d, points):
     """Return true if circle through points with indices a, b, c
     contains point with index d (indices into points).
-    Except: if ABC forms a counterclockwise oriented triangle
+    Except: if ABC forms a clockwise oriented triangle
     then the test is reversed: return true if d is outside the circle.
-    Will get false, no matter what orientation, if d is cocircular, with TOL^2.
-      | xa ya xa^2+ya^2 1 |
-      | xb yb xb^2+yb^2 1 | > 0
-      | xc yc xc^2+yc^2 1 |
-      | xd yd xd^2+yd^2 1 |
+    Will get false, no matter what orientation, if d is exactly cocircular.
     """
 
-    (xa, ya, za) = _Icc(points.pos[a])
-    (xb, yb, zb) = _Icc(points.pos[b])
-    (xc, yc, zc) = _Icc(points.pos[c])
-    (xd, yd, zd) = _Icc(points.pos[d])
-    det = xa * (yb * zc - yc * zb - yb * zd + yd * zb + yc * zd - yd * zc) \
-          - xb * (ya * zc - yc * za - ya * zd + yd * za + yc * zd - yd * zc) \
-          + xc * (ya * zb - yb * za - ya * zd + yd * za + yb * zd - yd * zb) \
-          - xd * (ya * zb - yb * za - ya * zc + yc * za + yb * zc - yc * zb)
-    return det > TOL * TOL
+    return InCircle2d(points.pos[a], points.pos[b], points.pos[c],
+        points.pos[d]) > 0.0
 
 
-def _Icc(p):
-    (x, y) = (p[0], p[1])
-    return (x, y, x * x + y * y)
+# Adaptive-precision predicates, after Shewchuk, "Adaptive Precision
+# Floating-Point Arithmetic and Fast Robust Geometric Predicates".
+# The determinant is first evaluated in floating point; if its
+# magnitude exceeds a bound on the accumulated rounding error, its
+# sign is certainly right.  Otherwise it is evaluated again exactly,
+# with rationals (every float is one), which only happens for
+# (nearly) degenerate inputs.
+
+_EPS = 2.0 ** -53  # half an ulp of 1.0
+_CCWERRBOUND = (3.0 + 16.0 * _EPS) * _EPS
+_ICCERRBOUND = (10.0 + 96.0 * _EPS) * _EPS
+
+
+def Orient2d(a, b, c):
+    """Return twice the signed area of triangle abc.
+
+    Args:
+      a: (float, float, ...) - coordinates; only x and y are used
+      b: (float, float, ...)
+      c: (float, float, ...)
+    Returns:
+      float - positive if abc is counterclockwise, negative if
+        clockwise, zero if collinear.  The sign is always exact;
+        the magnitude is approximate.
+    """
+
+    detleft = (a[0] - c[0]) * (b[1] - c[1])
+    detright = (a[1] - c[1]) * (b[0] - c[0])
+    det = detleft - detright
+    if detleft > 0.0:
+        if detright <= 0.0:
+            return det
+        detsum = detleft + detright
+    elif detleft < 0.0:
+        if detright >= 0.0:
+            return det
+        detsum = -detleft - detright
+    else:
+        return det
+    if abs(det) > _CCWERRBOUND * detsum:
+        return det
+    return _ExactFloat(_Orient2dExact(a, b, c))
+
+
+def _Orient2dExact(a, b, c):
+    """Return Orient2d(a, b, c) as an exact Fraction."""
+
+    (ax, ay) = (Fraction(a[0]), Fraction(a[1]))
+    (bx, by) = (Fraction(b[0]), Fraction(b[1]))
+    (cx, cy) = (Fraction(c[0]), Fraction(c[1]))
+    return (ax - cx) * (by - cy) - (ay - cy) * (bx - cx)
+
+
+def InCircle2d(a, b, c, d):
+    """Return the incircle determinant of points a, b, c, d.
+
+    Args:
+      a: (float, float, ...) - coordinates; only x and y are used
+      b: (float, float, ...)
+      c: (float, float, ...)
+      d: (float, float, ...)
+    Returns:
+      float - positive if d is inside the circle through a, b, c
+        when abc is counterclockwise (the sign is reversed if abc is
+        clockwise), and zero if the points are cocircular.
+        The sign is always exact; the magnitude is approximate.
+    """
+
+    (adx, ady) = (a[0] - d[0], a[1] - d[1])
+    (bdx, bdy) = (b[0] - d[0], b[1] - d[1])
+    (cdx, cdy) = (c[0] - d[0], c[1] - d[1])
+    (bdxcdy, cdxbdy) = (bdx * cdy, cdx * bdy)
+    (cdxady, adxcdy) = (cdx * ady, adx * cdy)
+    (adxbdy, bdxady) = (adx * bdy, bdx * ady)
+    alift = adx * adx + ady * ady
+    blift = bdx * bdx + bdy * bdy
+    clift = cdx * cdx + cdy * cdy
+    det = alift * (bdxcdy - cdxbdy) + blift * (cdxady - adxcdy) + \
+        clift * (adxbdy - bdxady)
+    permanent = alift * (abs(bdxcdy) + abs(cdxbdy)) + \
+        blift * (abs(cdxady) + abs(adxcdy)) + \
+        clift * (abs(adxbdy) + abs(bdxady))
+    if abs(det) > _ICCERRBOUND * permanent:
+        return det
+    return _ExactFloat(_InCircle2dExact(a, b, c, d))
+
+
+def _InCircle2dExact(a, b, c, d):
+    """Return InCircle2d(a, b, c, d) as an exact Fraction."""
+
+    (dx, dy) = (Fraction(d[0]), Fraction(d[1]))
+    (adx, ady) = (Fraction(a[0]) - dx, Fraction(a[1]) - dy)
+    (bdx, bdy) = (Fraction(b[0]) - dx, Fraction(b[1]) - dy)
+    (cdx, cdy) = (Fraction(c[0]) - dx, Fraction(c[1]) - dy)
+    return (adx * adx + ady * ady) * (bdx * cdy - cdx * bdy) + \
+        (bdx * bdx + bdy * bdy) * (cdx * ady - adx * cdy) + \
+        (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady)
+
+
+def _ExactFloat(x):
+    """Return Fraction x as a float, keeping its sign if it underflows."""
+
+    f = float(x)
+    if f == 0.0 and x != 0:
+        return math.copysign(5e-324, x)
+    return f